@@ -12,7 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 from decouple import config
-import dj_database_url 
+
+from core.db import database_config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -85,12 +86,28 @@ WSGI_APPLICATION = 'bookswap_project.wsgi.application'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
 
+# SQLite is tuned on connect; PostgreSQL can pool connections (see core/db.py)
+DATABASE_OPTIONS = {
+    'conn_max_age': config('DB_CONN_MAX_AGE', default=600, cast=int),
+    'pool_max_size': config('DB_POOL_MAX_SIZE', default=0, cast=int),  # needs psycopg[pool]
+    'pool_timeout': config('DB_POOL_TIMEOUT', default=10.0, cast=float),
+    'sqlite_busy_timeout': config('SQLITE_BUSY_TIMEOUT', default=20.0, cast=float),
+    'sqlite_cache_mb': config('SQLITE_CACHE_MB', default=64, cast=int),
+}
 DATABASES = {
-    'default': dj_database_url.config(
-        default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
-        conn_max_age=600
-    )
+    'default': database_config(
+        config('DATABASE_URL', default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}"), **DATABASE_OPTIONS
+    ),
 }
+# Optional read replica for the catalog endpoints. Tests use the primary.
+REPLICA_DATABASE_URL = config('REPLICA_DATABASE_URL', default='')
+if REPLICA_DATABASE_URL:
+    DATABASES['replica'] = database_config(REPLICA_DATABASE_URL, **DATABASE_OPTIONS)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['core.db.ReplicaRouter']
+# Seconds a client reads from the primary after a write; also the longest
+# the catalog cache keeps a page rendered from the replica
+DATABASE_REPLICA_PIN_SECONDS = config('DATABASE_REPLICA_PIN_SECONDS', default=5, cast=int)
 
 # Paste your AUTH_USER_MODEL line here
 AUTH_USER_MODEL = 'core.User'
@@ -139,22 +156,148 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        # TokenAuthentication with a short-lived per-process cache
+        'core.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        # Token buckets for views with a throttle_scope in THROTTLE_RATES
+        'core.throttling.TokenBucketThrottle',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
 }
 
+# Caching
+# File-based by default so all workers on a host share one cache (catalog
+# version, cached feed pages) without running an external service.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / '.cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Seconds a rendered feed/detail response is kept (see core/cache.py)
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=300, cast=int)
+
+# Google Books lookups (see core/books.py)
+GOOGLE_BOOKS_API_KEY = config('GOOGLE_BOOKS_API_KEY', default=None)
+GOOGLE_BOOKS_API_URL = config('GOOGLE_BOOKS_API_URL', default='https://www.googleapis.com/books/v1/volumes')
+GOOGLE_BOOKS_TIMEOUT = (  # (connect, read) seconds
+    config('GOOGLE_BOOKS_CONNECT_TIMEOUT', default=3.05, cast=float),
+    config('GOOGLE_BOOKS_READ_TIMEOUT', default=5.0, cast=float),
+)
+ISBN_CACHE_TTL = config('ISBN_CACHE_TTL', default=30 * 24 * 3600, cast=int)
+ISBN_NEGATIVE_CACHE_TTL = config('ISBN_NEGATIVE_CACHE_TTL', default=3600, cast=int)
+ISBN_MEMORY_CACHE_TTL = config('ISBN_MEMORY_CACHE_TTL', default=3600, cast=int)
+BOOK_LOOKUP_BATCH_MAX = config('BOOK_LOOKUP_BATCH_MAX', default=20, cast=int)
+BOOK_LOOKUP_BATCH_WORKERS = config('BOOK_LOOKUP_BATCH_WORKERS', default=8, cast=int)
+BOOK_LOOKUP_BATCH_DEADLINE = config('BOOK_LOOKUP_BATCH_DEADLINE', default=8.0, cast=float)
+# Upstream calls in flight per process before lookups are refused with a 503
+BOOK_LOOKUP_MAX_IN_FLIGHT = config('BOOK_LOOKUP_MAX_IN_FLIGHT', default=16, cast=int)
+BOOK_LOOKUP_RETRY_AFTER = config('BOOK_LOOKUP_RETRY_AFTER', default=2, cast=int)
+
+# Per-client throttling (see core/throttling.py). "60/min" allows a burst of
+# 60, refilled at 60 a minute, per user or per IP. An empty rate turns a scope off.
+THROTTLE_RATES = {
+    'lookup': config('THROTTLE_LOOKUP_RATE', default='60/min'),
+    'lookup-batch': config('THROTTLE_LOOKUP_BATCH_RATE', default='10/min'),
+    'export': config('THROTTLE_EXPORT_RATE', default='6/hour'),  # each pull streams the whole table
+    'login': config('THROTTLE_LOGIN_RATE', default='20/min'),
+    'register': config('THROTTLE_REGISTER_RATE', default='10/hour'),
+    'dj_rest_auth': config('THROTTLE_DJ_REST_AUTH_RATE', default='30/min'),  # its login, registration, ...
+}
+
+# Local cover cache (see core/covers.py). COVER_WARMING is 'async' (background
+# threads), 'sync' (right after the commit, in the request), 'queue' (a job for
+# `manage.py run_workers`) or 'off'.
+COVER_CACHE_ROOT = config('COVER_CACHE_ROOT', default=str(BASE_DIR / 'media' / 'covers'))
+COVER_URL_PREFIX = config('COVER_URL_PREFIX', default='/api/covers/')
+# Public origin of this API; cached covers are stored as absolute URLs under it
+COVER_BASE_URL = config('COVER_BASE_URL', default='http://127.0.0.1:8000')
+COVER_WARMING = config('COVER_WARMING', default='async')
+# Hosts covers may be fetched from; '.example.com' allows its subdomains too
+COVER_ALLOWED_HOSTS = config(
+    'COVER_ALLOWED_HOSTS', default='covers.openlibrary.org,books.google.com,.googleusercontent.com',
+    cast=lambda value: [host.strip().lower() for host in value.split(',') if host.strip()],
+)
+# Only for local testing against a cover host on this machine
+COVER_ALLOW_PRIVATE_ADDRESSES = config('COVER_ALLOW_PRIVATE_ADDRESSES', default=False, cast=bool)
+COVER_WARM_WORKERS = config('COVER_WARM_WORKERS', default=4, cast=int)
+COVER_FETCH_TIMEOUT = (  # (connect, read) seconds
+    config('COVER_CONNECT_TIMEOUT', default=3.05, cast=float),
+    config('COVER_READ_TIMEOUT', default=10.0, cast=float),
+)
+COVER_MAX_BYTES = config('COVER_MAX_BYTES', default=5 * 1024 * 1024, cast=int)
+COVER_RETRY_AFTER = config('COVER_RETRY_AFTER', default=24 * 3600, cast=int)
+# Thumbnail widths in pixels; listings point at COVER_LISTING_SIZE
+COVER_THUMBNAIL_SIZES = {'S': 96, 'M': 240, 'L': 480}
+COVER_LISTING_SIZE = config('COVER_LISTING_SIZE', default='M')
+
+# Saved searches (see core/saved_searches.py): async, sync, queue or off
+SAVED_SEARCH_MATCHING = config('SAVED_SEARCH_MATCHING', default='async')
+SAVED_SEARCH_WORKERS = config('SAVED_SEARCH_WORKERS', default=2, cast=int)
+SAVED_SEARCHES_PER_USER = config('SAVED_SEARCHES_PER_USER', default=20, cast=int)
+
+# Background jobs (see core/jobs.py), run by `manage.py run_workers`
+JOB_WORKER_THREADS = config('JOB_WORKER_THREADS', default=4, cast=int)
+JOB_BATCH_SIZE = config('JOB_BATCH_SIZE', default=1, cast=int)  # jobs claimed at a time per thread
+JOB_POLL_INTERVAL = config('JOB_POLL_INTERVAL', default=1.0, cast=float)  # seconds between polls of an empty queue
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', default=5, cast=int)
+JOB_RETRY_DELAY = config('JOB_RETRY_DELAY', default=10.0, cast=float)  # seconds, doubling per failed attempt
+JOB_RETRY_MAX_DELAY = config('JOB_RETRY_MAX_DELAY', default=3600.0, cast=float)
+JOB_LOCK_TIMEOUT = config('JOB_LOCK_TIMEOUT', default=600, cast=int)  # running longer means the worker died
+JOB_KEEP_FINISHED_DAYS = config('JOB_KEEP_FINISHED_DAYS', default=7, cast=int)
+
+# Token -> user cache (see core/authentication.py)
+AUTH_TOKEN_CACHE_TTL = config('AUTH_TOKEN_CACHE_TTL', default=60, cast=int)
+AUTH_TOKEN_CACHE_SIZE = config('AUTH_TOKEN_CACHE_SIZE', default=10000, cast=int)
+
+# Listing feed pagination (see core/pagination.py)
+LISTINGS_PAGE_SIZE = config('LISTINGS_PAGE_SIZE', default=24, cast=int)
+LISTINGS_MAX_PAGE_SIZE = config('LISTINGS_MAX_PAGE_SIZE', default=100, cast=int)
+MESSAGES_PAGE_SIZE = config('MESSAGES_PAGE_SIZE', default=50, cast=int)
+# Serve listing list/detail GETs without ListingSerializer (see core/fastpath.py)
+LISTING_FAST_PATH = config('LISTING_FAST_PATH', default=True, cast=bool)
+
+# Deleted and sold listings move to ListingArchive after this many days (see core/archive.py)
+LISTING_ARCHIVE_AFTER_DAYS = config('LISTING_ARCHIVE_AFTER_DAYS', default=90, cast=int)
+LISTING_ARCHIVE_BATCH_SIZE = config('LISTING_ARCHIVE_BATCH_SIZE', default=500, cast=int)
+
+# "Related books" built offline by `manage.py build_related` (see core/related.py):
+# neighbours kept per listing, and the weakest match worth showing
+RELATED_LISTINGS_TOP_K = config('RELATED_LISTINGS_TOP_K', default=8, cast=int)
+RELATED_LISTINGS_MIN_SCORE = config('RELATED_LISTINGS_MIN_SCORE', default=0.2, cast=float)
+
+# Catalog export: rows fetched from the database per round trip (see core/export.py)
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Per-route request metrics at /metrics (see core/metrics.py). Requests slower
+# than SLOW_REQUEST_THRESHOLD seconds are logged with their SQL; 0 turns that off.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+SLOW_REQUEST_THRESHOLD = config('SLOW_REQUEST_THRESHOLD', default=0.0, cast=float)
+
+# Real-time message delivery (see core/broker.py)
+MESSAGE_BROKER_BACKEND = config('MESSAGE_BROKER_BACKEND', default='core.broker.InProcessBackend')
+MESSAGE_STREAM_QUEUE_SIZE = config('MESSAGE_STREAM_QUEUE_SIZE', default=100, cast=int)
+MESSAGE_STREAM_HEARTBEAT = config('MESSAGE_STREAM_HEARTBEAT', default=15.0, cast=float)
+MESSAGE_STREAM_MAX_AGE = config('MESSAGE_STREAM_MAX_AGE', default=300.0, cast=float)
+MESSAGE_STREAM_RETRY_MS = config('MESSAGE_STREAM_RETRY_MS', default=3000, cast=int)
+MESSAGE_POLL_TIMEOUT = config('MESSAGE_POLL_TIMEOUT', default=25.0, cast=float)
+
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',  # first, so it times everything below
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.middleware.AsyncWhiteNoiseMiddleware',  # WhiteNoise, async-capable
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.db.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
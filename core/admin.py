@@ -1,10 +1,128 @@
-from django.contrib import admin
-
-# Register your models here.
 # core/admin.py
-from django.contrib import admin
-from .models import Listing
+"""
+Admin for moderators. The listing changelist has to stay usable at millions
+of rows: it never runs an exact COUNT(*) over the table
+(EstimatedCountPaginator), joins the seller in the page query, filters on
+indexed columns, searches through the full-text index, and picks sellers
+with an autocomplete box instead of a <select> of every user.
+
+The bulk actions flip is_active with one UPDATE. QuerySet.update() skips the
+Listing signals, so set_listings_active() does their work for the whole
+batch: facet counters, per-ISBN price stats and the catalog cache version.
+Related lists catch up on the next `manage.py build_related`.
+
+Background jobs can be inspected, and failed ones sent back to the queue.
+"""
+
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .facets import FACETS, TOTAL_KEY, adjust_counts, compute_facet_counts
+from .models import Job, Listing, User
+from .offers import refresh_isbn_stats
+from .pagination import EstimatedCountPaginator
+from .search import get_search_backend
+
+
+def set_listings_active(queryset, active, reason=Listing.DELETED):
+    """
+    Activates or deactivates every listing in `queryset` with one UPDATE and
+    keeps the tables the Listing signals maintain in step. Returns how many
+    listings changed.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        changing = Listing.objects.filter(pk__in=queryset.filter(is_active=not active).values('pk'))
+        # What the rows add to (or take from) the counters, read before they flip
+        counts = compute_facet_counts(changing)
+        if not counts['total']:
+            return 0
+        isbns = list(changing.exclude(isbn13=None).values_list('isbn13', flat=True).distinct())
+        updated = changing.update(
+            is_active=active,
+            deactivated_at=None if active else now,
+            deactivated_reason='' if active else reason,
+            updated_at=now,
+        )
+        sign = 1 if active else -1
+        deltas = {TOTAL_KEY: sign * counts['total']}
+        for facet in FACETS:
+            deltas.update({(facet, value): sign * n for value, n in counts[facet].items()})
+        adjust_counts(deltas)
+        refresh_isbn_stats(isbns)
+        transaction.on_commit(bump_catalog_version)
+    return updated
+
 
 @admin.register(Listing)
 class ListingAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'price', 'category') # These columns show in the list
\ No newline at end of file
+    list_display = ('title', 'author', 'price', 'category', 'condition', 'seller', 'is_active', 'created_at')
+    list_select_related = ('seller',)
+    # Each is covered by an index (see Listing.Meta)
+    list_filter = ('is_active', 'category', 'condition')
+    search_fields = ('title', 'author')  # answered by get_search_results
+    search_help_text = 'Title or author words, ISBN, course code, or listing id.'
+    autocomplete_fields = ('seller',)
+    readonly_fields = ('isbn13', 'cover_source_url', 'deactivated_at', 'deactivated_reason', 'created_at', 'updated_at')
+    ordering = ('-id',)
+    paginator = EstimatedCountPaginator
+    # The "N total" next to a filtered count is another full-table COUNT(*)
+    show_full_result_count = False
+    actions = ('deactivate_listings', 'reactivate_listings')
+
+    def save_model(self, request, obj, form, change):
+        # Unticking "active" is a moderator delete; archiving goes by deactivated_at
+        if 'is_active' in form.changed_data:
+            obj.deactivated_at = None if obj.is_active else timezone.now()
+            obj.deactivated_reason = '' if obj.is_active else Listing.DELETED
+        super().save_model(request, obj, form, change)
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        match = get_search_backend(term).matches()
+        if term.isascii() and term.isdigit():
+            match |= Q(pk=int(term))
+        return queryset.filter(match), False
+
+    @admin.action(description='Deactivate selected listings', permissions=['change'])
+    def deactivate_listings(self, request, queryset):
+        count = set_listings_active(queryset, False)
+        self.message_user(request, f'Deactivated {count} listings.', messages.SUCCESS)
+
+    @admin.action(description='Reactivate selected listings', permissions=['change'])
+    def reactivate_listings(self, request, queryset):
+        count = set_listings_active(queryset, True)
+        self.message_user(request, f'Reactivated {count} listings.', messages.SUCCESS)
+
+
+@admin.register(User)
+class BookSwapUserAdmin(UserAdmin):
+    # Prefix matches only: the seller autocomplete searches on every keystroke
+    search_fields = ('^username', '^email')
+    ordering = ('username',)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_at', 'locked_by', 'finished_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('attempts', 'locked_by', 'locked_at', 'created_at', 'finished_at', 'last_error')
+    ordering = ('-id',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('retry_jobs',)
+
+    @admin.action(description='Retry selected failed jobs', permissions=['change'])
+    def retry_jobs(self, request, queryset):
+        # A key already queued again covers the same work (and can't be held twice)
+        held = Job.objects.filter(status__in=[Job.QUEUED, Job.RUNNING], dedupe_key__isnull=False).values('dedupe_key')
+        count = queryset.filter(status=Job.FAILED).exclude(dedupe_key__in=held).update(
+            status=Job.QUEUED, run_at=timezone.now(), attempts=0, finished_at=None,
+        )
+        self.message_user(request, f'Queued {count} jobs again.', messages.SUCCESS)
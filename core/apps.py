@@ -1,8 +1,15 @@
-
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
 
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .metrics import install_query_recorder
+        from .search import repair_sqlite_triggers
 
+        post_migrate.connect(repair_sqlite_triggers, sender=self)
+        connection_created.connect(install_query_recorder)
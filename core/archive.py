@@ -0,0 +1,60 @@
+# core/archive.py
+"""
+Moves long-inactive listings out of the hot listing table.
+
+Deleting or selling a listing only deactivates it (Listing.deactivate), so
+conversations keep their subject and the feed's partial indexes skip it.
+archive_listings() later copies listings inactive for longer than a cutoff
+into ListingArchive under the same id, points their conversations at the
+archived copy, and deletes the originals. Each batch is its own
+transaction, so the job can be stopped and resumed at any time.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Conversation, Listing, ListingArchive
+
+# Every archived column except archived_at has the same name on Listing
+ARCHIVED_FIELDS = [field.attname for field in ListingArchive._meta.concrete_fields if field.name != 'archived_at']
+
+
+def archivable(older_than=None, now=None):
+    """Inactive listings deactivated before the cutoff, oldest first."""
+    if older_than is None:
+        older_than = timedelta(days=settings.LISTING_ARCHIVE_AFTER_DAYS)
+    cutoff = (now or timezone.now()) - older_than
+    return Listing.objects.filter(is_active=False, deactivated_at__lt=cutoff).order_by('deactivated_at', 'id')
+
+
+def archive_batch(queryset, batch_size):
+    """Archives up to `batch_size` listings from `queryset`. Returns how many."""
+    with transaction.atomic():
+        rows = list(queryset.filter(is_active=False).select_for_update().values(*ARCHIVED_FIELDS)[:batch_size])
+        if not rows:
+            return 0
+        ids = [row['id'] for row in rows]
+        # ignore_conflicts: a batch retried after a crash finds its copies already there
+        ListingArchive.objects.bulk_create([ListingArchive(**row) for row in rows], ignore_conflicts=True)
+        # Both columns are set from the old row, so this moves the reference in one UPDATE
+        Conversation.objects.filter(listing_id__in=ids).update(archived_listing_id=F('listing_id'), listing=None)
+        # Inactive listings add nothing to the facet counters or the ISBN price stats, so the
+        # post_delete receivers run no queries; the collector handles every relation to Listing
+        Listing.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def archive_listings(older_than=None, batch_size=None, now=None):
+    """Archives every listing due for it, a batch at a time. Returns the total."""
+    batch_size = batch_size or settings.LISTING_ARCHIVE_BATCH_SIZE
+    queryset = archivable(older_than, now)
+    archived = 0
+    while True:
+        count = archive_batch(queryset, batch_size)
+        archived += count
+        if count < batch_size:
+            return archived
@@ -0,0 +1,45 @@
+# core/authentication.py
+
+import copy
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .utils import TTLCache
+
+# token key -> (user, token). Per process, so keep the TTL short: it bounds how
+# long another worker can keep accepting a token after logout/deactivation.
+token_cache = TTLCache(maxsize=getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that remembers token -> user for AUTH_TOKEN_CACHE_TTL
+    seconds, saving the Token/User join on every authenticated request.
+    Entries are dropped when a token is deleted (logout) and when its user is
+    saved, e.g. deactivated (see core/signals.py).
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, (user, token), settings.AUTH_TOKEN_CACHE_TTL)
+            cached = (user, token)
+        # Copies, so one request can't mutate the instance another one sees
+        user, token = cached
+        return copy.copy(user), token
+
+
+def invalidate_token(key):
+    token_cache.delete(key)
+
+
+def invalidate_user_tokens(user_id):
+    for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        token_cache.delete(key)
+
+
+def token_cache_stats():
+    return {'hits': token_cache.hits, 'misses': token_cache.misses, 'size': len(token_cache)}
@@ -0,0 +1,205 @@
+# core/books.py
+"""
+Google Books lookups with caching.
+
+Lookups go through three layers: an in-process LRU, the IsbnMetadata table,
+and finally the upstream API over a pooled requests.Session. Misses ("No book
+found") are cached too, for a shorter time. Concurrent lookups of the same
+key in one process share a single upstream call.
+"""
+
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import upstream_timer
+from .models import IsbnMetadata
+from .utils import ConcurrencyLimiter, Overloaded, SingleFlight, TTLCache
+
+logger = logging.getLogger(__name__)
+
+def normalize_isbn(isbn):
+    return re.sub(r'[\s-]', '', isbn or '').upper()
+
+
+def parse_volume_info(book_info, isbn=None):
+    """Turns a Google Books volumeInfo dict into listing prefill data."""
+    ids = book_info.get('industryIdentifiers', [])
+
+    # Get ISBN safely
+    found_isbn = next((identifier['identifier'] for identifier in ids
+                       if identifier['type'] == 'ISBN_13'), isbn or "0000000000000")
+
+    # Handle missing images safely
+    image_links = book_info.get('imageLinks') or {}
+    cover = image_links.get('thumbnail') or image_links.get('smallThumbnail', '')
+
+    return {
+        'title': book_info.get('title', 'Unknown Title'),
+        'author': ', '.join(book_info.get('authors', ['Unknown Author'])),
+        'cover_image_url': cover,
+        'isbn': found_isbn
+    }
+
+
+class GoogleBooksClient:
+    """Thin client over one pooled, retrying requests.Session."""
+
+    def __init__(self):
+        self.session = requests.Session()
+        retry = Retry(total=2, connect=2, read=0, backoff_factor=0.2,
+                      status_forcelist=[502, 503, 504], allowed_methods=['GET'])
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def first_volume(self, search_param):
+        """Returns the first volumeInfo for a search, or None if nothing matched."""
+        params = {'q': search_param, 'maxResults': 1}
+        # Only send the key if it actually exists
+        if settings.GOOGLE_BOOKS_API_KEY:
+            params['key'] = settings.GOOGLE_BOOKS_API_KEY
+        with upstream_timer('google_books'):
+            response = self.session.get(
+                settings.GOOGLE_BOOKS_API_URL, params=params, timeout=settings.GOOGLE_BOOKS_TIMEOUT
+            )
+            response.raise_for_status()
+            data = response.json()
+        if 'items' in data and data['items']:
+            return data['items'][0]['volumeInfo']
+        return None
+
+
+class BookLookupService:
+    """
+    Resolves an ISBN or free-text query to prefill data.
+
+    Returns the prefill dict, or None when the upstream has no match. Raises
+    requests.RequestException when the upstream can't be reached, and
+    Overloaded when BOOK_LOOKUP_MAX_IN_FLIGHT upstream calls are already
+    running in this process.
+    """
+
+    def __init__(self, client=None, maxsize=2048):
+        self.client = client or GoogleBooksClient()
+        self.cache = TTLCache(maxsize=maxsize)
+        self.flights = SingleFlight()
+        self.upstream = ConcurrencyLimiter()
+
+    def lookup(self, isbn=None, query=None):
+        if isbn:
+            key = 'isbn:' + normalize_isbn(isbn)
+            load = lambda: self._load_isbn(isbn)
+        else:
+            key = 'q:' + ' '.join(query.lower().split())
+            load = lambda: self._load_query(query)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached['data']
+        return self.flights.do(key, lambda: self._remember(key, load()))
+
+    def _remember(self, key, data):
+        ttl = settings.ISBN_CACHE_TTL if data else settings.ISBN_NEGATIVE_CACHE_TTL
+        # Keep the in-process copy short-lived; the table is the long-term cache
+        self.cache.set(key, {'data': data}, min(ttl, settings.ISBN_MEMORY_CACHE_TTL))
+        return data
+
+    def _load_isbn(self, isbn):
+        normalized = normalize_isbn(isbn)
+        row = IsbnMetadata.objects.filter(isbn=normalized, expires_at__gt=timezone.now()).first()
+        if row is not None:
+            return row.data if row.found else None
+
+        book_info = self._first_volume(f"isbn:{normalized}")
+        data = parse_volume_info(book_info, normalized) if book_info else None
+        ttl = settings.ISBN_CACHE_TTL if data else settings.ISBN_NEGATIVE_CACHE_TTL
+        now = timezone.now()
+        try:
+            IsbnMetadata.objects.update_or_create(
+                isbn=normalized,
+                defaults={
+                    'found': data is not None,
+                    'data': data or {},
+                    'fetched_at': now,
+                    'expires_at': now + timedelta(seconds=ttl),
+                },
+            )
+        except DatabaseError:
+            # The answer is still good; only the long-term cache write failed
+            logger.warning('Could not store ISBN metadata for %s', normalized, exc_info=True)
+        return data
+
+    def _load_query(self, query):
+        book_info = self._first_volume(query)
+        return parse_volume_info(book_info) if book_info else None
+
+    def _first_volume(self, search_param):
+        # Shed load instead of queueing once the upstream is this busy
+        return self.upstream.call(settings.BOOK_LOOKUP_MAX_IN_FLIGHT, lambda: self.client.first_volume(search_param))
+
+
+book_lookup = BookLookupService()
+
+
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+
+def _get_batch_pool():
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            _batch_pool = ThreadPoolExecutor(
+                max_workers=settings.BOOK_LOOKUP_BATCH_WORKERS, thread_name_prefix='book-lookup'
+            )
+        return _batch_pool
+
+
+def _lookup_in_thread(item):
+    try:
+        return book_lookup.lookup(isbn=item.get('isbn'), query=item.get('q'))
+    finally:
+        close_old_connections()
+
+
+def lookup_many(items, deadline=None):
+    """
+    Resolves several {'isbn': ...} / {'q': ...} items concurrently on a bounded
+    thread pool. Returns one result dict per item, in order. Items still running
+    when the deadline passes are reported as timeouts; they keep running in the
+    background and warm the cache for the next attempt.
+    """
+    deadline = settings.BOOK_LOOKUP_BATCH_DEADLINE if deadline is None else deadline
+    pool = _get_batch_pool()
+    futures = [pool.submit(_lookup_in_thread, item) for item in items]
+    wait(futures, timeout=deadline)
+
+    results = []
+    for item, future in zip(items, futures):
+        result = dict(item)
+        if not future.done():
+            future.cancel()
+            result.update(status='timeout', error='Lookup did not finish in time.')
+        elif isinstance(future.exception(), Overloaded):
+            result.update(status='busy', error='Too many lookups in progress; try again shortly.')
+        elif isinstance(future.exception(), requests.exceptions.RequestException):
+            result.update(status='error', error=f'Google API Error: {future.exception()}')
+        elif future.exception() is not None:
+            logger.error('Book lookup failed', exc_info=future.exception())
+            result.update(status='error', error='Lookup failed.')
+        elif future.result() is None:
+            result.update(status='not_found', error='No book found for that query.')
+        else:
+            result.update(status='found', book=future.result())
+        results.append(result)
+    return results
@@ -0,0 +1,139 @@
+# core/broker.py
+"""
+Pub/sub fan-out for real-time message delivery.
+
+Publishers (the Message post_save signal) call get_broker().publish() from
+any thread. Subscribers are async views; each gets a bounded asyncio queue
+on its own event loop, so an idle connection costs a queue and nothing more.
+When a queue is full the oldest event is dropped and the subscriber is told
+to catch up from the database.
+
+The backend is chosen with settings.MESSAGE_BROKER_BACKEND. InProcessBackend
+only reaches subscribers in the same process; a cross-process backend (e.g.
+Redis or Postgres LISTEN/NOTIFY) subclasses BrokerBackend and implements
+publish(), subscribe() and unsubscribe(). The base class keeps the count of
+dropped events that Subscription reports to.
+"""
+
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class BrokerBackend(ABC):
+    """Interface every broker backend implements."""
+
+    def __init__(self):
+        # Events dropped for slow subscribers, across all of them
+        self.dropped = 0
+
+    @abstractmethod
+    def publish(self, channel, message):
+        """Delivers `message` (a JSON-able dict) to current subscribers of `channel`."""
+
+    @abstractmethod
+    def subscribe(self, channel, maxsize):
+        """Returns a Subscription. Must be called from a running event loop."""
+
+    @abstractmethod
+    def unsubscribe(self, subscription):
+        """Stops delivering to `subscription`; Subscription.close() calls it."""
+
+    def stats(self):
+        return {'dropped': self.dropped}
+
+
+class Subscription:
+    def __init__(self, backend, channel, maxsize):
+        self.backend = backend
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def deliver(self, message):
+        # Always runs on self.loop
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.backend.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout):
+        """Next message, or None if nothing arrives within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.backend.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class InProcessBackend(BrokerBackend):
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._channels = defaultdict(set)
+        self.published = 0
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+            self.published += 1
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # Event loop already closed; the subscription is going away
+                self.unsubscribe(subscription)
+        return len(subscribers)
+
+    def subscribe(self, channel, maxsize):
+        subscription = Subscription(self, channel, maxsize)
+        with self._lock:
+            self._channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'channels': len(self._channels),
+                'subscribers': sum(len(s) for s in self._channels.values()),
+                'published': self.published,
+                'dropped': self.dropped,
+            }
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.MESSAGE_BROKER_BACKEND)()
+        return _broker
+
+
+def conversation_channel(conversation_id):
+    return f'conversation:{conversation_id}'
@@ -0,0 +1,73 @@
+# core/cache.py
+"""
+Versioned read-through cache for the public listing endpoints.
+
+Every cache key carries the current catalog version. Writes never delete
+cached pages; they bump the version (see core/signals.py) so old entries
+simply stop being addressed and expire on their own.
+"""
+
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from .db import reading_from_replica
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, uuid.uuid4().hex[:12], timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    # Random rather than incremented, so a wiped database can never line up
+    # with versions that are still sitting in a persistent cache
+    cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex[:12], timeout=None)
+
+
+class CatalogCacheMixin:
+    """
+    Serves anonymous JSON GETs from the cache as pre-rendered bytes with a
+    strong ETag, answering If-None-Match with 304. Authenticated requests and
+    other renderers (e.g. the browsable API) go straight to the view.
+    """
+
+    def cached_response(self, request, build_response):
+        if request.user.is_authenticated or request.accepted_renderer.format != 'json':
+            return build_response()
+
+        url = request.build_absolute_uri()
+        key = 'catalog:%s:%s' % (catalog_version(), hashlib.sha1(url.encode()).hexdigest())
+        entry = cache.get(key)
+        if entry is None:
+            response = build_response()
+            if response.status_code != 200:
+                return response
+            content = request.accepted_renderer.render(
+                response.data, request.accepted_media_type, self.get_renderer_context()
+            )
+            entry = (content, '"%s"' % hashlib.sha256(content).hexdigest()[:32])
+            timeout = settings.CATALOG_CACHE_TIMEOUT
+            if reading_from_replica():
+                # The replica may not have the write that bumped the version yet
+                timeout = min(timeout, settings.DATABASE_REPLICA_PIN_SECONDS)
+            cache.set(key, entry, timeout)
+
+        content, etag = entry
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Accept', 'Authorization'])
+        return response
@@ -0,0 +1,331 @@
+# core/covers.py
+"""
+Local cache for listing cover images.
+
+Each distinct remote cover URL is fetched once and stored content-addressed
+(by SHA-256) under COVER_CACHE_ROOT, with resized thumbnails when Pillow is
+available. Once a cover is cached, every listing using that URL is repointed
+at our copy, an absolute URL under COVER_BASE_URL + COVER_URL_PREFIX; the
+original URL is kept in cover_source_url.
+
+Only http(s) URLs on COVER_ALLOWED_HOSTS are fetched, and never from a
+private, loopback or link-local address (redirects included), so a listing
+can't make the server request something inside our network. Warming happens
+after the listing is committed, on a small background pool (or as a job for
+`manage.py run_workers` with COVER_WARMING='queue'), so saving a listing
+never waits on a third-party host.
+"""
+
+import hashlib
+import io
+import ipaddress
+import logging
+import re
+import socket
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .cache import bump_catalog_version
+from .jobs import add_jobs, build_job
+from .metrics import upstream_timer
+from .models import CoverImage, Listing
+from .utils import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/gif': 'gif', 'image/webp': 'webp'}
+CONTENT_TYPES = {ext: content_type for content_type, ext in EXTENSIONS.items()}
+# <sha256>.<ext> for originals, <sha256>-<size>.jpg for thumbnails
+NAME_RE = re.compile(r'^(?P<sha>[0-9a-f]{64})(?:-(?P<size>[A-Z]))?\.(?P<ext>jpg|png|gif|webp)$')
+# Open Library answers unknown ISBNs with a 1x1 GIF of a few dozen bytes
+PLACEHOLDER_MAX_BYTES = 100
+MAX_REDIRECTS = 3
+
+
+class UnsafeCoverURL(Exception):
+    pass
+
+
+def storage():
+    return FileSystemStorage(location=settings.COVER_CACHE_ROOT)
+
+
+def storage_path(name):
+    """Files are sharded by the first two hex digits of their hash."""
+    return f'{name[:2]}/{name}'
+
+
+def cover_url(name):
+    # Absolute, so it stays a valid value for Listing.cover_image_url (a URLField)
+    return settings.COVER_BASE_URL.rstrip('/') + settings.COVER_URL_PREFIX + name
+
+
+def is_local(url):
+    # Listings repointed before COVER_BASE_URL existed hold the bare path
+    return bool(url) and (url.startswith(cover_url('')) or url.startswith(settings.COVER_URL_PREFIX))
+
+
+def host_allowed(url):
+    """Whether `url` is http(s) on COVER_ALLOWED_HOSTS (a leading dot allows subdomains)."""
+    parts = urlsplit(url or '')
+    host = (parts.hostname or '').lower()
+    if parts.scheme not in ('http', 'https') or not host:
+        return False
+    return any(host == allowed or (allowed.startswith('.') and host.endswith(allowed))
+               for allowed in settings.COVER_ALLOWED_HOSTS)
+
+
+def check_fetchable(url):
+    """Raises UnsafeCoverURL unless `url` is on an allowed host that resolves to public addresses only."""
+    if not host_allowed(url):
+        raise UnsafeCoverURL(f'{url} is not on COVER_ALLOWED_HOSTS')
+    if settings.COVER_ALLOW_PRIVATE_ADDRESSES:
+        return
+    parts = urlsplit(url)
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, parts.port or 443, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError) as exc:
+        raise UnsafeCoverURL(f'{parts.hostname} does not resolve: {exc}')
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        ip = getattr(ip, 'ipv4_mapped', None) or ip
+        if not ip.is_global:
+            raise UnsafeCoverURL(f'{parts.hostname} resolves to non-public address {ip}')
+
+
+def open_cover(name):
+    """(file, content type) for a cached file name, or None if there's no such file."""
+    match = NAME_RE.match(name)
+    if match is None:
+        return None
+    try:
+        return storage().open(storage_path(name), 'rb'), CONTENT_TYPES[match['ext']]
+    except FileNotFoundError:
+        return None
+
+
+def make_thumbnails(data, sha):
+    """
+    Writes one JPEG per COVER_THUMBNAIL_SIZES entry and returns {size: name}.
+    Returns None if the data isn't an image Pillow can read, and {} when
+    Pillow isn't installed, in which case listings use the original.
+    """
+    try:
+        from PIL import Image, UnidentifiedImageError
+    except ImportError:
+        return {}
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (UnidentifiedImageError, OSError):
+        return None
+    if image.width <= 1 or image.height <= 1:
+        return None
+    image = image.convert('RGB')
+
+    files, names = storage(), {}
+    for size, width in settings.COVER_THUMBNAIL_SIZES.items():
+        name = f'{sha}-{size}.jpg'
+        if not files.exists(storage_path(name)):
+            thumbnail = image.copy()
+            # Width-bound; covers are taller than wide, so allow up to 2:1
+            thumbnail.thumbnail((width, width * 2))
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, 'JPEG', quality=85, optimize=True)
+            files.save(storage_path(name), ContentFile(buffer.getvalue()))
+        names[size] = name
+    return names
+
+
+def warm_job(url):
+    # One queued job per URL, however many listings share it
+    return build_job('covers.warm', {'url': url}, dedupe_key=f'cover:{hashlib.sha256(url.encode()).hexdigest()}')
+
+
+def warm_cover(url):
+    """The covers.warm job."""
+    cover_cache.fetch(url)
+
+
+class CoverCache:
+    """Fetches, stores and serves covers. Methods are safe to call from any thread."""
+
+    def __init__(self):
+        self.session = requests.Session()
+        retry = Retry(total=2, connect=2, read=0, backoff_factor=0.2,
+                      status_forcelist=[502, 503, 504], allowed_methods=['GET'])
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.flights = SingleFlight()
+        self._pool = None
+        self._queued = {}
+        self._lock = threading.Lock()
+
+    # Warming
+
+    def warm(self, url):
+        """
+        Caches `url` in the background (or inline, or as a job, per
+        COVER_WARMING) and returns a Future for the CoverImage; it resolves to
+        None for a queued job. URLs already queued share one job.
+        """
+        mode = settings.COVER_WARMING
+        if mode == 'off' or not url or is_local(url) or not host_allowed(url):
+            future = Future()
+            future.set_result(None)
+            return future
+        if mode == 'queue':
+            add_jobs([warm_job(url)])
+            future = Future()
+            future.set_result(None)
+            return future
+        if mode == 'sync':
+            future = Future()
+            try:
+                future.set_result(self.fetch(url))
+            except Exception as exc:
+                future.set_exception(exc)
+            return future
+        pool = self._get_pool()
+        with self._lock:
+            future = self._queued.get(url)
+            if future is None:
+                future = self._queued[url] = pool.submit(self._fetch_in_thread, url)
+            return future
+
+    def warm_on_commit(self, urls):
+        """Queues warming for the external URLs in `urls` once the transaction commits."""
+        urls = {url for url in urls if url and not is_local(url) and host_allowed(url)}
+        if not urls or settings.COVER_WARMING == 'off':
+            return
+        if settings.COVER_WARMING == 'queue':
+            # Jobs are rows: they commit, or roll back, with the listings
+            add_jobs([warm_job(url) for url in sorted(urls)])
+        else:
+            transaction.on_commit(lambda: [self.warm(url) for url in sorted(urls)])
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=settings.COVER_WARM_WORKERS, thread_name_prefix='cover-warm'
+                )
+            return self._pool
+
+    def _fetch_in_thread(self, url):
+        try:
+            return self.fetch(url)
+        except Exception:
+            logger.exception('Could not cache cover %s', url)
+        finally:
+            with self._lock:
+                self._queued.pop(url, None)
+            close_old_connections()
+
+    # Fetching
+
+    def fetch(self, url):
+        """
+        Makes sure `url` is cached and its listings point at the local copy.
+        Returns the CoverImage. Missing and failed covers aren't retried
+        before COVER_RETRY_AFTER.
+        """
+        return self.flights.do(url, lambda: self._fetch(url))
+
+    def _fetch(self, url):
+        cover, _ = CoverImage.objects.get_or_create(source_url=url)
+        retry_after = timezone.now() - timedelta(seconds=settings.COVER_RETRY_AFTER)
+        if cover.status in (CoverImage.MISSING, CoverImage.FAILED) and cover.fetched_at and cover.fetched_at > retry_after:
+            return cover
+        if cover.status != CoverImage.READY:
+            self._download(cover)
+        if cover.status == CoverImage.READY:
+            self.repoint_listings(cover)
+        return cover
+
+    def _download(self, cover):
+        cover.attempts += 1
+        cover.fetched_at = timezone.now()
+        try:
+            data, content_type = self._get(cover.source_url)
+        except (requests.RequestException, UnsafeCoverURL) as exc:
+            logger.warning('Cover fetch failed for %s: %s', cover.source_url, exc)
+            return self._give_up(cover, CoverImage.FAILED)
+
+        ext = EXTENSIONS.get(content_type)
+        if data is None or ext is None or len(data) <= PLACEHOLDER_MAX_BYTES:
+            return self._give_up(cover, CoverImage.MISSING)
+        sha = hashlib.sha256(data).hexdigest()
+        thumbnails = make_thumbnails(data, sha)
+        if thumbnails is None:
+            return self._give_up(cover, CoverImage.MISSING)
+        original = f'{sha}.{ext}'
+        files = storage()
+        if not files.exists(storage_path(original)):
+            files.save(storage_path(original), ContentFile(data))
+
+        cover.status = CoverImage.READY
+        cover.sha256, cover.content_type, cover.size = sha, content_type, len(data)
+        cover.name = thumbnails.get(settings.COVER_LISTING_SIZE, original)
+        cover.save()
+
+    def _give_up(self, cover, status):
+        cover.status = status
+        cover.save(update_fields=['status', 'attempts', 'fetched_at'])
+
+    def _get(self, url):
+        """(bytes, content type), or (None, None) when the source has no image."""
+        params = {}
+        if urlsplit(url).hostname == 'covers.openlibrary.org':
+            params['default'] = 'false'  # 404 instead of the placeholder GIF
+        with upstream_timer('covers'):
+            # Redirects are followed by hand so each hop is checked before we connect
+            for _ in range(MAX_REDIRECTS + 1):
+                check_fetchable(url)
+                response = self.session.get(url, params=params, stream=True, allow_redirects=False,
+                                            timeout=settings.COVER_FETCH_TIMEOUT)
+                if not response.is_redirect:
+                    break
+                response.close()
+                url, params = urljoin(url, response.headers['Location']), {}
+            else:
+                raise UnsafeCoverURL(f'more than {MAX_REDIRECTS} redirects')
+            with response:
+                if response.status_code in (404, 410):
+                    return None, None
+                response.raise_for_status()
+                content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+                chunks, length = [], 0
+                for chunk in response.iter_content(64 * 1024):
+                    length += len(chunk)
+                    if length > settings.COVER_MAX_BYTES:
+                        return None, None
+                    chunks.append(chunk)
+        return b''.join(chunks), content_type
+
+    def repoint_listings(self, cover):
+        """Points every listing still using the remote URL at the cached copy."""
+        updated = Listing.objects.filter(cover_image_url=cover.source_url).update(
+            cover_source_url=F('cover_image_url'),
+            cover_image_url=cover_url(cover.name),
+            updated_at=timezone.now(),
+        )
+        if updated:
+            transaction.on_commit(bump_catalog_version)
+        return updated
+
+
+cover_cache = CoverCache()
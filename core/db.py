@@ -0,0 +1,153 @@
+# core/db.py
+"""
+Database settings, and sending catalog reads to a replica.
+
+database_config() turns a database URL into a DATABASES entry tuned for its
+backend. SQLite connections switch to WAL, so readers don't block behind a
+writer, get a busy timeout instead of failing with "database is locked",
+and take the write lock when a transaction starts (IMMEDIATE), so two
+transactions can't both read and then deadlock upgrading to a write.
+PostgreSQL can use psycopg 3's connection pool (psycopg[pool]) in place of
+one persistent connection per worker thread.
+
+When a `replica` alias is configured (REPLICA_DATABASE_URL), ReplicaRouter
+sends reads of the catalog tables (REPLICA_MODELS) made by GET/HEAD requests
+to the REPLICA_ROUTES views there. Everything else uses the primary:
+writes, unsafe requests, auth and session lookups, management commands,
+background threads, and the body of a streaming response. Replicas lag, so
+a client that sent an unsafe request is pinned to the primary for
+DATABASE_REPLICA_PIN_SECONDS and reads its own writes. Clients are told
+apart by their Authorization header or session cookie; anonymous clients
+can't write to the catalog.
+"""
+
+import contextvars
+import hashlib
+
+import dj_database_url
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+REPLICA = 'replica'
+# Route names whose GET/HEAD requests may read from the replica
+REPLICA_ROUTES = frozenset({
+    'listings', 'search', 'facets', 'listing-list', 'listing-detail', 'listing-related',
+    'book-offers', 'book-prices',
+})
+REPLICA_MODELS = frozenset({'core.Listing', 'core.ListingFacetCount', 'core.IsbnPriceStats', 'core.RelatedListing'})
+SAFE_METHODS = {'GET', 'HEAD'}
+PIN_KEY = 'db-pin:%s'
+
+
+def database_config(url, conn_max_age=600, pool_max_size=0, pool_timeout=10.0,
+                    sqlite_busy_timeout=20.0, sqlite_cache_mb=64):
+    """A DATABASES entry for `url`. pool_max_size > 0 pools PostgreSQL connections."""
+    database = dj_database_url.parse(url, conn_max_age=conn_max_age)
+    options = database.setdefault('OPTIONS', {})
+    if database['ENGINE'] == 'django.db.backends.sqlite3':
+        options.setdefault('timeout', sqlite_busy_timeout)  # seconds sqlite3 waits on a lock
+        options.setdefault('transaction_mode', 'IMMEDIATE')
+        options.setdefault('init_command', ';'.join([
+            'PRAGMA journal_mode=WAL',
+            # Durable at each checkpoint rather than each commit; safe with WAL
+            'PRAGMA synchronous=NORMAL',
+            f'PRAGMA cache_size=-{sqlite_cache_mb * 1024}',
+            'PRAGMA temp_store=MEMORY',
+        ]))
+    elif database['ENGINE'] == 'django.db.backends.postgresql' and pool_max_size > 0:
+        options['pool'] = {'min_size': 1, 'max_size': pool_max_size, 'timeout': pool_timeout}
+        # The pool owns the connections; Django refuses persistent ones next to it
+        database['CONN_MAX_AGE'] = 0
+    return database
+
+
+def replica_configured():
+    # Under test the replica is a mirror of the primary's database (TEST['MIRROR']): nothing to route
+    if REPLICA not in connections.settings:
+        return False
+    return connections[REPLICA].settings_dict['NAME'] != connections['default'].settings_dict['NAME']
+
+
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+
+def reading_from_replica():
+    return _read_alias.get() == REPLICA
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _read_alias.get() is not None and model._meta.label in REPLICA_MODELS:
+            return _read_alias.get()
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # the replica holds the same rows
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema from the primary
+        return db != REPLICA
+
+
+def _client_key(request):
+    credential = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    return PIN_KEY % hashlib.sha256(credential.encode()).hexdigest() if credential else None
+
+
+class ReplicaRoutingMiddleware:
+    """Picks the database for a request's reads. Does nothing unless a replica is configured."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not replica_configured():
+            return self.get_response(request)
+        token = _read_alias.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        self._pin(request)
+        return response
+
+    async def __acall__(self, request):
+        if not replica_configured():
+            return await self.get_response(request)
+        token = _read_alias.set(None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        await sync_to_async(self._pin)(request)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Called once the URL is resolved, so the route name is known
+        if not replica_configured() or request.method not in SAFE_METHODS:
+            return None
+        if request.resolver_match.view_name not in REPLICA_ROUTES:
+            return None
+        key = _client_key(request)
+        if key is None or not cache.get(key):
+            _read_alias.set(REPLICA)
+        return None
+
+    def _pin(self, request):
+        if request.method in SAFE_METHODS or request.method == 'OPTIONS':
+            return
+        key = _client_key(request)
+        if key is not None:
+            cache.set(key, True, settings.DATABASE_REPLICA_PIN_SECONDS)
@@ -0,0 +1,142 @@
+# core/export.py
+"""
+Streaming catalog export as JSON lines or CSV.
+
+Rows come straight from values().iterator(), so no model or serializer
+instances are built and at most `chunk_size` rows are held at once. Encoded
+lines are grouped into ~64 KB chunks and can be gzipped on the fly, so
+memory use stays flat whatever the catalog size.
+"""
+
+import csv
+import datetime
+import io
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Listing
+
+FORMATS = ('jsonl', 'csv')
+CONTENT_TYPES = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv'}
+DEFAULT_CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+FIELDS = [
+    'id', 'title', 'author', 'isbn', 'condition', 'price', 'category', 'course_code',
+    'cover_image_url', 'seller', 'is_active', 'created_at', 'updated_at',
+]
+
+
+def parse_since(value):
+    """An ISO date or datetime for updated_since; naive values are taken as UTC."""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Not an ISO 8601 date or datetime: {value!r}')
+        parsed = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, datetime.timezone.utc)
+    return parsed
+
+
+def export_rows(updated_since=None, include_inactive=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Listing rows as dicts, in id order. With `updated_since`, inactive rows are
+    included too so an incremental pull can drop listings that went away.
+    """
+    queryset = Listing.objects.all()
+    if updated_since is not None:
+        queryset = queryset.filter(updated_at__gte=updated_since)
+    elif not include_inactive:
+        queryset = queryset.filter(is_active=True)
+    fields = [name for name in FIELDS if name != 'seller']
+    rows = (
+        queryset.order_by('id')
+        .values(*fields, seller_username=F('seller__username'))
+        .iterator(chunk_size=chunk_size)
+    )
+    # values() can't name the annotation after the seller field itself
+    for row in rows:
+        row['seller'] = row.pop('seller_username')
+        yield row
+
+
+def jsonl_lines(rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode({name: row[name] for name in FIELDS}) + '\n'
+
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    yield line(FIELDS)
+    for row in rows:
+        yield line([_csv_value(row[name]) for name in FIELDS])
+
+
+def _csv_value(value):
+    # ISO 8601, like the JSON export, rather than str(datetime)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def buffered(lines, size=BUFFER_SIZE):
+    """Joins encoded lines into chunks of about `size` bytes."""
+    parts, length = [], 0
+    for line in lines:
+        data = line.encode()
+        parts.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(parts)
+            parts, length = [], 0
+    if parts:
+        yield b''.join(parts)
+
+
+def gzipped(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_listings(file_format, gzip=False, **filters):
+    """Iterator of bytes chunks for the whole export."""
+    if file_format not in FORMATS:
+        raise ValueError(f'Unsupported format {file_format!r}; use one of {", ".join(FORMATS)}.')
+    rows = export_rows(**filters)
+    chunks = buffered(jsonl_lines(rows) if file_format == 'jsonl' else csv_lines(rows))
+    return gzipped(chunks) if gzip else chunks
+
+
+async def aiterate(iterator):
+    """
+    Serves a sync iterator from an async generator one chunk at a time.
+    Under ASGI, StreamingHttpResponse would otherwise read a sync iterator
+    into a list before sending anything.
+    """
+    pull = sync_to_async(next, thread_sensitive=True)
+    while True:
+        chunk = await pull(iterator, None)
+        if chunk is None:
+            return
+        yield chunk
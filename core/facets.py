@@ -0,0 +1,158 @@
+# core/facets.py
+"""
+Facet counts (category, condition, price bucket) for the listing catalog.
+
+The unfiltered counts live in ListingFacetCount and are adjusted by the
+Listing save/delete signals, so reading them is one small query whatever
+the catalog size. Filtered counts are computed with one conditional
+aggregate over the filtered queryset.
+
+Only active listings are counted. QuerySet.update() skips signals, so code
+that bulk-updates these fields must call adjust_counts() or
+rebuild_facet_counts() (also available as `manage.py rebuild_facets`).
+"""
+
+from collections import Counter
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import Listing, ListingFacetCount
+
+# (label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = [
+    ('0-10', Decimal('0'), Decimal('10')),
+    ('10-25', Decimal('10'), Decimal('25')),
+    ('25-50', Decimal('25'), Decimal('50')),
+    ('50-100', Decimal('50'), Decimal('100')),
+    ('100+', Decimal('100'), None),
+]
+
+FACETS = {
+    'category': [code for code, _ in Listing.CATEGORY_CHOICES],
+    'condition': [code for code, _ in Listing.CONDITION_CHOICES],
+    'price': [label for label, _, _ in PRICE_BUCKETS],
+}
+
+# Tracked as facet 'total' with an empty value
+TOTAL_KEY = ('total', '')
+
+FACET_FIELDS = ('category', 'condition', 'price', 'is_active')
+
+
+def price_bucket(price):
+    for label, low, high in PRICE_BUCKETS:
+        if price >= low and (high is None or price < high):
+            return label
+    return None
+
+
+def facet_keys(category, condition, price, is_active):
+    """The (facet, value) counters one listing contributes to."""
+    if not is_active:
+        return set()
+    keys = {TOTAL_KEY}
+    if category in FACETS['category']:
+        keys.add(('category', category))
+    if condition in FACETS['condition']:
+        keys.add(('condition', condition))
+    bucket = price_bucket(Decimal(price)) if price is not None else None
+    if bucket:
+        keys.add(('price', bucket))
+    return keys
+
+
+def listing_facet_keys(listing):
+    return facet_keys(listing.category, listing.condition, listing.price, listing.is_active)
+
+
+def loaded_facet_keys(listing):
+    """Keys for the values the listing had when it was loaded, or None if unknown."""
+    loaded = getattr(listing, '_loaded_values', None)
+    if loaded is None or not all(name in loaded for name in FACET_FIELDS):
+        return None
+    return facet_keys(*(loaded[name] for name in FACET_FIELDS))
+
+
+def remember_loaded_values(listing):
+    loaded = getattr(listing, '_loaded_values', None)
+    if loaded is None:
+        listing._loaded_values = loaded = {}
+    loaded.update({name: getattr(listing, name) for name in FACET_FIELDS})
+
+
+def adjust_counts(deltas):
+    """Applies a Counter of (facet, value) -> change. One UPDATE per distinct change."""
+    by_delta = {}
+    for key, delta in deltas.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(key)
+    for delta, keys in by_delta.items():
+        match = Q()
+        for facet, value in keys:
+            match |= Q(facet=facet, value=value)
+        updated = ListingFacetCount.objects.filter(match).update(count=F('count') + delta)
+        if updated < len(keys):
+            # A value nobody had since the table was last rebuilt: add its row
+            present = set(ListingFacetCount.objects.filter(match).values_list('facet', 'value'))
+            missing = [key for key in keys if key not in present]
+            ListingFacetCount.objects.bulk_create(
+                [ListingFacetCount(facet=facet, value=value, count=0) for facet, value in missing],
+                ignore_conflicts=True,
+            )
+            match = Q()
+            for facet, value in missing:
+                match |= Q(facet=facet, value=value)
+            ListingFacetCount.objects.filter(match).update(count=F('count') + delta)
+
+
+def compute_facet_counts(queryset):
+    """{'total': n, 'category': {...}, 'condition': {...}, 'price': {...}} in one query."""
+    aggregates = {'total': Count('id')}
+    for i, value in enumerate(FACETS['category']):
+        aggregates[f'category_{i}'] = Count('id', filter=Q(category=value))
+    for i, value in enumerate(FACETS['condition']):
+        aggregates[f'condition_{i}'] = Count('id', filter=Q(condition=value))
+    for i, (_, low, high) in enumerate(PRICE_BUCKETS):
+        bucket = Q(price__gte=low) if high is None else Q(price__gte=low, price__lt=high)
+        aggregates[f'price_{i}'] = Count('id', filter=bucket)
+    row = queryset.aggregate(**aggregates)
+
+    counts = {'total': row['total']}
+    for facet, values in FACETS.items():
+        counts[facet] = {value: row[f'{facet}_{i}'] for i, value in enumerate(values)}
+    return counts
+
+
+def read_facet_counts():
+    """The active-catalog counts from the counter table (one query)."""
+    counts = {'total': 0}
+    counts.update({facet: dict.fromkeys(values, 0) for facet, values in FACETS.items()})
+    for facet, value, count in ListingFacetCount.objects.values_list('facet', 'value', 'count'):
+        if (facet, value) == TOTAL_KEY:
+            counts['total'] = count
+        elif value in counts.get(facet, ()):
+            counts[facet][value] = count
+    return counts
+
+
+def rebuild_facet_counts(listing_model=Listing, count_model=ListingFacetCount):
+    """Recomputes the counter table from scratch."""
+    counts = compute_facet_counts(listing_model.objects.filter(is_active=True))
+    rows = [count_model(facet=TOTAL_KEY[0], value=TOTAL_KEY[1], count=counts['total'])]
+    for facet, values in FACETS.items():
+        rows.extend(count_model(facet=facet, value=value, count=n) for value, n in counts[facet].items())
+    with transaction.atomic():
+        count_model.objects.all().delete()
+        count_model.objects.bulk_create(rows)
+    return counts
+
+
+def diff_keys(old, new):
+    deltas = Counter()
+    for key in old - new:
+        deltas[key] -= 1
+    for key in new - old:
+        deltas[key] += 1
+    return deltas
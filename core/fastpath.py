@@ -0,0 +1,110 @@
+# core/fastpath.py
+"""
+Read-only fast path for hot listing GETs.
+
+ValuesSerializer looks at a ModelSerializer once, at import time, and turns
+it into a values() projection plus a per-field converter table. Serializing
+a row is then one dict comprehension instead of DRF's field-by-field
+to_representation() walk. The output must stay identical to the
+serializer's; core/tests.py compares the rendered JSON byte for byte.
+
+Only plain model fields, dotted-source ReadOnlyFields and the field types
+in CONVERTERS are supported; anything else fails loudly at import.
+"""
+
+import decimal
+from operator import itemgetter
+
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from .serializers import ListingSerializer
+
+
+def _decimal_converter(field):
+    # DecimalField.to_representation with COERCE_DECIMAL_TO_STRING
+    coerce = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce or field.localize or field.normalize_output:
+        raise ValueError(f'Unsupported DecimalField options on {field.field_name!r}')
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+    return convert
+
+
+def _datetime_converter(field):
+    # DateTimeField.to_representation with ISO 8601 output
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        raise ValueError(f'Unsupported DateTimeField format on {field.field_name!r}')
+    # Looking up the active timezone per value costs more than the formatting
+    field_timezone = getattr(field, 'timezone', None) or field.default_timezone()
+
+    def convert(value):
+        if field_timezone is not None and timezone.is_aware(value):
+            value = value.astimezone(field_timezone)
+        else:
+            value = field.enforce_timezone(value)
+        text = value.isoformat()
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+    return convert
+
+
+# Field classes whose representation of a non-None value is the value itself
+PASSTHROUGH = (serializers.IntegerField, serializers.CharField, serializers.ChoiceField, serializers.ReadOnlyField)
+
+CONVERTERS = {
+    serializers.DecimalField: _decimal_converter,
+    serializers.DateTimeField: _datetime_converter,
+}
+
+
+class ValuesSerializer:
+    def __init__(self, serializer_class):
+        self.names, self.lookups, self.factories = [], [], []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or not isinstance(field, tuple(CONVERTERS) + PASSTHROUGH):
+                raise ValueError(f'{serializer_class.__name__}.{name} has no fast path')
+            self.names.append(name)
+            self.lookups.append(field.source.replace('.', '__'))
+            factory = next((make for cls, make in CONVERTERS.items() if isinstance(field, cls)), None)
+            if factory:
+                self.factories.append((len(self.names) - 1, field, factory))
+        self.getter = itemgetter(*self.lookups)
+
+    def values(self, queryset):
+        """The projection to fetch. Rows are dicts, so keyset pagination can still read them."""
+        return queryset.values(*dict.fromkeys(self.lookups))
+
+    def compile(self):
+        """
+        A row -> dict function. Converters are bound per call rather than at
+        import because they capture request state such as the active timezone.
+        """
+        names, getter = self.names, self.getter
+        converters = [(index, factory(field)) for index, field, factory in self.factories]
+
+        def to_representation(row):
+            values = list(getter(row))
+            for index, convert in converters:
+                if values[index] is not None:
+                    values[index] = convert(values[index])
+            return dict(zip(names, values))
+        return to_representation
+
+    def to_representation(self, row):
+        return self.compile()(row)
+
+    def serialize(self, rows):
+        to_representation = self.compile()
+        return [to_representation(row) for row in rows]
+
+
+listing_fast_path = ValuesSerializer(ListingSerializer)
@@ -0,0 +1,112 @@
+# core/filters.py
+"""
+Query-string filters shared by the listing endpoints.
+
+parse_listing_filters() validates the parameters once; filter_listings()
+applies them to a queryset; parse_sort() picks the feed ordering. Listings
+are active-only unless the request asks for ?is_active=false or ?is_active=any.
+"""
+
+from decimal import Decimal, InvalidOperation
+
+from django.db.models.functions import Upper
+from django.db.models.lookups import Exact
+from rest_framework.exceptions import ValidationError
+
+from .models import Listing
+from .search import get_search_backend
+
+CATEGORIES = [code for code, _ in Listing.CATEGORY_CHOICES]
+CONDITIONS = [code for code, _ in Listing.CONDITION_CHOICES]
+
+# ?sort= values and the keyset ordering each one pages on
+SORTS = {
+    'newest': ('-created_at', '-id'),
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+}
+
+FILTER_PARAMS = ('q', 'category', 'condition', 'min_price', 'max_price', 'course_code', 'is_active')
+
+
+def _choices(params, name, allowed):
+    # ?condition=GOOD,FAIR and ?condition=GOOD&condition=FAIR both work
+    values = [v.strip() for raw in params.getlist(name) for v in raw.split(',') if v.strip()]
+    unknown = [v for v in values if v not in allowed]
+    if unknown:
+        raise ValidationError({name: f'Unknown value(s): {", ".join(unknown)}. Use one of {", ".join(allowed)}.'})
+    return values
+
+
+def _price(params, name):
+    raw = params.get(name, '').strip()
+    if not raw:
+        return None
+    try:
+        value = Decimal(raw)
+    except InvalidOperation:
+        raise ValidationError({name: 'Enter a number.'})
+    if not value.is_finite() or value < 0:
+        raise ValidationError({name: 'Enter a non-negative number.'})
+    return value
+
+
+def _active(params):
+    raw = params.get('is_active', '').strip().lower()
+    if raw in ('', 'true', '1'):
+        return True
+    if raw in ('false', '0'):
+        return False
+    if raw in ('any', 'all'):
+        return None
+    raise ValidationError({'is_active': 'Use true, false or any.'})
+
+
+def parse_listing_filters(params):
+    """Validated filters from a QueryDict. Raises ValidationError (400) on bad input."""
+    filters = {
+        'q': params.get('q', '').strip(),
+        'category': _choices(params, 'category', CATEGORIES),
+        'condition': _choices(params, 'condition', CONDITIONS),
+        'min_price': _price(params, 'min_price'),
+        'max_price': _price(params, 'max_price'),
+        'course_code': params.get('course_code', '').strip(),
+        'is_active': _active(params),
+    }
+    if filters['min_price'] is not None and filters['max_price'] is not None \
+            and filters['min_price'] > filters['max_price']:
+        raise ValidationError({'min_price': 'Must not be above max_price.'})
+    return filters
+
+
+def parse_sort(params):
+    sort = params.get('sort', '').strip() or 'newest'
+    if sort not in SORTS:
+        raise ValidationError({'sort': f'Use one of {", ".join(SORTS)}.'})
+    return SORTS[sort]
+
+
+def is_default(filters):
+    """True when the filters select exactly the active catalog."""
+    return filters['is_active'] is True and not any(
+        filters[name] for name in FILTER_PARAMS if name != 'is_active'
+    )
+
+
+def filter_listings(queryset, filters):
+    if filters['is_active'] is not None:
+        queryset = queryset.filter(is_active=filters['is_active'])
+    if filters['category']:
+        queryset = queryset.filter(category__in=filters['category'])
+    if filters['condition']:
+        queryset = queryset.filter(condition__in=filters['condition'])
+    if filters['min_price'] is not None:
+        queryset = queryset.filter(price__gte=filters['min_price'])
+    if filters['max_price'] is not None:
+        queryset = queryset.filter(price__lte=filters['max_price'])
+    if filters['course_code']:
+        # Matches listing_course_code_upper_idx; course_code__iexact compiles to a LIKE that can't use it
+        queryset = queryset.filter(Exact(Upper('course_code'), filters['course_code'].upper()))
+    if filters['q']:
+        queryset = queryset.filter(get_search_backend(filters['q']).matches())
+    return queryset
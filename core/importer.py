@@ -0,0 +1,144 @@
+# core/importer.py
+"""
+Streaming bulk import of listings from CSV or JSONL.
+
+Rows are read one at a time, validated with ListingImportSerializer and
+inserted with bulk_create in fixed-size batches, each in its own
+transaction. Bad rows are reported and skipped; they never abort the import.
+Memory use depends on the batch size, not on the file size.
+"""
+
+import csv
+import io
+import json
+from collections import Counter
+
+from django.db import transaction
+
+from .cache import bump_catalog_version
+from .covers import cover_cache
+from .facets import adjust_counts, listing_facet_keys
+from .models import Listing
+from .offers import refresh_isbn_stats
+from .saved_searches import match_on_commit
+from .serializers import ListingImportSerializer
+
+FORMATS = ('csv', 'jsonl')
+DEFAULT_BATCH_SIZE = 500
+
+
+def guess_format(filename):
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    return None
+
+
+def iter_rows(binary_file, file_format):
+    """Yields (line_number, row_dict_or_None, error) from a binary file object."""
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    try:
+        if file_format == 'csv':
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, _clean(row), None
+        else:
+            for line_number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_number, None, f'Invalid JSON: {e}'
+                    continue
+                if not isinstance(row, dict):
+                    yield line_number, None, 'Each line must be a JSON object.'
+                    continue
+                yield line_number, _clean(row), None
+    finally:
+        # Don't let the wrapper close the caller's file
+        text.detach()
+
+
+def _clean(row):
+    # Blank cells mean "not provided", not an empty string
+    return {
+        key.strip(): value.strip() if isinstance(value, str) else value
+        for key, value in row.items()
+        if key and value not in ('', None)
+    }
+
+
+class ImportResult:
+    def __init__(self, max_errors):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def add_error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def import_listings(binary_file, file_format, seller, batch_size=DEFAULT_BATCH_SIZE,
+                    on_error=None, max_errors=100):
+    """
+    Imports every valid row for `seller`. `on_error(line, errors)` is called
+    for each rejected row (e.g. to stream a report to disk); the returned
+    ImportResult keeps at most `max_errors` of them.
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f'Unsupported format {file_format!r}; use one of {", ".join(FORMATS)}.')
+
+    result = ImportResult(max_errors)
+    batch = []
+
+    def reject(line, errors):
+        result.add_error(line, errors)
+        if on_error:
+            on_error(line, errors)
+
+    def flush():
+        # bulk_create doesn't send post_save, so count the facets and offers (and match searches) here
+        facets = Counter(key for listing in batch for key in listing_facet_keys(listing))
+        with transaction.atomic():
+            Listing.objects.bulk_create(batch)
+            adjust_counts(facets)
+            refresh_isbn_stats(listing.isbn13 for listing in batch)
+            cover_cache.warm_on_commit(listing.cover_image_url for listing in batch)
+            match_on_commit(listing.pk for listing in batch)
+        result.created += len(batch)
+        batch.clear()
+
+    for line, row, error in iter_rows(binary_file, file_format):
+        if error:
+            reject(line, {'non_field_errors': [error]})
+            continue
+        serializer = ListingImportSerializer(data=row)
+        if not serializer.is_valid():
+            reject(line, serializer.errors)
+            continue
+        listing = Listing(seller=seller, **serializer.validated_data)
+        listing.apply_derived_fields()
+        batch.append(listing)
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+    if result.created:
+        # bulk_create doesn't send post_save, so invalidate the feed cache here
+        bump_catalog_version()
+    return result
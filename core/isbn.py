@@ -0,0 +1,45 @@
+# core/isbn.py
+"""
+ISBN canonicalization.
+
+Sellers type ISBNs as ISBN-10 or ISBN-13, with or without hyphens and
+spaces. to_isbn13() maps all of those to one 13-digit string, so every copy
+of an edition shares a key (Listing.isbn13). Input that isn't a valid ISBN
+has no canonical form.
+"""
+
+import re
+
+_SEPARATORS = re.compile(r'[\s\-‐‑–]')
+
+
+def compact(raw):
+    """Strips separators and upper-cases a trailing x."""
+    return _SEPARATORS.sub('', raw or '').upper()
+
+
+def isbn10_check_digit(first9):
+    total = sum((10 - i) * int(d) for i, d in enumerate(first9))
+    check = (11 - total % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+
+def isbn13_check_digit(first12):
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def to_isbn13(raw):
+    """The canonical ISBN-13 for `raw`, or None if it isn't a valid ISBN-10 or ISBN-13."""
+    value = compact(raw)
+    if not value.isascii():
+        # str.isdigit() also accepts digits such as '²', which int() rejects
+        return None
+    if len(value) == 10 and value[:9].isdigit() and (value[9].isdigit() or value[9] == 'X'):
+        if isbn10_check_digit(value[:9]) != value[9]:
+            return None
+        first12 = '978' + value[:9]
+        return first12 + isbn13_check_digit(first12)
+    if len(value) == 13 and value.isdigit() and value[:3] in ('978', '979'):
+        return value if isbn13_check_digit(value[:12]) == value[12] else None
+    return None
@@ -0,0 +1,234 @@
+# core/jobs.py
+"""
+A background job queue kept in the database, so it needs no broker.
+
+enqueue() adds a Job row, in the caller's transaction: work queued by a
+request that rolls back never runs. `manage.py run_workers` runs Workers,
+each of which claims due jobs, calls their handler (JOB_HANDLERS, by dotted
+path) with the job's payload as keyword arguments, and records the outcome.
+
+Claiming has to hand each job to exactly one worker. On PostgreSQL the
+candidates are read with SELECT ... FOR UPDATE SKIP LOCKED, so workers pass
+over each other's rows instead of queueing behind them. SQLite has no row
+locks; there a worker flips its candidates from queued to running with one
+conditional UPDATE and keeps the rows that came back with its name on them.
+Both end with the same UPDATE, so the SQLite scheme is also correct on
+backends that do lock rows.
+
+A failed job is retried after an exponential backoff (JOB_RETRY_DELAY,
+doubling up to JOB_RETRY_MAX_DELAY, with jitter) until it has had
+max_attempts tries. A job whose worker died is requeued once it has been
+running for JOB_LOCK_TIMEOUT seconds, so handlers must be safe to run twice.
+A dedupe key makes enqueueing a no-op while a job with that key is queued
+or running. Finished jobs are kept JOB_KEEP_FINISHED_DAYS for inspection.
+"""
+
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .metrics import JOB_DURATION, JOB_WAIT
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {
+    'covers.warm': 'core.covers.warm_cover',
+    'saved_searches.match': 'core.saved_searches.match_listings',
+}
+# Characters of a traceback kept in last_error
+MAX_ERROR_LENGTH = 4000
+
+
+def build_job(name, payload=None, *, dedupe_key=None, delay=0, run_at=None, max_attempts=None):
+    """An unsaved Job; add_jobs() saves several at once."""
+    if name not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job {name!r}.')
+    return Job(
+        name=name,
+        payload=payload or {},
+        dedupe_key=dedupe_key,
+        run_at=run_at or timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def add_jobs(jobs):
+    # ignore_conflicts: a job whose dedupe key is already queued or running is dropped
+    Job.objects.bulk_create(jobs, ignore_conflicts=True, batch_size=500)
+
+
+def enqueue(name, payload=None, **options):
+    """
+    Queues `name` to run with `payload` (a JSON object of keyword arguments).
+    Options: dedupe_key, delay (seconds) or run_at, max_attempts.
+    """
+    add_jobs([build_job(name, payload, **options)])
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next try, after `attempts` failed ones."""
+    delay = min(settings.JOB_RETRY_DELAY * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.75, 1.25)
+
+
+def claim(worker, limit=1, names=None):
+    """Marks up to `limit` due jobs as running for `worker` and returns them."""
+    now = timezone.now()
+    ready = Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+    if names:
+        ready = ready.filter(name__in=names)
+    ready = ready.order_by('run_at', 'id')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            ready = ready.select_for_update(skip_locked=True)
+        ids = list(ready.values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        Job.objects.filter(pk__in=ids, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+        )
+    # Without row locks another worker may have flipped some of them first
+    return list(Job.objects.filter(pk__in=ids, status=Job.RUNNING, locked_by=worker, locked_at=now).order_by('run_at', 'id'))
+
+
+def run_job(job):
+    """Runs one claimed job and records how it went. Returns True if it succeeded."""
+    JOB_WAIT.observe((job.name,), max((job.locked_at - job.run_at).total_seconds(), 0))
+    started = time.perf_counter()
+    try:
+        import_string(JOB_HANDLERS[job.name])(**job.payload)
+    except Exception:
+        JOB_DURATION.observe((job.name, 'error'), time.perf_counter() - started)
+        fail(job, traceback.format_exc())
+        return False
+    JOB_DURATION.observe((job.name, 'ok'), time.perf_counter() - started)
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+        status=Job.DONE, finished_at=timezone.now(), last_error='',
+    )
+    return True
+
+
+def fail(job, error):
+    error = error[-MAX_ERROR_LENGTH:]
+    mine = Job.objects.filter(pk=job.pk, locked_by=job.locked_by, status=Job.RUNNING)
+    if job.attempts >= job.max_attempts:
+        logger.error('Job %s failed for good after %d attempts:\n%s', job, job.attempts, error)
+        mine.update(status=Job.FAILED, finished_at=timezone.now(), last_error=error)
+    else:
+        logger.warning('Job %s failed (attempt %d of %d), retrying:\n%s', job, job.attempts, job.max_attempts, error)
+        run_at = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+        mine.update(status=Job.QUEUED, run_at=run_at, locked_by='', locked_at=None, last_error=error)
+
+
+def requeue_stale():
+    """Puts jobs whose worker stopped answering back in the queue. Returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff)
+    error = 'Worker stopped before finishing the job.'
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, finished_at=timezone.now(), last_error=error,
+    )
+    return failed + stale.update(status=Job.QUEUED, run_at=timezone.now(), locked_by='', locked_at=None, last_error=error)
+
+
+def purge_finished():
+    """Deletes jobs that finished more than JOB_KEEP_FINISHED_DAYS ago."""
+    cutoff = timezone.now() - timedelta(days=settings.JOB_KEEP_FINISHED_DAYS)
+    deleted, _ = Job.objects.filter(status__in=[Job.DONE, Job.FAILED], finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def queue_stats():
+    """
+    {(name, status): (jobs, seconds the oldest due one has waited)} for jobs
+    not yet done, for /metrics. The wait is 0 for running and failed jobs.
+    """
+    now = timezone.now()
+    rows = (
+        Job.objects.filter(status__in=[Job.QUEUED, Job.RUNNING, Job.FAILED])
+        .values('name', 'status')
+        .annotate(jobs=Count('id'), oldest=Min('run_at', filter=Q(status=Job.QUEUED, run_at__lte=now)))
+        .order_by()
+    )
+    return {
+        (row['name'], row['status']): (row['jobs'], (now - row['oldest']).total_seconds() if row['oldest'] else 0.0)
+        for row in rows
+    }
+
+
+def worker_name(index=0):
+    return f'{socket.gethostname()}:{os.getpid()}:{index}'[:100]
+
+
+class Worker:
+    """Claims and runs jobs until stop is set (or, with burst, until none are due)."""
+
+    def __init__(self, name, stop, names=None, batch_size=None, poll_interval=None, burst=False):
+        self.name = name
+        self.stop = stop
+        self.names = names
+        self.batch_size = batch_size or settings.JOB_BATCH_SIZE
+        self.poll_interval = settings.JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.burst = burst
+        self.processed = 0
+
+    def run_once(self):
+        """Claims one batch and runs it. Returns the number of jobs run."""
+        try:
+            jobs = claim(self.name, self.batch_size, self.names)
+            for job in jobs:
+                run_job(job)
+            self.processed += len(jobs)
+            return len(jobs)
+        finally:
+            close_old_connections()
+
+    def run(self):
+        while not self.stop.is_set():
+            try:
+                ran = self.run_once()
+            except Exception:
+                # A database hiccup shouldn't kill the worker; its claimed jobs come back via requeue_stale()
+                logger.exception('Worker %s could not process jobs', self.name)
+                ran = 0
+            if not ran:
+                if self.burst:
+                    return
+                self.stop.wait(self.poll_interval)
+
+
+def run_workers(threads=1, names=None, burst=False, poll_interval=None, stop=None):
+    """Runs `threads` Workers in this process until `stop` is set. Returns the number of jobs run."""
+    stop = stop or threading.Event()
+    requeue_stale()
+    purge_finished()
+    workers = [Worker(worker_name(i), stop, names, poll_interval=poll_interval, burst=burst) for i in range(threads)]
+    pool = [threading.Thread(target=worker.run, name=f'job-worker-{i}', daemon=True) for i, worker in enumerate(workers)]
+    for thread in pool:
+        thread.start()
+    # Housekeeping on the main thread until the workers are done
+    while any(thread.is_alive() for thread in pool):
+        if burst or stop.wait(min(settings.JOB_LOCK_TIMEOUT / 2, 60)):
+            break
+        try:
+            requeue_stale()
+            purge_finished()
+        except Exception:
+            logger.exception('Job housekeeping failed')
+        finally:
+            close_old_connections()
+    for thread in pool:
+        thread.join()
+    return sum(worker.processed for worker in workers)
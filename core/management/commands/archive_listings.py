@@ -0,0 +1,26 @@
+# core/management/commands/archive_listings.py
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.archive import archivable, archive_listings
+
+
+class Command(BaseCommand):
+    help = 'Moves listings that have been deleted or sold for a while into the listing archive. Safe to run from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.LISTING_ARCHIVE_AFTER_DAYS,
+                            help='Archive listings inactive for longer than this.')
+        parser.add_argument('--batch-size', type=int, default=settings.LISTING_ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived.')
+
+    def handle(self, *args, **options):
+        older_than = timedelta(days=options['days'])
+        if options['dry_run']:
+            self.stdout.write(f'{archivable(older_than).count()} listings would be archived.')
+            return
+        archived = archive_listings(older_than, batch_size=options['batch_size'])
+        self.stdout.write(f'Archived {archived} listings.')
@@ -0,0 +1,50 @@
+# core/management/commands/bench_auth.py
+
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.authentication import CachedTokenAuthentication, token_cache
+
+
+class Command(BaseCommand):
+    help = 'Compares queries and latency per request for token vs cached token authentication.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        # Throwaway user and token, rolled back at the end
+        with transaction.atomic():
+            user = get_user_model().objects.create_user('bench-auth', 'bench-auth@example.invalid', 'x')
+            key = Token.objects.create(user=user).key
+            token_cache.clear()
+            for auth_class in (TokenAuthentication, CachedTokenAuthentication):
+                queries, seconds = self.run(auth_class(), key, count)
+                self.stdout.write(
+                    f'{auth_class.__name__:<28} {queries / count:.2f} queries/request  '
+                    f'{seconds / count * 1000:.3f} ms/request'
+                )
+            self.stdout.write(f'cache hits={token_cache.hits} misses={token_cache.misses}')
+            transaction.set_rollback(True)
+
+    def run(self, authenticator, key, count):
+        factory = APIRequestFactory()
+        requests = [
+            Request(factory.get('/api/listings/', HTTP_AUTHORIZATION=f'Token {key}'))
+            for _ in range(count)
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            for request in requests:
+                authenticator.authenticate(request)
+            seconds = time.perf_counter() - started
+        return len(ctx.captured_queries), seconds
@@ -0,0 +1,334 @@
+# core/management/commands/bench_bookswap.py
+
+import hashlib
+import io
+import json
+import logging
+import math
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core import urls as core_urls
+from core.cache import bump_catalog_version
+from core.covers import storage as cover_storage, storage_path
+from core.facets import rebuild_facet_counts
+from core.models import Conversation, IsbnMetadata, IsbnPriceStats, Listing, Message
+
+PASSWORD = 'bench-password'
+# Created under --prefix; the first is the client every authenticated request comes from
+BENCH_USERS = ['client', 'partner', 'exporter']
+BENCH_ISBNS = [f'97900000000{i:02d}' for i in range(10)]
+SEARCHES = ['calculus', 'algorithms', 'intro', 'economics', 'history', 'MATH 101']
+FEEDS = ['', '?sort=price_asc', '?category=STEM', '?condition=GOOD&max_price=40', '?sort=price_desc&category=Art']
+FACETS = ['', '?category=STEM', '?q=calculus', '?min_price=10&max_price=50']
+BENCH_COVER = b'bench-cover' * 2000
+BENCH_COVER_NAME = hashlib.sha256(BENCH_COVER).hexdigest() + '-M.jpg'
+
+# Endpoints that can't be driven meaningfully with a request/response client
+SKIPPED = {
+    'message-stream': 'long-lived SSE stream; measure with a real EventSource client',
+    'listing-list': 'same URL as "listings", which shadows it',
+    'throttle-stats': 'admin-only counters',
+    'metrics': 'admin-only counters',
+}
+
+
+def endpoint_names(patterns=None, namespace=''):
+    """Every named route in core/urls.py, including the router's and included apps'."""
+    names = []
+    for pattern in core_urls.urlpatterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            inner = f'{namespace}{pattern.namespace}:' if pattern.namespace else namespace
+            names += endpoint_names(pattern.url_patterns, inner)
+        elif pattern.name:
+            names.append(namespace + pattern.name)
+    return list(dict.fromkeys(names))
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Drives every endpoint in core/urls.py with the Django test client from several '
+        'threads and reports latency percentiles, throughput and query counts as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint.')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--endpoint', action='append', help='Only these url names (repeatable).')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout.')
+        parser.add_argument('--prefix', default='bench-', help='Username prefix for the throwaway bench users.')
+        parser.add_argument('--throttle', action='store_true', help='Leave per-client throttling on.')
+
+    def handle(self, *args, **options):
+        names = endpoint_names()
+        selected = options['endpoint'] or names
+        unknown = set(selected) - set(names)
+        if unknown:
+            raise CommandError(f'Unknown endpoint(s): {", ".join(sorted(unknown))}')
+        if not Listing.objects.filter(is_active=True).exists():
+            raise CommandError('No active listings to benchmark against; run seed_bookswap first.')
+
+        self.prefix = options['prefix']
+        self.requests = options['requests']
+        # Failed requests are counted in the report; don't also log each one
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        # Every bench request comes from one client, which the throttles would stop
+        throttling = {} if options['throttle'] else {'THROTTLE_RATES': {}}
+        # Only the users this run creates are deleted afterwards, so never adopt existing ones
+        taken = get_user_model().objects.filter(username__in=[self.prefix + name for name in BENCH_USERS])
+        if taken.exists():
+            raise CommandError(
+                f'Users {", ".join(taken.values_list("username", flat=True))} already exist; pass another --prefix.'
+            )
+        self.created_users = []
+        self.registered = []
+        try:
+            with override_settings(**throttling):
+                self.prepare()
+                report = {'meta': self.meta(options), 'endpoints': {}, 'skipped': {}}
+                for name in selected:
+                    scenario = getattr(self, 'scenario_' + name.replace('-', '_').replace(':', '__'), None)
+                    if name in SKIPPED or scenario is None:
+                        report['skipped'][name] = SKIPPED.get(name, 'no scenario')
+                        continue
+                    report['endpoints'][name] = self.run(scenario, self.requests, options['threads'])
+                    self.stderr.write(f'{name:<24} {self.summary(report["endpoints"][name])}')
+        finally:
+            self.cleanup()
+            request_logger.setLevel(level)
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    # Fixtures
+
+    def prepare(self):
+        User = get_user_model()
+        self.user, partner, exporter = (
+            User.objects.create_user(
+                self.prefix + name, f'{self.prefix}{name}@example.invalid', PASSWORD, is_staff=name == 'exporter'
+            )
+            for name in BENCH_USERS
+        )
+        self.created_users += [self.user.pk, partner.pk, exporter.pk]
+        self.auth = {'Authorization': f'Token {Token.objects.create(user=self.user).key}'}
+        self.export_auth = {'Authorization': f'Token {Token.objects.create(user=exporter).key}'}
+
+        listing = Listing.objects.create(
+            seller=partner, title='Bench Listing', author='Bench', price=Decimal('20.00'), condition='GOOD', category='STEM'
+        )
+        self.conversation = Conversation.objects.create(listing=listing, buyer=self.user, seller=partner)
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, sender=self.user if i % 2 else partner, content=f'Message {i}')
+            for i in range(60)
+        ])
+        self.last_message_id = self.conversation.messages.order_by('-id').values_list('id', flat=True).first()
+
+        # One listing per delete request; bulk_create skips facet signals, rebuilt in cleanup()
+        self.doomed = [listing.pk for listing in Listing.objects.bulk_create([
+            Listing(seller=self.user, title=f'Doomed {i}', author='Bench', price=Decimal('5.00'), condition='POOR', category='General')
+            for i in range(self.requests)
+        ])]
+        self.detail_ids = list(Listing.objects.filter(is_active=True).values_list('id', flat=True)[:100])
+        # Books with the most offers, plus one nobody sells
+        self.offer_isbns = list(IsbnPriceStats.objects.order_by('-count').values_list('isbn13', flat=True)[:20])
+        self.offer_isbns.append('9780000000002')
+
+        now = timezone.now()
+        for isbn in BENCH_ISBNS:
+            # Served from the metadata table, so the bench never calls Google
+            IsbnMetadata.objects.update_or_create(isbn=isbn, defaults={
+                'found': True, 'fetched_at': now, 'expires_at': now + timedelta(days=1),
+                'data': {'title': 'Bench Book', 'author': 'Bench', 'cover_image_url': '', 'isbn': isbn},
+            })
+        # Served straight from the cover cache directory
+        files = cover_storage()
+        if not files.exists(storage_path(BENCH_COVER_NAME)):
+            files.save(storage_path(BENCH_COVER_NAME), ContentFile(BENCH_COVER))
+
+    def cleanup(self):
+        User = get_user_model()
+        # Listings, conversations, messages and tokens go with the users
+        User.objects.filter(Q(pk__in=self.created_users) | Q(username__in=self.registered)).delete()
+        IsbnMetadata.objects.filter(isbn__in=BENCH_ISBNS).delete()
+        cover_storage().delete(storage_path(BENCH_COVER_NAME))
+        rebuild_facet_counts()
+        bump_catalog_version()
+
+    def meta(self, options):
+        return {
+            'database': connection.vendor,
+            'threads': options['threads'],
+            'requests_per_endpoint': self.requests,
+            'listings': Listing.objects.count(),
+            'users': get_user_model().objects.count(),
+            'messages': Message.objects.count(),
+        }
+
+    # Runner
+
+    def run(self, scenario, requests, threads):
+        lock = threading.Lock()
+        issued = iter(range(requests))
+        samples = []
+
+        def worker():
+            client = Client(HTTP_HOST='localhost', raise_request_exception=False)
+            mine = []
+            try:
+                while True:
+                    with lock:
+                        i = next(issued, None)
+                    if i is None:
+                        break
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        response = scenario(client, i)
+                        if response.streaming:
+                            b''.join(response.streaming_content)
+                        elapsed = time.perf_counter() - started
+                    mine.append((elapsed, response.status_code, len(queries.captured_queries)))
+            finally:
+                connection.close()
+                with lock:
+                    samples.extend(mine)
+
+        started = time.perf_counter()
+        workers = [threading.Thread(target=worker) for _ in range(max(1, threads))]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        latencies = sorted(sample[0] * 1000 for sample in samples)
+        queries = [sample[2] for sample in samples]
+        statuses = Counter(str(sample[1]) for sample in samples)
+        return {
+            'requests': len(samples),
+            'errors': sum(1 for sample in samples if sample[1] >= 500),
+            'status': dict(statuses),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'throughput_rps': round(len(samples) / wall, 1),
+            'queries_mean': round(sum(queries) / len(queries), 2),
+            'queries_max': max(queries),
+        }
+
+    def summary(self, result):
+        return (
+            f'p50 {result["p50_ms"]:>8.2f}ms  p95 {result["p95_ms"]:>8.2f}ms  p99 {result["p99_ms"]:>8.2f}ms  '
+            f'{result["throughput_rps"]:>8.1f} req/s  {result["queries_mean"]:.1f} queries  {result["status"]}'
+        )
+
+    # Scenarios, one per url name
+
+    def scenario_home(self, client, i):
+        return client.get('/')
+
+    def scenario_login(self, client, i):
+        return client.post('/api/login/', {'username': self.user.username, 'password': PASSWORD})
+
+    def scenario_register(self, client, i):
+        username = f'{self.prefix}reg{i}'
+        response = client.post('/api/register/', {'username': username, 'password': PASSWORD})
+        if response.status_code == 201:
+            self.registered.append(username)
+        return response
+
+    def scenario_lookup(self, client, i):
+        return client.get('/api/books/lookup/', {'isbn': BENCH_ISBNS[i % len(BENCH_ISBNS)]})
+
+    def scenario_lookup_batch(self, client, i):
+        isbns = [BENCH_ISBNS[(i + n) % len(BENCH_ISBNS)] for n in range(5)]
+        return client.post('/api/books/lookup/batch/', {'isbns': isbns}, content_type='application/json')
+
+    def scenario_listings(self, client, i):
+        return client.get('/api/listings/' + FEEDS[i % len(FEEDS)])
+
+    def scenario_search(self, client, i):
+        return client.get('/api/listings/search/', {'q': SEARCHES[i % len(SEARCHES)]})
+
+    def scenario_facets(self, client, i):
+        return client.get('/api/listings/facets/' + FACETS[i % len(FACETS)])
+
+    def scenario_create(self, client, i):
+        payload = {'title': f'Bench Create {i}', 'author': 'Bench', 'price': '12.50', 'condition': 'GOOD', 'category': 'STEM'}
+        return client.post('/api/listings/create/', payload, content_type='application/json', headers=self.auth)
+
+    def scenario_import(self, client, i):
+        rows = ''.join(f'Bench Import {i}-{n},Bench,GOOD,9.99,General\n' for n in range(5))
+        upload = io.BytesIO(f'title,author,condition,price,category\n{rows}'.encode())
+        upload.name = 'bench.csv'
+        return client.post('/api/listings/import/', {'file': upload}, headers=self.auth)
+
+    def scenario_export(self, client, i):
+        # Full catalog each time; the runner drains the stream
+        return client.get('/api/listings/export/', headers=self.export_auth)
+
+    def scenario_delete(self, client, i):
+        return client.delete(f'/api/listings/delete/{self.doomed[i % len(self.doomed)]}/', headers=self.auth)
+
+    def scenario_cover(self, client, i):
+        # Every other request revalidates, as a browser with the file cached would
+        headers = {'If-None-Match': f'"{BENCH_COVER_NAME[:-4]}"'} if i % 2 else {}
+        return client.get(f'/api/covers/{BENCH_COVER_NAME}', headers=headers)
+
+    def scenario_conversations(self, client, i):
+        return client.get('/api/conversations/', headers=self.auth)
+
+    def scenario_messages(self, client, i):
+        return client.get(f'/api/conversations/{self.conversation.pk}/messages/', headers=self.auth)
+
+    def scenario_message_poll(self, client, i):
+        params = {'since': self.last_message_id, 'timeout': 0}
+        return client.get(f'/api/conversations/{self.conversation.pk}/poll/', params, headers=self.auth)
+
+    def scenario_listing_detail(self, client, i):
+        return client.get(f'/api/listings/{self.detail_ids[i % len(self.detail_ids)]}/')
+
+    def scenario_book_offers(self, client, i):
+        return client.get(f'/api/books/{self.offer_isbns[i % len(self.offer_isbns)]}/offers/')
+
+    def scenario_book_prices(self, client, i):
+        return client.get(f'/api/books/{self.offer_isbns[i % len(self.offer_isbns)]}/prices/')
+
+    def scenario_listing_related(self, client, i):
+        return client.get(f'/api/listings/{self.detail_ids[i % len(self.detail_ids)]}/related/')
+
+    def scenario_api_root(self, client, i):
+        return client.get('/api/', headers={'Accept': 'application/json'})
+
+    def scenario_rest_framework__login(self, client, i):
+        return client.get('/api-auth/login/')
+
+    def scenario_rest_framework__logout(self, client, i):
+        return client.post('/api-auth/logout/')
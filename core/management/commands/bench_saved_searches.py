@@ -0,0 +1,116 @@
+# core/management/commands/bench_saved_searches.py
+
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.isbn import to_isbn13
+from core.models import Listing, SavedSearch
+from core.saved_searches import LISTING_FIELDS, find_matches, row_keys
+
+SUBJECTS = (
+    'calculus algebra physics chemistry biology economics accounting marketing statistics '
+    'literature history philosophy psychology sociology anatomy organic linear discrete '
+    'introduction principles fundamentals advanced modern applied theory methods analysis'
+).split()
+# A catalog-sized vocabulary: each subject in many variants (titles, authors, editions)
+WORDS = SUBJECTS + [f'{subject}{n}' for subject in SUBJECTS for n in range(60)]
+COURSES = [f'{subject} {number}' for subject in ('MATH', 'CS', 'ECON', 'ENG', 'BIO', 'CHEM', 'PHYS', 'ART')
+           for number in range(100, 400, 5)]
+
+
+class Command(BaseCommand):
+    help = 'Times matching new listings against saved searches: anchor index vs checking every search.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--searches', type=int, default=100000)
+        parser.add_argument('--listings', type=int, default=200, help='Listings matched through the index.')
+        parser.add_argument('--scan-listings', type=int, default=5, help='Listings matched by scanning every search.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Editions both sides draw from, so some ISBN searches do match
+        self.isbns = [self.isbn(rng) for _ in range(max(options['searches'] // 20, 1))]
+        # Throwaway searches and listings, rolled back at the end
+        with transaction.atomic():
+            self.fill(rng, options['searches'])
+            rows = self.listings(rng, options['listings'])
+            if not rows:
+                raise CommandError('No listings to match.')
+
+            started = time.perf_counter()
+            indexed = [find_matches([row]) for row in rows]
+            per_listing = (time.perf_counter() - started) / len(rows)
+
+            searches = list(SavedSearch.objects.all())
+            scanned = rows[:options['scan_listings']]
+            started = time.perf_counter()
+            for row, expected in zip(scanned, indexed):
+                keys = row_keys(row)
+                found = [search for search in searches
+                         if search.user_id != row['seller_id'] and search.accepts(keys, row['price'])]
+                if {search.pk for search in found} != {search.pk for search, _ in expected}:
+                    raise CommandError(f'Anchor index and full scan disagree on listing {row["id"]}.')
+            scan = (time.perf_counter() - started) / max(len(scanned), 1)
+
+            matched = sum(len(found) for found in indexed)
+            self.stdout.write(
+                f'{options["searches"]} saved searches, {len(rows)} listings, {matched / len(rows):.1f} matches/listing\n'
+                f'anchor index  {per_listing * 1000:>9.2f} ms/listing\n'
+                f'full scan     {scan * 1000:>9.2f} ms/listing ({len(scanned)} listings, search load not counted)'
+            )
+            transaction.set_rollback(True)
+
+    def fill(self, rng, count):
+        users = [
+            get_user_model().objects.create_user(f'bench-search-{i}', f'bench-search-{i}@example.invalid', None)
+            for i in range(50)
+        ]
+        categories = [code for code, _ in Listing.CATEGORY_CHOICES]
+        searches = []
+        for i in range(count):
+            kind = i % 4
+            search = SavedSearch(user=users[i % len(users)])
+            if kind == 0:
+                search.isbn13 = rng.choice(self.isbns)
+            elif kind == 1:
+                search.course_code = rng.choice(COURSES)
+            elif kind == 2:
+                search.query = ' '.join(rng.sample(WORDS, rng.randint(1, 3)))
+            else:
+                search.query = rng.choice(WORDS)
+                search.category = rng.choice(categories)
+                search.max_price = Decimal(rng.randint(10, 80))
+            search.apply_derived_fields()
+            searches.append(search)
+        SavedSearch.objects.bulk_create(searches, batch_size=1000)
+
+    def isbn(self, rng):
+        digits = f'978{rng.randrange(10 ** 9):09d}'
+        check = (10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10
+        return f'{digits}{check}'
+
+    def listings(self, rng, count):
+        seller = get_user_model().objects.create_user('bench-search-seller', 'bench-search-seller@example.invalid', None)
+        categories = [code for code, _ in Listing.CATEGORY_CHOICES]
+        listings = Listing.objects.bulk_create([
+            Listing(
+                seller=seller,
+                title=' '.join(rng.sample(WORDS, 3)).title(),
+                author='Bench Author',
+                isbn=rng.choice(self.isbns),
+                price=Decimal(rng.randint(5, 100)),
+                condition='GOOD',
+                category=rng.choice(categories),
+                course_code=rng.choice(COURSES),
+            )
+            for _ in range(count)
+        ])
+        for listing in listings:
+            listing.isbn13 = to_isbn13(listing.isbn)
+        return [{field: getattr(listing, field) for field in LISTING_FIELDS} for listing in listings]
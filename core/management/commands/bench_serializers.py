@@ -0,0 +1,76 @@
+# core/management/commands/bench_serializers.py
+
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from core.fastpath import listing_fast_path
+from core.models import Listing
+from core.serializers import ListingSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compares ListingSerializer with the values() fast path at several page sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+        parser.add_argument('--repeat', type=int, default=5, help='Best of N runs is reported.')
+
+    def handle(self, *args, **options):
+        sizes = options['sizes']
+        # Throwaway rows if the catalog is too small, rolled back at the end
+        with transaction.atomic():
+            missing = max(sizes) - Listing.objects.count()
+            if missing > 0:
+                self.fill(missing)
+            renderer = JSONRenderer()
+            self.stdout.write(
+                f'{"rows":>7}  {"serialize+render":>30}  {"with query":>30}\n'
+                f'{"":>7}  {"serializer":>10} {"fast path":>10} {"":>8}  {"serializer":>10} {"fast path":>10}'
+            )
+            for size in sizes:
+                queryset = Listing.objects.select_related('seller').order_by('-created_at', '-id')[:size]
+                instances, rows = list(queryset), list(listing_fast_path.values(queryset))
+
+                slow_body, slow = self.best(options['repeat'], lambda: renderer.render(
+                    ListingSerializer(instances, many=True).data
+                ))
+                fast_body, fast = self.best(options['repeat'], lambda: renderer.render(
+                    listing_fast_path.serialize(rows)
+                ))
+                if fast_body != slow_body:
+                    raise CommandError(f'Fast path output differs from ListingSerializer at {size} rows.')
+                _, slow_total = self.best(options['repeat'], lambda: renderer.render(
+                    ListingSerializer(queryset.all(), many=True).data
+                ))
+                _, fast_total = self.best(options['repeat'], lambda: renderer.render(
+                    listing_fast_path.serialize(listing_fast_path.values(queryset.all()))
+                ))
+                self.stdout.write(
+                    f'{size:>7}  {slow * 1000:>8.2f}ms {fast * 1000:>8.2f}ms {slow / fast:>7.1f}x'
+                    f'  {slow_total * 1000:>8.2f}ms {fast_total * 1000:>8.2f}ms {slow_total / fast_total:>7.1f}x'
+                )
+            transaction.set_rollback(True)
+
+    def best(self, repeat, run):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            body = run()
+            timings.append(time.perf_counter() - started)
+        return body, min(timings)
+
+    def fill(self, count):
+        seller = get_user_model().objects.create_user('bench-serializers', 'bench-serializers@example.invalid', 'x')
+        Listing.objects.bulk_create(
+            [
+                Listing(seller=seller, title=f'Bench Book {i}', author='Bench', isbn=f'978{i:010d}',
+                        price=Decimal(i % 20000) / 100, condition='GOOD', category='STEM')
+                for i in range(count)
+            ],
+            batch_size=1000,
+        )
@@ -0,0 +1,39 @@
+# core/management/commands/build_related.py
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.cache import bump_catalog_version
+
+
+class Command(BaseCommand):
+    help = (
+        'Precomputes "related books" for every active listing. By default only catches up with '
+        'listings added or taken off the market since the last run; safe to run from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Rescore the whole catalog, e.g. nightly or after titles were edited.')
+        parser.add_argument('--top-k', type=int, default=settings.RELATED_LISTINGS_TOP_K)
+        parser.add_argument('--min-score', type=float, default=settings.RELATED_LISTINGS_MIN_SCORE)
+
+    def handle(self, *args, **options):
+        try:
+            from core.related import build_related, update_related
+        except ImportError as exc:
+            if exc.name != 'numpy':
+                raise
+            raise CommandError('build_related needs NumPy: pip install numpy')
+
+        started = time.perf_counter()
+        if options['full']:
+            count = build_related(options['top_k'], options['min_score'])
+            summary = f'Scored {count} listings'
+        else:
+            rebuilt, extended = update_related(options['top_k'], options['min_score'])
+            summary = f'Rebuilt {rebuilt} lists and extended {extended}'
+        bump_catalog_version()
+        self.stdout.write(f'{summary} in {time.perf_counter() - started:.1f}s.')
@@ -0,0 +1,41 @@
+# core/management/commands/export_listings.py
+
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.export import FORMATS, export_listings, parse_since
+
+
+class Command(BaseCommand):
+    help = 'Streams the listing catalog to a file (or stdout) as JSON lines or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Defaults to stdout.')
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--updated-since', help='ISO date or datetime; only rows changed since then, inactive included.')
+        parser.add_argument('--include-inactive', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=settings.EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        updated_since = None
+        if options['updated_since']:
+            try:
+                updated_since = parse_since(options['updated_since'])
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        chunks = export_listings(
+            options['format'], gzip=options['gzip'], updated_since=updated_since,
+            include_inactive=options['include_inactive'], chunk_size=options['chunk_size'],
+        )
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
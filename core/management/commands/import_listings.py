@@ -0,0 +1,50 @@
+# core/management/commands/import_listings.py
+
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importer import DEFAULT_BATCH_SIZE, FORMATS, guess_format, import_listings
+
+
+class Command(BaseCommand):
+    help = 'Bulk-imports listings from a CSV or JSONL file for one seller.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import.')
+        parser.add_argument('--seller', required=True, help='Username that will own the listings.')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--report', help='Write rejected rows here as JSON lines.')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            seller = User.objects.get(username=options['seller'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user named {options["seller"]!r}.')
+
+        file_format = options['format'] or guess_format(options['path'])
+        if not file_format:
+            raise CommandError('Could not tell the file format; pass --format.')
+
+        report = open(options['report'], 'w') if options['report'] else None
+
+        def on_error(line, errors):
+            if report:
+                report.write(json.dumps({'line': line, 'errors': errors}) + '\n')
+
+        try:
+            with open(options['path'], 'rb') as source:
+                result = import_listings(
+                    source, file_format, seller,
+                    batch_size=options['batch_size'], on_error=on_error, max_errors=0,
+                )
+        finally:
+            if report:
+                report.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created} listings, rejected {result.failed} rows.'
+        ))
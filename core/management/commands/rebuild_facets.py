@@ -0,0 +1,15 @@
+# core/management/commands/rebuild_facets.py
+
+from django.core.management.base import BaseCommand
+
+from core.cache import bump_catalog_version
+from core.facets import rebuild_facet_counts
+
+
+class Command(BaseCommand):
+    help = 'Recounts the listing facet counters, e.g. after bulk updates that skipped signals.'
+
+    def handle(self, *args, **options):
+        counts = rebuild_facet_counts()
+        bump_catalog_version()
+        self.stdout.write(f'Counted {counts["total"]} active listings.')
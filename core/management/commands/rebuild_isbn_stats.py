@@ -0,0 +1,12 @@
+# core/management/commands/rebuild_isbn_stats.py
+
+from django.core.management.base import BaseCommand
+
+from core.offers import rebuild_isbn_stats
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the per-ISBN price stats, e.g. after bulk updates that skipped signals.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Summarized {rebuild_isbn_stats()} ISBNs with active offers.')
@@ -0,0 +1,93 @@
+# core/management/commands/run_workers.py
+
+import multiprocessing
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.jobs import JOB_HANDLERS, run_workers
+from core.metrics import render_metrics
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port):
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='job-metrics', daemon=True).start()
+    return server
+
+
+def run_process(options, metrics_port):
+    """Entry point of each worker process."""
+    django.setup()
+    stop = threading.Event()
+    # Finish the jobs in hand, then exit
+    previous = {signum: signal.signal(signum, lambda *args: stop.set()) for signum in (signal.SIGINT, signal.SIGTERM)}
+    server = serve_metrics(metrics_port) if metrics_port else None
+    try:
+        return run_workers(stop=stop, **options)
+    finally:
+        if server:
+            server.shutdown()
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+
+
+class Command(BaseCommand):
+    help = 'Runs background jobs (see core/jobs.py) until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.JOB_WORKER_THREADS, help='Worker threads per process.')
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--job', action='append', dest='names', choices=sorted(JOB_HANDLERS),
+                            help='Only run these jobs (repeatable).')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due.')
+        parser.add_argument('--poll-interval', type=float, help='Seconds between polls of an empty queue.')
+        parser.add_argument('--metrics-port', type=int,
+                            help='Serve Prometheus metrics on this port; process n of several uses port + n.')
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['processes'] < 1:
+            raise CommandError('--threads and --processes must be at least 1.')
+        worker_options = {
+            'threads': options['threads'], 'names': options['names'],
+            'burst': options['burst'], 'poll_interval': options['poll_interval'],
+        }
+        port = options['metrics_port']
+        if options['processes'] == 1:
+            processed = run_process(worker_options, port)
+            self.stdout.write(f'Ran {processed} jobs.')
+            return
+
+        # Children open their own connections
+        connections.close_all()
+        children = [
+            multiprocessing.Process(target=run_process, args=(worker_options, port and port + i), name=f'job-worker-{i}')
+            for i in range(options['processes'])
+        ]
+        for child in children:
+            child.start()
+        # SIGTERM and Ctrl-C reach the parent; pass them on and wait for the jobs in hand to finish
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: [child.terminate() for child in children if child.is_alive()])
+        for child in children:
+            child.join()
+        failed = [child.name for child in children if child.exitcode]
+        if failed:
+            raise CommandError(f'Worker processes exited with an error: {", ".join(failed)}.')
@@ -0,0 +1,154 @@
+# core/management/commands/seed_bookswap.py
+
+import random
+import re
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.cache import bump_catalog_version
+from core.facets import rebuild_facet_counts
+from core.models import Conversation, Listing, Message
+from core.offers import rebuild_isbn_stats
+
+QUALIFIERS = ['Introduction to', 'Principles of', 'Foundations of', 'Essentials of', 'Advanced', 'Applied', 'Modern']
+SUBJECTS = [
+    ('Calculus', 'STEM', 'MATH'), ('Linear Algebra', 'STEM', 'MATH'), ('Algorithms', 'STEM', 'CS'),
+    ('Operating Systems', 'STEM', 'CS'), ('Organic Chemistry', 'STEM', 'CHEM'), ('Physics', 'STEM', 'PHYS'),
+    ('Microeconomics', 'Business & Econs', 'ECON'), ('Accounting', 'Business & Econs', 'ACCT'),
+    ('Marketing', 'Business & Econs', 'MKTG'), ('World History', 'Humanities', 'HIST'),
+    ('Philosophy', 'Humanities', 'PHIL'), ('English Literature', 'Humanities', 'ENG'),
+    ('Art History', 'Art', 'ART'), ('Graphic Design', 'Art', 'DES'), ('Music Theory', 'Art', 'MUS'),
+    ('Study Skills', 'General', 'GEN'),
+]
+FIRST_NAMES = ['James', 'Maria', 'Wei', 'Aisha', 'David', 'Sofia', 'Kenji', 'Elena', 'Omar', 'Grace']
+LAST_NAMES = ['Stewart', 'Cormen', 'Mankiw', 'Greenblatt', 'Gardner', 'Nguyen', 'Okafor', 'Silva', 'Kim', 'Novak']
+CONDITIONS = [code for code, _ in Listing.CONDITION_CHOICES]
+MESSAGES = [
+    'Is this still available?', 'Could you do a lower price?', 'Yes, still available.',
+    'Can we meet at the library?', 'Does it have any highlighting?', 'Deal, see you tomorrow.',
+]
+
+
+def isbn13(rng):
+    digits = [9, 7, 8] + [rng.randrange(10) for _ in range(9)]
+    check = (10 - sum(d * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10
+    return ''.join(map(str, digits + [check]))
+
+
+class Command(BaseCommand):
+    help = 'Bulk-generates deterministic users, listings, conversations and messages for benchmarking.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--listings', type=int, default=1000)
+        parser.add_argument('--conversations', type=int, default=200)
+        parser.add_argument('--messages', type=int, default=1000, help='Total, spread over the conversations.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='seed', help='Username prefix for generated users.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--clear', action='store_true', help='Delete users (and their data) from an earlier run first.')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        prefix, batch_size = options['prefix'], options['batch_size']
+        # Exactly the users make_users() generates, so real accounts that share the prefix are left alone
+        existing = User.objects.filter(
+            username__regex=rf'^{re.escape(prefix)}[0-9]{{6}}$', email__endswith='@example.invalid',
+        )
+        if existing.exists():
+            if not options['clear']:
+                raise CommandError(f'Users seeded under {prefix!r} already exist; pass --clear or another --prefix.')
+            existing.delete()
+
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+        with transaction.atomic():
+            users = self.make_users(User, prefix, options['users'], batch_size)
+            listings = self.make_listings(rng, users, options['listings'], batch_size)
+            conversations = self.make_conversations(rng, users, listings, options['conversations'], batch_size)
+            messages = self.make_messages(rng, conversations, options['messages'], batch_size)
+            # bulk_create skips the signals that keep these current
+            rebuild_facet_counts()
+            rebuild_isbn_stats()
+        bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(users)} users, {len(listings)} listings, {len(conversations)} conversations '
+            f'and {messages} messages in {time.perf_counter() - started:.1f}s.'
+        ))
+
+    def make_users(self, User, prefix, count, batch_size):
+        # Hashing is the slow part of creating users; every seeded user shares one hash
+        password = make_password('password123')
+        users = [
+            User(username=f'{prefix}{i:06d}', email=f'{prefix}{i:06d}@example.invalid', password=password)
+            for i in range(count)
+        ]
+        return User.objects.bulk_create(users, batch_size=batch_size)
+
+    def make_listings(self, rng, users, count, batch_size):
+        if not users:
+            return []
+        batch, created = [], []
+        # About three copies of each edition on the market, as for course textbooks
+        editions = [isbn13(rng) for _ in range(max(1, count // 3))]
+        for _ in range(count):
+            subject, category, department = rng.choice(SUBJECTS)
+            listing = Listing(
+                seller=rng.choice(users),
+                title=f'{rng.choice(QUALIFIERS)} {subject}',
+                author=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                isbn=rng.choice(editions),
+                price=Decimal(rng.randrange(300, 15000)) / 100,
+                condition=rng.choice(CONDITIONS),
+                category=category,
+                course_code=f'{department} {rng.randrange(100, 500)}',
+                is_active=rng.random() < 0.9,
+            )
+            listing.apply_derived_fields()
+            batch.append(listing)
+            if len(batch) >= batch_size:
+                created += Listing.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            created += Listing.objects.bulk_create(batch)
+        return created
+
+    def make_conversations(self, rng, users, listings, count, batch_size):
+        if len(users) < 2 or not listings:
+            return []
+        pairs, conversations = set(), []
+        # Bounded, so a small catalog can't loop forever looking for unused pairs
+        for _ in range(count * 10):
+            if len(conversations) >= count:
+                break
+            listing, buyer = rng.choice(listings), rng.choice(users)
+            if buyer.pk == listing.seller_id or (listing.pk, buyer.pk) in pairs:
+                continue
+            pairs.add((listing.pk, buyer.pk))
+            conversations.append(Conversation(listing=listing, buyer=buyer, seller_id=listing.seller_id))
+        return Conversation.objects.bulk_create(conversations, batch_size=batch_size)
+
+    def make_messages(self, rng, conversations, count, batch_size):
+        if not conversations:
+            return 0
+        batch, created = [], 0
+        for i in range(count):
+            conversation = conversations[i % len(conversations)]
+            batch.append(Message(
+                conversation=conversation,
+                sender_id=conversation.buyer_id if rng.random() < 0.5 else conversation.seller_id,
+                content=rng.choice(MESSAGES),
+                is_read=rng.random() < 0.7,
+            ))
+            if len(batch) >= batch_size:
+                created += len(Message.objects.bulk_create(batch))
+                batch = []
+        if batch:
+            created += len(Message.objects.bulk_create(batch))
+        return created
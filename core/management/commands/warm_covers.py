@@ -0,0 +1,43 @@
+# core/management/commands/warm_covers.py
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import Q
+
+from core.covers import cover_cache, host_allowed, is_local
+from core.models import Listing
+
+
+class Command(BaseCommand):
+    help = 'Caches the remote cover of every active listing, e.g. after an import or for listings created before the cover cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='At most this many distinct covers.')
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        urls = (
+            Listing.objects.filter(is_active=True)
+            .exclude(Q(cover_image_url__isnull=True) | Q(cover_image_url=''))
+            .values_list('cover_image_url', flat=True)
+            .order_by('cover_image_url')
+            .distinct()
+        )
+        urls = [url for url in urls if not is_local(url) and host_allowed(url)][:options['limit']]
+
+        def fetch(url):
+            try:
+                return cover_cache.fetch(url).status
+            finally:
+                close_old_connections()
+
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                statuses = Counter(pool.map(fetch, urls))
+        else:
+            statuses = Counter(cover_cache.fetch(url).status for url in urls)
+        summary = ', '.join(f'{count} {status}' for status, count in sorted(statuses.items())) or 'nothing to do'
+        self.stdout.write(f'{len(urls)} covers: {summary}.')
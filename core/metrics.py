@@ -0,0 +1,263 @@
+# core/metrics.py
+"""
+Per-route request metrics in Prometheus text format.
+
+MetricsMiddleware times each request and files it under its URL route name
+(`listings`, `lookup`, `listing-detail`, ...). While a request runs, a
+context variable points at its RequestStats; a database execute wrapper
+installed on every connection adds query counts and time to it, and
+upstream_timer() adds time spent calling other services. Everything is
+aggregated into fixed-bucket histograms, so a request costs a few
+perf_counter() calls and one lock per histogram.
+
+Metrics are per process, like the other in-process caches and counters:
+under several workers each scrape sees the worker that answered it.
+Streaming responses are timed until the response is returned, not until the
+last chunk is sent. Job timings live in the worker process that ran the job
+(`run_workers --metrics-port`); queue depth is read from the jobs table, so
+any process reports it.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+JOB_WAIT_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+# Most statements kept for one slow-request log entry
+SLOW_LOG_MAX_QUERIES = 200
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labelnames):
+        self.name, self.help, self.buckets, self.labelnames = name, help_text, buckets, labelnames
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then sum and count
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self):
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, values in sorted(series.items()):
+            base = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{base}}} {values[-2]:.6f}')
+            lines.append(f'{self.name}_count{{{base}}} {values[-1]}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_DURATION = Histogram(
+    'bookswap_request_duration_seconds', 'Wall time per request, until the response is returned.',
+    DURATION_BUCKETS, ('route', 'method'),
+)
+REQUEST_QUERIES = Histogram(
+    'bookswap_request_db_queries', 'SQL statements run per request.', QUERY_BUCKETS, ('route', 'method'),
+)
+REQUEST_DB_TIME = Histogram(
+    'bookswap_request_db_seconds', 'Time spent in the database per request.', DURATION_BUCKETS, ('route', 'method'),
+)
+REQUEST_UPSTREAM_TIME = Histogram(
+    'bookswap_request_upstream_seconds', 'Time spent calling other services per request.',
+    DURATION_BUCKETS, ('route', 'method'),
+)
+UPSTREAM_DURATION = Histogram(
+    'bookswap_upstream_call_duration_seconds', 'Outbound HTTP calls, in or out of a request.',
+    DURATION_BUCKETS, ('service',),
+)
+# Observed by whichever process runs the job (see core/jobs.py)
+JOB_WAIT = Histogram(
+    'bookswap_job_wait_seconds', 'Time from a job falling due to a worker claiming it.', JOB_WAIT_BUCKETS, ('job',),
+)
+JOB_DURATION = Histogram(
+    'bookswap_job_duration_seconds', 'Time spent running a job.', DURATION_BUCKETS, ('job', 'outcome'),
+)
+HISTOGRAMS = (
+    REQUEST_DURATION, REQUEST_QUERIES, REQUEST_DB_TIME, REQUEST_UPSTREAM_TIME, UPSTREAM_DURATION, JOB_WAIT, JOB_DURATION,
+)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'upstream_time', 'sql')
+
+    def __init__(self, capture_sql):
+        self.queries = 0
+        self.db_time = 0.0
+        self.upstream_time = 0.0
+        self.sql = [] if capture_sql else None
+
+
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper; installed on every connection by CoreConfig.ready()."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.queries += 1
+        stats.db_time += elapsed
+        if stats.sql is not None and len(stats.sql) < SLOW_LOG_MAX_QUERIES:
+            stats.sql.append((elapsed, sql))
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created receiver."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def upstream_timer(service):
+    """Times an outbound call, charging it to the current request if there is one."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        UPSTREAM_DURATION.observe((service,), elapsed)
+        stats = _current.get()
+        if stats is not None:
+            stats.upstream_time += elapsed
+
+
+class MetricsMiddleware:
+    """Records REQUEST_* histograms for every request. Works under WSGI and ASGI."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        stats, token, started = self._start()
+        try:
+            return self.get_response(request)
+        finally:
+            self._finish(request, stats, token, started)
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        stats, token, started = self._start()
+        try:
+            return await self.get_response(request)
+        finally:
+            self._finish(request, stats, token, started)
+
+    def _start(self):
+        stats = RequestStats(capture_sql=settings.SLOW_REQUEST_THRESHOLD > 0)
+        return stats, _current.set(stats), time.perf_counter()
+
+    def _finish(self, request, stats, token, started):
+        elapsed = time.perf_counter() - started
+        _current.reset(token)
+        match = getattr(request, 'resolver_match', None)
+        # Unmatched paths and odd methods share a label so scanners can't blow up the series count
+        route = match.view_name if match and match.view_name else 'unmatched'
+        labels = (route, request.method if request.method in METHODS else 'other')
+        REQUEST_DURATION.observe(labels, elapsed)
+        REQUEST_QUERIES.observe(labels, stats.queries)
+        REQUEST_DB_TIME.observe(labels, stats.db_time)
+        REQUEST_UPSTREAM_TIME.observe(labels, stats.upstream_time)
+        if stats.sql is not None and elapsed >= settings.SLOW_REQUEST_THRESHOLD:
+            self._log_slow(request, labels[0], elapsed, stats)
+
+    def _log_slow(self, request, route, elapsed, stats):
+        statements = '\n'.join(f'  {seconds * 1000:8.2f}ms  {sql}' for seconds, sql in stats.sql)
+        logger.warning(
+            'Slow request %s %s (%s): %.0fms, %d queries in %.0fms, upstream %.0fms\n%s',
+            request.method, request.path, route, elapsed * 1000, stats.queries,
+            stats.db_time * 1000, stats.upstream_time * 1000, statements,
+        )
+
+
+def _counter(name, help_text, value, kind='counter', labels=''):
+    return [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name}{labels} {value}']
+
+
+def render_metrics():
+    """The Prometheus text exposition for this process."""
+    # Imported here: these modules time their upstream calls with this one
+    from .authentication import token_cache_stats
+    from .books import book_lookup
+    from .broker import get_broker
+    from .jobs import queue_stats
+    from .throttling import throttle_stats
+
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.collect()
+
+    tokens = token_cache_stats()
+    lines += _counter('bookswap_token_cache_hits_total', 'Token authentications served from the cache.', tokens['hits'])
+    lines += _counter('bookswap_token_cache_misses_total', 'Token authentications that hit the database.', tokens['misses'])
+    lines += _counter('bookswap_token_cache_entries', 'Tokens currently cached.', tokens['size'], 'gauge')
+
+    lookups = book_lookup.upstream.stats()
+    lines += _counter('bookswap_book_lookup_cache_hits_total', 'Book lookups answered from memory.', book_lookup.cache.hits)
+    lines += _counter('bookswap_book_lookup_cache_misses_total', 'Book lookups not in memory.', book_lookup.cache.misses)
+    lines += _counter('bookswap_upstream_lookups_in_flight', 'Google Books calls running now.', lookups['in_flight'], 'gauge')
+    lines += _counter('bookswap_upstream_lookups_rejected_total', 'Lookups refused because the upstream was busy.', lookups['rejected'])
+
+    broker = get_broker().stats()  # may be empty for other backends
+    lines += _counter('bookswap_broker_subscribers', 'Open message streams.', broker.get('subscribers', 0), 'gauge')
+    lines += _counter('bookswap_broker_published_total', 'Messages published to the broker.', broker.get('published', 0))
+    lines += _counter('bookswap_broker_dropped_total', 'Messages dropped for slow subscribers.', broker.get('dropped', 0))
+
+    lines += ['# HELP bookswap_throttle_requests_total Throttle decisions per scope.',
+              '# TYPE bookswap_throttle_requests_total counter']
+    for scope, counts in throttle_stats().items():
+        for outcome in ('allowed', 'throttled'):
+            lines.append(f'bookswap_throttle_requests_total{{scope="{_escape(scope)}",outcome="{outcome}"}} {counts[outcome]}')
+
+    # Read from the jobs table, so every process reports the same queue
+    queue = queue_stats()
+    lines += ['# HELP bookswap_jobs Jobs not yet done, per job and status.', '# TYPE bookswap_jobs gauge']
+    for (name, state), (jobs, _) in sorted(queue.items()):
+        lines.append(f'bookswap_jobs{{job="{_escape(name)}",status="{state}"}} {jobs}')
+    lines += ['# HELP bookswap_job_oldest_due_seconds How long the oldest due job has been waiting for a worker.',
+              '# TYPE bookswap_job_oldest_due_seconds gauge']
+    for (name, state), (_, waited) in sorted(queue.items()):
+        if state == 'queued':
+            lines.append(f'bookswap_job_oldest_due_seconds{{job="{_escape(name)}"}} {waited:.3f}')
+    return '\n'.join(lines) + '\n'
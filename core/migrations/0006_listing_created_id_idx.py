@@ -0,0 +1,17 @@
+# Generated by Django 5.2.10 on 2026-10-18 04:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alter_listing_author_alter_listing_condition_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['-created_at', '-id'], name='listing_created_id_idx'),
+        ),
+    ]
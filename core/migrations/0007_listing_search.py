@@ -0,0 +1,33 @@
+# Generated by Django 5.2.10 on 2026-10-18 04:38
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+from . import _helpers
+
+
+def install_search_index(apps, schema_editor):
+    _helpers.install_search_index(schema_editor)
+
+
+def uninstall_search_index(apps, schema_editor):
+    _helpers.uninstall_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_listing_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['isbn'], name='listing_isbn_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(django.db.models.functions.text.Upper('course_code'), name='listing_course_code_upper_idx'),
+        ),
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
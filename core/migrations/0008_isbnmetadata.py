@@ -0,0 +1,24 @@
+# Generated by Django 5.2.10 on 2026-10-18 04:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_listing_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IsbnMetadata',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('isbn', models.CharField(max_length=20, unique=True)),
+                ('found', models.BooleanField(default=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('fetched_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+    ]
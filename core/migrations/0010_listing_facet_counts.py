@@ -0,0 +1,32 @@
+# Generated by Django 5.2.10 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+from ._helpers import rebuild_facet_counts
+
+
+def count_existing_listings(apps, schema_editor):
+    rebuild_facet_counts(apps.get_model('core', 'Listing'), apps.get_model('core', 'ListingFacetCount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_message_read_and_thread_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('facet', 'value'), name='listing_facet_count_unique')],
+            },
+        ),
+        migrations.RunPython(count_existing_listings, migrations.RunPython.noop),
+    ]
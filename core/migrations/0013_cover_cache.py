@@ -0,0 +1,36 @@
+# Generated by Django 5.2.10 on 2026-10-18 05:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_listing_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoverImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_url', models.URLField(unique=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('missing', 'Missing'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('content_type', models.CharField(blank=True, max_length=50)),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('name', models.CharField(blank=True, max_length=80)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('fetched_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='cover_source_url',
+            field=models.URLField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['cover_image_url'], name='listing_cover_url_idx'),
+        ),
+    ]
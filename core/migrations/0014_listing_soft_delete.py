@@ -0,0 +1,79 @@
+# Generated by Django 5.2.10 on 2026-10-18 05:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_deactivated_at(apps, schema_editor):
+    # Listings switched off before this migration: last change is the best guess
+    Listing = apps.get_model('core', 'Listing')
+    Listing.objects.filter(is_active=False, deactivated_at__isnull=True).update(deactivated_at=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_cover_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.TextField()),
+                ('author', models.TextField()),
+                ('isbn', models.CharField(blank=True, max_length=20, null=True)),
+                ('cover_image_url', models.URLField(blank=True, null=True)),
+                ('cover_source_url', models.URLField(blank=True, null=True)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('condition', models.CharField(choices=[('LIKE_NEW', 'Like New'), ('GOOD', 'Good'), ('FAIR', 'Fair'), ('POOR', 'Poor')], max_length=10)),
+                ('category', models.CharField(choices=[('STEM', 'Science & Tech'), ('Business & Econs', 'Business & Econ'), ('Humanities', 'Humanities'), ('Art', 'Arts & Design'), ('General', 'General / Other')], max_length=100)),
+                ('course_code', models.CharField(blank=True, max_length=30, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('deactivated_at', models.DateTimeField(blank=True, null=True)),
+                ('deactivated_reason', models.CharField(blank=True, choices=[('deleted', 'Deleted'), ('sold', 'Sold')], max_length=10)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listing_created_id_idx',
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='deactivated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='deactivated_reason',
+            field=models.CharField(blank=True, choices=[('deleted', 'Deleted'), ('sold', 'Sold')], max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='conversation',
+            name='listing',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.listing'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at', '-id'], name='listing_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_active', False)), fields=['deactivated_at'], name='listing_inactive_idx'),
+        ),
+        migrations.AddField(
+            model_name='listingarchive',
+            name='seller',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_listings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='archived_listing',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.listingarchive'),
+        ),
+        migrations.RunPython(backfill_deactivated_at, migrations.RunPython.noop),
+    ]
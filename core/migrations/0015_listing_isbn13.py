@@ -0,0 +1,51 @@
+# Generated by Django 5.2.10 on 2026-10-18 05:29
+
+from django.db import migrations, models
+
+from ._helpers import rebuild_isbn_stats, to_isbn13
+
+
+def backfill_isbn13(apps, schema_editor):
+    Listing = apps.get_model('core', 'Listing')
+    batch = []
+    for listing in Listing.objects.exclude(isbn__isnull=True).exclude(isbn='').only('id', 'isbn').iterator(chunk_size=2000):
+        listing.isbn13 = to_isbn13(listing.isbn)
+        if listing.isbn13:
+            batch.append(listing)
+        if len(batch) >= 1000:
+            Listing.objects.bulk_update(batch, ['isbn13'])
+            batch = []
+    Listing.objects.bulk_update(batch, ['isbn13'])
+    rebuild_isbn_stats(Listing, apps.get_model('core', 'IsbnPriceStats'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_listing_soft_delete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IsbnPriceStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('isbn13', models.CharField(max_length=13, unique=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('median_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='isbn13',
+            field=models.CharField(blank=True, editable=False, max_length=13, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['isbn13', 'price', 'id'], name='listing_isbn13_price_idx'),
+        ),
+        migrations.RunPython(backfill_isbn13, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.10 on 2026-10-18 05:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_related_listings'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['category', '-id'], name='listing_admin_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['condition', '-id'], name='listing_admin_condition_idx'),
+        ),
+    ]
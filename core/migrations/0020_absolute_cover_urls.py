@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Concat
+
+
+def absolute_cover_urls(apps, schema_editor):
+    # Repointed covers used to be stored as a bare path, which isn't a valid URLField value
+    prefix, base = settings.COVER_URL_PREFIX, settings.COVER_BASE_URL.rstrip('/')
+    if not prefix.startswith('/'):
+        return
+    for model in ('Listing', 'ListingArchive'):
+        apps.get_model('core', model).objects.filter(cover_image_url__startswith=prefix).update(
+            cover_image_url=Concat(models.Value(base), 'cover_image_url', output_field=models.CharField()),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(absolute_cover_urls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.10 on 2026-10-18 06:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_absolute_cover_urls'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='listing',
+            options={'permissions': [('export_listing', 'Can export the catalog')]},
+        ),
+    ]
@@ -1,6 +1,11 @@
 from django.db import models
+from django.db.models.functions import Upper
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
+from .isbn import to_isbn13
+from .terms import normalize_course, search_keys
+
 class User(AbstractUser):
     # We can add extra fields here later, like a profile picture
     email = models.EmailField(unique=True)
@@ -17,20 +22,51 @@ class Listing(models.Model):
     title = models.TextField()
     author = models.TextField()
     isbn = models.CharField(max_length=20, blank=True, null=True)
+    # isbn as a canonical ISBN-13 (core/isbn.py); groups every offer for one edition
+    isbn13 = models.CharField(max_length=13, blank=True, null=True, editable=False)
     cover_image_url = models.URLField(blank=True, null=True)
+    # Where the cover came from once cover_image_url points at our own cache (core/covers.py)
+    cover_source_url = models.URLField(blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     condition = models.CharField(max_length=10, choices=CONDITION_CHOICES)
     course_code = models.CharField(max_length=30, blank=True, null=True)
     is_active = models.BooleanField(default=True)
+    # Deleting or selling a listing only deactivates it; core/archive.py later
+    # moves it to ListingArchive
+    DELETED, SOLD = 'deleted', 'sold'
+    DEACTIVATION_CHOICES = [(DELETED, 'Deleted'), (SOLD, 'Sold')]
+    deactivated_at = models.DateTimeField(blank=True, null=True)
+    deactivated_reason = models.CharField(max_length=10, choices=DEACTIVATION_CHOICES, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Incremental exports. QuerySet.update() doesn't touch it; set it explicitly there.
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
-    def save(self, *args, **kwargs):
+    def apply_derived_fields(self):
+        """Fills in computed fields. bulk_create() skips save(), so bulk paths call this directly."""
+        self.isbn13 = to_isbn13(self.isbn)
         # If the user didn't provide a URL but provided an ISBN
         if not self.cover_image_url and self.isbn:
             # Generate the Open Library cover link automatically
             self.cover_image_url = f"https://covers.openlibrary.org/b/isbn/{self.isbn}-M.jpg"
+
+    def save(self, *args, **kwargs):
+        self.apply_derived_fields()
         super().save(*args, **kwargs)
 
+    def deactivate(self, reason):
+        """Takes the listing off the market. Its row, and its conversations, stay."""
+        self.is_active = False
+        self.deactivated_at = timezone.now()
+        self.deactivated_reason = reason
+        self.save(update_fields=['is_active', 'deactivated_at', 'deactivated_reason', 'updated_at'])
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so signal handlers can see what a save changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     CATEGORY_CHOICES = [
         ('STEM', 'Science & Tech'),
         ('Business & Econs', 'Business & Econ'),
@@ -45,11 +81,67 @@ class Listing(models.Model):
         default='GEN'
     )
 
+    class Meta:
+        indexes = [
+            # The feed only ever reads live inventory, so its indexes are
+            # partial on is_active rather than leading with it: Django compiles
+            # is_active=True to a bare "WHERE is_active" that SQLite can't match
+            # against an index column, and deactivated rows stay out of them.
+            # Newest first (and its keyset cursor), a category newest first,
+            # and by price (scanned backwards for price_desc).
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(is_active=True), name='listing_active_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], condition=models.Q(is_active=True), name='listing_active_category_idx'),
+            models.Index(fields=['price', 'id'], condition=models.Q(is_active=True), name='listing_active_price_idx'),
+            # Exact ISBN / course code matches in search
+            models.Index(fields=['isbn'], name='listing_isbn_idx'),
+            # Every offer for one edition, cheapest first
+            models.Index(fields=['isbn13', 'price', 'id'], name='listing_isbn13_price_idx'),
+            models.Index(Upper('course_code'), name='listing_course_code_upper_idx'),
+            # Repointing every listing that shares a cover once it's cached
+            models.Index(fields=['cover_image_url'], name='listing_cover_url_idx'),
+            # Finding listings due for archiving
+            models.Index(fields=['deactivated_at'], condition=models.Q(is_active=False), name='listing_inactive_idx'),
+            # Admin changelist filters, over live and inactive rows alike, in its -id order
+            models.Index(fields=['category', '-id'], name='listing_admin_category_idx'),
+            models.Index(fields=['condition', '-id'], name='listing_admin_condition_idx'),
+        ]
+        permissions = [
+            # Partners pulling the catalog get this on their own account (staff have it implicitly)
+            ('export_listing', 'Can export the catalog'),
+        ]
+
     def __str__(self):
         return f'"{self.title}" by {self.author} for ${self.price}'
 
+class ListingArchive(models.Model):
+    """
+    A listing that stayed inactive past LISTING_ARCHIVE_AFTER_DAYS, moved out
+    of the hot table by core/archive.py. It keeps the listing's id.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_listings')
+    title = models.TextField()
+    author = models.TextField()
+    isbn = models.CharField(max_length=20, blank=True, null=True)
+    cover_image_url = models.URLField(blank=True, null=True)
+    cover_source_url = models.URLField(blank=True, null=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    condition = models.CharField(max_length=10, choices=Listing.CONDITION_CHOICES)
+    category = models.CharField(max_length=100, choices=Listing.CATEGORY_CHOICES)
+    course_code = models.CharField(max_length=30, blank=True, null=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    deactivated_at = models.DateTimeField(blank=True, null=True)
+    deactivated_reason = models.CharField(max_length=10, choices=Listing.DEACTIVATION_CHOICES, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'"{self.title}" by {self.author} (archived)'
+
 class Conversation(models.Model):
-    listing = models.ForeignKey(Listing, on_delete=models.CASCADE)
+    # Archiving a listing moves it to archived_listing; the thread stays
+    listing = models.ForeignKey(Listing, on_delete=models.SET_NULL, blank=True, null=True)
+    archived_listing = models.ForeignKey(ListingArchive, on_delete=models.SET_NULL, blank=True, null=True)
     buyer = models.ForeignKey(User, related_name='buyer_conversations', on_delete=models.CASCADE)
     
     # The seller is implicitly known via the listing, but this can be useful
@@ -60,13 +152,204 @@ class Conversation(models.Model):
         unique_together = ('listing', 'buyer')
 
     def __str__(self):
-        return f'Conversation about "{self.listing.title}" between {self.buyer.username} and {self.seller.username}'
+        listing = self.listing or self.archived_listing
+        return f'Conversation about "{listing.title if listing else "a removed listing"}" between {self.buyer.username} and {self.seller.username}'
 
 class Message(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
+    is_read = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # Thread paging and "latest message" lookups
+            models.Index(fields=['conversation', '-timestamp', '-id'], name='message_thread_idx'),
+            # Unread counts only ever look at unread rows
+            models.Index(fields=['conversation', 'sender'], condition=models.Q(is_read=False), name='message_unread_idx'),
+        ]
+
+    def __str__(self):
+        return f'Message from {self.sender.username} at {self.timestamp.strftime("%Y-%m-%d %H:%M")}'
+
+class IsbnMetadata(models.Model):
+    """Cached Google Books result for one ISBN, including "not found" answers."""
+    isbn = models.CharField(max_length=20, unique=True)
+    found = models.BooleanField(default=True)
+    data = models.JSONField(default=dict, blank=True)
+    fetched_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.isbn} ({"found" if self.found else "not found"})'
+
+class ListingFacetCount(models.Model):
+    """Number of active listings with one facet value, kept current by core/facets.py."""
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['facet', 'value'], name='listing_facet_count_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.facet}={self.value}: {self.count}'
+
+class IsbnPriceStats(models.Model):
+    """Price summary of the active offers for one ISBN-13, kept current by core/offers.py."""
+    isbn13 = models.CharField(max_length=13, unique=True)
+    count = models.PositiveIntegerField(default=0)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2)
+    median_price = models.DecimalField(max_digits=10, decimal_places=2)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.isbn13}: {self.count} offers, median ${self.median_price}'
+
+class RelatedListing(models.Model):
+    """One precomputed neighbour of a listing, built offline by core/related.py."""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='recommended_by')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Also the index the related endpoint reads, in rank order
+            models.UniqueConstraint(fields=['listing', 'rank'], name='related_listing_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.listing_id} -> {self.related_id} (#{self.rank}, {self.score:.3f})'
+
+class CoverImage(models.Model):
+    """A remote cover image, fetched once and stored content-addressed by core/covers.py."""
+    PENDING, READY, MISSING, FAILED = 'pending', 'ready', 'missing', 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (READY, 'Ready'),
+        (MISSING, 'Missing'),  # the source has no usable image
+        (FAILED, 'Failed'),    # the source couldn't be reached; retried later
+    ]
+
+    source_url = models.URLField(unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    sha256 = models.CharField(max_length=64, blank=True)
+    content_type = models.CharField(max_length=50, blank=True)
+    size = models.PositiveIntegerField(default=0)
+    # File name of the image listings point at: a thumbnail, or the original
+    name = models.CharField(max_length=80, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    fetched_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.source_url} ({self.status})'
+
+
+class SavedSearch(models.Model):
+    """
+    A standing query. Listings created after it that match every criterion
+    become SavedSearchMatch rows for its owner (core/saved_searches.py).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saved_searches')
+    query = models.CharField(max_length=200, blank=True)  # every word must be in the title or author
+    isbn13 = models.CharField(max_length=13, blank=True)
+    course_code = models.CharField(max_length=30, blank=True)
+    category = models.CharField(max_length=100, choices=Listing.CATEGORY_CHOICES, blank=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    # Its most selective match key (core/terms.py); new listings find searches by it
+    anchor = models.CharField(max_length=60, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['anchor'], name='saved_search_anchor_idx'),
+        ]
+
+    def keys(self):
+        return search_keys(self.isbn13, self.course_code, self.category, self.query)
+
+    def apply_derived_fields(self):
+        """bulk_create() skips save(), so bulk paths call this directly."""
+        self.course_code = normalize_course(self.course_code)
+        keys = self.keys()
+        self.anchor = keys[0] if keys else ''
+
+    def save(self, *args, **kwargs):
+        self.apply_derived_fields()
+        super().save(*args, **kwargs)
+
+    def accepts(self, keys, price):
+        """Whether a listing with these match keys and price meets every criterion."""
+        if self.max_price is not None and price > self.max_price:
+            return False
+        return all(key in keys for key in self.keys())
+
+    def __str__(self):
+        return f'{self.user_id}: {self.anchor}'
+
+
+class SavedSearchMatch(models.Model):
+    """A listing that matched a saved search: one notification for the search's owner."""
+    search = models.ForeignKey(SavedSearch, on_delete=models.CASCADE, related_name='matches')
+    # The search's owner, so the inbox reads one index
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saved_search_matches')
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='saved_search_matches')
+    created_at = models.DateTimeField(auto_now_add=True)
+    is_read = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['search', 'listing'], name='saved_search_match_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='saved_search_match_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f'Search {self.search_id} matched listing {self.listing_id}'
+
+class Job(models.Model):
+    """A unit of background work for `manage.py run_workers` (see core/jobs.py)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)  # a key of core.jobs.JOB_HANDLERS
+    payload = models.JSONField(default=dict, blank=True)  # keyword arguments for the handler
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # At most one queued or running job per key; enqueueing another is a no-op
+    dedupe_key = models.CharField(max_length=200, blank=True, null=True)
+    run_at = models.DateTimeField(default=timezone.now)  # not started before this
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    last_error = models.TextField(blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'], condition=models.Q(status__in=['queued', 'running']), name='job_dedupe_unique',
+            ),
+        ]
+        indexes = [
+            # Claiming: the next due jobs; also finds stuck running jobs
+            models.Index(fields=['status', 'run_at', 'id'], name='job_ready_idx'),
+        ]
 
     def __str__(self):
-        return f'Message from {self.sender.username} at {self.timestamp.strftime("%Y-%m-%d %H:%M")}'
\ No newline at end of file
+        return f'{self.name} #{self.pk} ({self.status})'
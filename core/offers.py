@@ -0,0 +1,116 @@
+# core/offers.py
+"""
+"All offers for this book": active listings grouped by canonical ISBN-13.
+
+IsbnPriceStats holds count, min, median and max price per ISBN. The Listing
+save/delete signals refresh the row of every ISBN a write touched, reading
+only that ISBN's prices off listing_isbn13_price_idx, so keeping the table
+current costs the same whatever the catalog size. Reads are one row.
+
+QuerySet.update() and bulk_create() skip signals; code that changes isbn,
+price or is_active in bulk must call refresh_isbn_stats() for the ISBNs it
+touched, or rebuild_isbn_stats() (also `manage.py rebuild_isbn_stats`).
+"""
+
+from decimal import Decimal
+from itertools import groupby
+
+from django.db import transaction
+
+from .models import IsbnPriceStats, Listing
+
+OFFER_FIELDS = ('isbn13', 'price', 'is_active')
+# ISBNs refreshed per query
+REFRESH_CHUNK = 500
+CENT = Decimal('0.01')
+
+
+def median(prices):
+    """Median of a sorted, non-empty list, to the cent."""
+    middle = len(prices) // 2
+    if len(prices) % 2:
+        return prices[middle]
+    return ((prices[middle - 1] + prices[middle]) / 2).quantize(CENT)
+
+
+def stats_row(isbn13, prices, stats_model=IsbnPriceStats):
+    return stats_model(
+        isbn13=isbn13, count=len(prices),
+        min_price=prices[0], median_price=median(prices), max_price=prices[-1],
+    )
+
+
+def offer_key(isbn13, price, is_active):
+    """What one listing contributes to the stats: (isbn13, price), or None."""
+    if not is_active or not isbn13 or price is None:
+        return None
+    return isbn13, Decimal(price)
+
+
+def listing_offer_key(listing):
+    return offer_key(listing.isbn13, listing.price, listing.is_active)
+
+
+def loaded_offer_key(listing):
+    """The key for the values the listing was loaded with; None if it had none."""
+    loaded = getattr(listing, '_loaded_values', None) or {}
+    if not all(name in loaded for name in OFFER_FIELDS):
+        return None
+    return offer_key(*(loaded[name] for name in OFFER_FIELDS))
+
+
+def remember_offer(listing):
+    loaded = getattr(listing, '_loaded_values', None)
+    if loaded is None:
+        listing._loaded_values = loaded = {}
+    loaded.update({name: getattr(listing, name) for name in OFFER_FIELDS})
+
+
+def refresh_isbn_stats(isbns):
+    """Recomputes the stats rows of `isbns`, deleting those with no active offers left."""
+    isbns = sorted({isbn for isbn in isbns if isbn})
+    for start in range(0, len(isbns), REFRESH_CHUNK):
+        chunk = isbns[start:start + REFRESH_CHUNK]
+        prices = (
+            Listing.objects.filter(isbn13__in=chunk, is_active=True)
+            .order_by('isbn13', 'price')
+            .values_list('isbn13', 'price')
+        )
+        rows = [
+            stats_row(isbn13, [price for _, price in group])
+            for isbn13, group in groupby(prices, key=lambda row: row[0])
+        ]
+        if rows:
+            IsbnPriceStats.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=['isbn13'],
+                update_fields=['count', 'min_price', 'median_price', 'max_price', 'updated_at'],
+            )
+        gone = set(chunk) - {row.isbn13 for row in rows}
+        if gone:
+            IsbnPriceStats.objects.filter(isbn13__in=gone).delete()
+
+
+def rebuild_isbn_stats(listing_model=Listing, stats_model=IsbnPriceStats, batch_size=1000):
+    """Recomputes the whole table from scratch."""
+    prices = (
+        listing_model.objects.filter(isbn13__isnull=False, is_active=True)
+        .order_by('isbn13', 'price')
+        .values_list('isbn13', 'price')
+        .iterator(chunk_size=batch_size * 4)
+    )
+    batch, total = [], 0
+    with transaction.atomic():
+        stats_model.objects.all().delete()
+        for isbn13, group in groupby(prices, key=lambda row: row[0]):
+            batch.append(stats_row(isbn13, [price for _, price in group], stats_model))
+            if len(batch) >= batch_size:
+                stats_model.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        stats_model.objects.bulk_create(batch)
+    return total + len(batch)
+
+
+def offers(isbn13):
+    """Active listings for one ISBN-13, cheapest first."""
+    return Listing.objects.filter(isbn13=isbn13, is_active=True).select_related('seller').order_by('price', 'id')
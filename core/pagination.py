@@ -0,0 +1,238 @@
+# core/pagination.py
+
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Cursor pagination keyed on an ordering tuple, e.g. ('-created_at', '-id').
+
+    Pages are fetched with a WHERE clause on the last row seen instead of an
+    OFFSET, so a deep page costs the same as the first one as long as an index
+    covers the ordering. Cursors are opaque base64 tokens.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+    ordering = ('-created_at', '-id')
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'LISTINGS_PAGE_SIZE', 24)
+        self.max_page_size = getattr(settings, 'LISTINGS_MAX_PAGE_SIZE', 100)
+
+    def get_ordering(self, view):
+        # Views can page on a different key (e.g. price) via `cursor_ordering`
+        ordering = tuple(getattr(view, 'cursor_ordering', None) or self.ordering)
+        directions = {field.startswith('-') for field in ordering}
+        assert len(directions) == 1, 'All cursor ordering fields must share a direction.'
+        return ordering
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = self.get_ordering(view)
+        self.fields = [field.lstrip('-') for field in ordering]
+        descending = ordering[0].startswith('-')
+
+        cursor = self.decode_cursor(request, queryset.model)
+        reverse = bool(cursor and cursor['reverse'])
+
+        if reverse:
+            # Walk backwards from the first row of the page we came from
+            ordering = tuple(f[1:] if f.startswith('-') else '-' + f for f in ordering)
+        queryset = queryset.order_by(*ordering)
+        if cursor:
+            lookup = 'lt' if descending != reverse else 'gt'
+            queryset = queryset.filter(self._seek(cursor['position'], lookup))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(self.page[0], reverse=True)
+
+    # Cursor helpers
+
+    def _seek(self, position, lookup):
+        # (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y)
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.fields, position):
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    def _position(self, row):
+        if isinstance(row, dict):
+            return [row[field] for field in self.fields]
+        return [getattr(row, field) for field in self.fields]
+
+    def _link(self, row, reverse):
+        token = self.encode_cursor(self._position(row), reverse)
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def encode_cursor(self, position, reverse):
+        payload = {'r': int(reverse), 'p': [_encode_value(v) for v in position]}
+        raw = json.dumps(payload, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, request, model):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            payload = json.loads(raw)
+            values = payload['p']
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+            return {'reverse': bool(payload['r']), 'position': position}
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class ListingCursorPagination(KeysetCursorPagination):
+    """Newest-first feed pagination, backed by the listing (created_at, id) index."""
+    ordering = ('-created_at', '-id')
+
+
+class SavedSearchMatchCursorPagination(KeysetCursorPagination):
+    """Newest-first notifications, backed by the match (user, created_at, id) index."""
+    ordering = ('-created_at', '-id')
+
+
+class MessageCursorPagination(KeysetCursorPagination):
+    """Newest-first thread pagination, backed by the message (conversation, timestamp, id) index."""
+    ordering = ('-timestamp', '-id')
+
+    def __init__(self):
+        super().__init__()
+        self.page_size = getattr(settings, 'MESSAGES_PAGE_SIZE', 50)
+
+
+def estimate_count(queryset):
+    """
+    A cheap row count estimate for `queryset`, or None when there isn't one.
+
+    PostgreSQL answers from planner statistics: pg_class.reltuples for the
+    whole table, the EXPLAIN row estimate when filtered. SQLite only has an
+    estimate for the whole table: the row count ANALYZE left in sqlite_stat1,
+    or else the highest id.
+    """
+    connection = connections[queryset.db]
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    unfiltered = not queryset.query.where and not queryset.query.distinct
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            if unfiltered:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+                row = cursor.fetchone()
+                # -1 until the table is first vacuumed or analyzed
+                return row[0] if row and row[0] >= 0 else None
+            sql, params = queryset.order_by().query.get_compiler(queryset.db).as_sql()
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+        if connection.vendor == 'sqlite' and unfiltered:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone():
+                # One row per index; the first number is how many rows it covers
+                cursor.execute('SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s', [queryset.model._meta.db_table])
+                analyzed = cursor.fetchone()[0]
+                if analyzed:
+                    return analyzed
+            pk = connection.ops.quote_name(queryset.model._meta.pk.column)
+            cursor.execute(f'SELECT MAX({pk}) FROM {table}')
+            return cursor.fetchone()[0] or 0
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Page-number paginator for big admin changelists. COUNT(*) over a large
+    table reads every row, so when the database can estimate the count
+    (estimate_count) and the estimate is at least `exact_below`, the estimate
+    is used. The last page numbers can then be off by a little; smaller or
+    unestimated results are counted exactly.
+    """
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            estimate = estimate_count(self.object_list)
+            if estimate is not None and estimate >= self.exact_below:
+                return estimate
+        return super().count
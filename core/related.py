@@ -0,0 +1,255 @@
+# core/related.py
+"""
+"Related books" for listing detail pages, precomputed offline.
+
+The active catalog is loaded once and each listing's title and author
+become an L2-normalized TF-IDF vector. Listings are scored against each
+other with NumPy, a block of rows at a time:
+
+    score = cosine(title + author) + COURSE_WEIGHT * same course code
+            + AUTHOR_WEIGHT * same author + CATEGORY_WEIGHT * same category
+
+The best RELATED_LISTINGS_TOP_K neighbours scoring at least
+RELATED_LISTINGS_MIN_SCORE are stored in RelatedListing, so the endpoint
+reads them back with one indexed query. Other copies of the same edition
+are left to the offers endpoint (core/offers.py).
+
+update_related() is incremental. Neighbours that went off the market are
+dropped and the lists they leave short are rebuilt. New listings get a
+list of their own and are offered to every existing list they would make
+the top K of. Scoring is symmetric, so one pass over the new rows covers
+both directions. Edited titles and authors only show up after a full
+build_related().
+
+The signals are extra sparse features next to the text terms, so a block
+is scored with one pass through an inverted index and memory grows with
+the block and the catalog, not with the catalog squared. This module needs
+NumPy; only `manage.py build_related` imports it.
+"""
+
+import math
+import re
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .models import Listing, RelatedListing
+
+COURSE_WEIGHT = 0.5
+AUTHOR_WEIGHT = 0.3
+CATEGORY_WEIGHT = 0.1
+STOP_WORDS = frozenset('a an and by edition ed for from in into of on the to vol volume with'.split())
+# Terms in more listings than this (and more than COMMON_TERM_FLOOR) are
+# dropped from the index: they barely move a score but dominate the work
+COMMON_TERM_SHARE = 0.2
+COMMON_TERM_FLOOR = 200
+# Cells in one block of the score matrix (rows x catalog size)
+BLOCK_CELLS = 4_000_000
+FIELDS = ('id', 'title', 'author', 'course_code', 'category', 'isbn13')
+TOKEN_RE = re.compile(r'[^\W_]+')
+# When the last build started. Listings with no neighbours older than that
+# were already scored; without it every one of them is rescored.
+LAST_RUN_KEY = 'related:last-run'
+
+
+def tokens(text):
+    return [term for term in TOKEN_RE.findall((text or '').lower()) if len(term) > 1 and term not in STOP_WORDS]
+
+
+def _ranges(starts, lengths):
+    """range(start, start + length) for each pair, concatenated, without a Python loop."""
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+def signals(row):
+    """The non-text features of a listing: a shared one adds its weight to the score."""
+    course = re.sub(r'\s+', '', row['course_code'] or '').upper()
+    author = ' '.join(TOKEN_RE.findall((row['author'] or '').lower()))
+    return [
+        (key, weight) for key, weight in (
+            (('course', course), COURSE_WEIGHT), (('author', author), AUTHOR_WEIGHT), (('category', row['category']), CATEGORY_WEIGHT),
+        ) if key[1]
+    ]
+
+
+class Catalog:
+    """
+    Active listings as sparse feature rows: L2-normalized TF-IDF weights for
+    the text, plus one feature per signal weighted so that two listings
+    sharing it gain exactly its weight in their dot product.
+    """
+
+    def __init__(self, rows):
+        n = len(rows)
+        self.ids = np.array([row['id'] for row in rows], dtype=np.int64)
+        self.position = {pk: i for i, pk in enumerate(self.ids.tolist())}
+        # Equal scores go to the newer listing (ids ascend with rows)
+        self.tiebreak = np.arange(n) * (1e-6 / max(n, 1))
+        editions = {}
+        for i, row in enumerate(rows):
+            if row['isbn13']:
+                editions.setdefault(row['isbn13'], []).append(i)
+        self.same_edition = {i: group for group in editions.values() if len(group) > 1 for i in group}
+
+        documents = [Counter(tokens(f"{row['title']} {row['author']}")) for row in rows]
+        frequency = Counter(term for document in documents for term in document)
+        idf = {term: math.log((1 + n) / (1 + df)) + 1 for term, df in frequency.items()}
+        # A term in one listing can't relate two listings; it still counts towards the norm
+        common = max(COMMON_TERM_SHARE * n, COMMON_TERM_FLOOR)
+        indexed = {term for term, df in frequency.items() if 2 <= df <= common}
+
+        features, pointers, columns, weights = {}, [0], [], []
+        for row, document in zip(rows, documents):
+            weighted = {term: (1 + math.log(count)) * idf[term] for term, count in document.items()}
+            norm = math.sqrt(sum(w * w for w in weighted.values())) or 1.0
+            entries = [(term, weight / norm) for term, weight in weighted.items() if term in indexed]
+            entries += [(key, math.sqrt(weight)) for key, weight in signals(row)]
+            for key, weight in entries:
+                columns.append(features.setdefault(key, len(features)))
+                weights.append(weight)
+            pointers.append(len(columns))
+        self.doc_pointers = np.array(pointers, dtype=np.int64)
+        self.doc_features = np.array(columns, dtype=np.int64)
+        self.doc_weights = np.array(weights, dtype=np.float64)
+
+        # The same entries by feature: the inverted index
+        doc_of_entry = np.repeat(np.arange(n), np.diff(self.doc_pointers))
+        order = np.argsort(self.doc_features, kind='stable')
+        self.feature_pointers = np.concatenate([[0], np.cumsum(np.bincount(self.doc_features, minlength=len(features)))])
+        self.posting_docs = doc_of_entry[order]
+        self.posting_weights = self.doc_weights[order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, rows):
+        """Scores of the listings at positions `rows` against every listing: (len(rows), n)."""
+        n, block = len(self), len(rows)
+        lengths = self.doc_pointers[rows + 1] - self.doc_pointers[rows]
+        entries = _ranges(self.doc_pointers[rows], lengths)
+        features = self.doc_features[entries]
+        posting_lengths = self.feature_pointers[features + 1] - self.feature_pointers[features]
+        postings = _ranges(self.feature_pointers[features], posting_lengths)
+        cells = np.repeat(np.repeat(np.arange(block), lengths), posting_lengths) * n + self.posting_docs[postings]
+        products = np.repeat(self.doc_weights[entries], posting_lengths) * self.posting_weights[postings]
+        scores = np.bincount(cells, weights=products, minlength=block * n).reshape(block, n)
+        scores += self.tiebreak
+        # Not itself, nor another copy of the same edition
+        scores[np.arange(block), rows] = -np.inf
+        for i, row in enumerate(rows.tolist()):
+            if row in self.same_edition:
+                scores[i, self.same_edition[row]] = -np.inf
+        return scores
+
+    def blocks(self, rows):
+        size = max(1, BLOCK_CELLS // max(len(self), 1))
+        for start in range(0, len(rows), size):
+            yield rows[start:start + size]
+
+
+def load_catalog():
+    return Catalog(list(Listing.objects.filter(is_active=True).order_by('id').values(*FIELDS)))
+
+
+def top_neighbours(scores, ids, top_k, min_score):
+    """Per row of `scores`, [(listing id, score), ...] best first."""
+    k = min(top_k, scores.shape[1])
+    if k <= 0:
+        return [[] for _ in range(scores.shape[0])]
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    lists = []
+    for row, candidates in zip(scores, best):
+        candidates = candidates[np.argsort(-row[candidates], kind='stable')]
+        lists.append([(int(ids[j]), float(row[j])) for j in candidates if row[j] >= min_score])
+    return lists
+
+
+def store(lists):
+    """Replaces the stored neighbours of each (listing id, neighbours) pair."""
+    with transaction.atomic():
+        RelatedListing.objects.filter(listing_id__in=[pk for pk, _ in lists]).delete()
+        RelatedListing.objects.bulk_create(
+            [
+                RelatedListing(listing_id=pk, related_id=related_id, rank=rank, score=round(score, 4))
+                for pk, neighbours in lists
+                for rank, (related_id, score) in enumerate(neighbours, start=1)
+            ],
+            batch_size=1000,
+        )
+
+
+def build_related(top_k=None, min_score=None):
+    """Rescores the whole active catalog. Returns the number of listings processed."""
+    top_k = settings.RELATED_LISTINGS_TOP_K if top_k is None else top_k
+    min_score = settings.RELATED_LISTINGS_MIN_SCORE if min_score is None else min_score
+    started = timezone.now()
+    catalog = load_catalog()
+    for rows in catalog.blocks(np.arange(len(catalog))):
+        neighbours = top_neighbours(catalog.scores(rows), catalog.ids, top_k, min_score)
+        store(list(zip(catalog.ids[rows].tolist(), neighbours)))
+    RelatedListing.objects.filter(listing__is_active=False).delete()
+    cache.set(LAST_RUN_KEY, started, timeout=None)
+    return len(catalog)
+
+
+def update_related(top_k=None, min_score=None):
+    """
+    Catches the stored neighbours up with listings added or taken off the
+    market since the last run. Returns (lists rebuilt, lists extended).
+    """
+    top_k = settings.RELATED_LISTINGS_TOP_K if top_k is None else top_k
+    min_score = settings.RELATED_LISTINGS_MIN_SCORE if min_score is None else min_score
+    with transaction.atomic():
+        gone = RelatedListing.objects.filter(related__is_active=False)
+        short = set(gone.values_list('listing_id', flat=True))
+        gone.delete()
+        RelatedListing.objects.filter(listing__is_active=False).delete()
+
+    started, since = timezone.now(), cache.get(LAST_RUN_KEY)
+    # Added or reactivated since the last run (updated_at moves on both)
+    fresh = Listing.objects.filter(is_active=True, related_links__isnull=True)
+    new = set((fresh.filter(updated_at__gte=since) if since else fresh).values_list('id', flat=True))
+    if not new and not short:
+        cache.set(LAST_RUN_KEY, started, timeout=None)
+        return 0, 0
+    catalog = load_catalog()
+    rebuild = sorted(catalog.position[pk] for pk in new | short if pk in catalog.position)
+
+    # What a new listing must beat to enter a list: its weakest entry, once full
+    bar = np.full(len(catalog), min_score)
+    for row in RelatedListing.objects.values('listing_id').annotate(size=Count('id'), weakest=Min('score')):
+        if row['size'] >= top_k and row['listing_id'] in catalog.position:
+            bar[catalog.position[row['listing_id']]] = max(row['weakest'], min_score)
+    is_new = np.isin(catalog.ids, np.array(sorted(new), dtype=np.int64))
+    rebuilt = np.zeros(len(catalog), dtype=bool)
+    rebuilt[rebuild] = True
+
+    offers = {}
+    for rows in catalog.blocks(np.array(rebuild, dtype=np.int64)):
+        scores = catalog.scores(rows)
+        store(list(zip(catalog.ids[rows].tolist(), top_neighbours(scores, catalog.ids, top_k, min_score))))
+        # Scores are symmetric: a new row's scores are also its score in every other list
+        entering = (scores > bar) & is_new[rows][:, None] & ~rebuilt[None, :]
+        for i, j in zip(*np.nonzero(entering)):
+            offers.setdefault(int(catalog.ids[j]), []).append((int(catalog.ids[rows[i]]), float(scores[i, j])))
+
+    extended = sorted(offers)
+    for start in range(0, len(extended), 500):
+        chunk = extended[start:start + 500]
+        current = {}
+        for pk, related_id, score in RelatedListing.objects.filter(listing_id__in=chunk).values_list('listing_id', 'related_id', 'score'):
+            current.setdefault(pk, []).append((related_id, score))
+        lists = []
+        for pk in chunk:
+            merged = dict(current.get(pk, []))
+            merged.update(offers[pk])
+            lists.append((pk, sorted(merged.items(), key=lambda pair: -pair[1])[:top_k]))
+        store(lists)
+    cache.set(LAST_RUN_KEY, started, timeout=None)
+    return len(rebuild), len(extended)
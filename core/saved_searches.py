@@ -0,0 +1,112 @@
+# core/saved_searches.py
+"""
+Saved searches: telling students when a book they want is listed.
+
+Checking a new listing against every saved search costs O(searches) per
+insert. Instead each SavedSearch is indexed under one anchor key (see
+core/terms.py). A new listing works out its own keys (ISBN, course code,
+category, and the words of its title and author), loads only the searches
+anchored on one of them through saved_search_anchor_idx, and checks those
+candidates against all of their criteria. The cost per listing depends on
+its length and on how many searches could match it, not on how many
+searches exist.
+
+Matching runs once the listing is committed, on a small background pool
+(SAVED_SEARCH_MATCHING: async, sync, queue or off; 'queue' leaves it to
+`manage.py run_workers`), so creating a listing never waits on it. Matches
+are stored as SavedSearchMatch rows and read from
+/api/saved-searches/matches/. A seller's own listings never match their
+searches.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .jobs import enqueue
+from .models import Listing, SavedSearch, SavedSearchMatch
+from .terms import listing_keys
+
+logger = logging.getLogger(__name__)
+
+# Anchors per candidate query; an import batch can have thousands of keys
+ANCHOR_CHUNK = 500
+LISTING_FIELDS = ('id', 'seller_id', 'isbn13', 'course_code', 'category', 'title', 'author', 'price')
+
+
+def row_keys(row):
+    return listing_keys(row['isbn13'], row['course_code'], row['category'], row['title'], row['author'])
+
+
+def candidates(keys):
+    """{anchor: [SavedSearch, ...]} for the searches anchored on any of `keys`."""
+    keys = sorted(keys)
+    by_anchor = {}
+    for start in range(0, len(keys), ANCHOR_CHUNK):
+        for search in SavedSearch.objects.filter(anchor__in=keys[start:start + ANCHOR_CHUNK]):
+            by_anchor.setdefault(search.anchor, []).append(search)
+    return by_anchor
+
+
+def find_matches(rows):
+    """[(search, listing row), ...] for listing rows (LISTING_FIELDS values)."""
+    keyed = [(row, row_keys(row)) for row in rows]
+    by_anchor = candidates(set().union(*(keys for _, keys in keyed)))
+    found = []
+    for row, keys in keyed:
+        for key in keys:
+            for search in by_anchor.get(key, ()):
+                if search.user_id != row['seller_id'] and search.accepts(keys, row['price']):
+                    found.append((search, row))
+    return found
+
+
+def match_listings(ids):
+    """Records the saved searches the active listings in `ids` match. Returns how many."""
+    rows = list(Listing.objects.filter(pk__in=list(ids), is_active=True).values(*LISTING_FIELDS))
+    matches = [
+        SavedSearchMatch(search=search, user_id=search.user_id, listing_id=row['id'])
+        for search, row in find_matches(rows)
+    ]
+    # ignore_conflicts: matching the same listing twice records nothing new
+    SavedSearchMatch.objects.bulk_create(matches, ignore_conflicts=True, batch_size=1000)
+    return len(matches)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=settings.SAVED_SEARCH_WORKERS, thread_name_prefix='saved-search')
+        return _pool
+
+
+def _match_in_thread(ids):
+    try:
+        match_listings(ids)
+    except Exception:
+        logger.exception('Could not match saved searches for listings %s', ids[:10])
+    finally:
+        close_old_connections()
+
+
+def match_on_commit(ids):
+    """Matches the listings in `ids` against saved searches once the transaction commits."""
+    ids = [pk for pk in ids if pk is not None]
+    mode = settings.SAVED_SEARCH_MATCHING
+    if not ids or mode == 'off':
+        return
+    if mode == 'queue':
+        # The job row commits with the listings, so no on_commit is needed
+        enqueue('saved_searches.match', {'ids': ids})
+    elif mode == 'sync':
+        transaction.on_commit(lambda: match_listings(ids))
+    else:
+        transaction.on_commit(lambda: _get_pool().submit(_match_in_thread, ids))
@@ -0,0 +1,282 @@
+# core/search.py
+"""
+Ranked full-text search over listings.
+
+PostgreSQL keeps a generated ``tsvector`` column with a GIN index on
+core_listing. SQLite keeps an FTS5 shadow table (core_listing_fts) that is
+maintained by triggers. Both rank title hits above author hits, prefix-match
+every term, and put exact ISBN / course code matches first.
+"""
+
+import re
+from abc import ABC, abstractmethod
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Upper
+from django.db.models.lookups import Exact
+
+from .models import Listing
+
+MAX_TERMS = 8
+
+# Title matches weigh more than author matches (FTS5 bm25 column weights)
+SQLITE_FTS_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS core_listing_fts USING fts5(
+        title, author,
+        content='core_listing', content_rowid='id',
+        tokenize='porter unicode61', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_listing_fts_ai AFTER INSERT ON core_listing BEGIN
+        INSERT INTO core_listing_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_listing_fts_ad AFTER DELETE ON core_listing BEGIN
+        INSERT INTO core_listing_fts(core_listing_fts, rowid, title, author)
+        VALUES ('delete', old.id, old.title, old.author);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_listing_fts_au AFTER UPDATE OF title, author ON core_listing BEGIN
+        INSERT INTO core_listing_fts(core_listing_fts, rowid, title, author)
+        VALUES ('delete', old.id, old.title, old.author);
+        INSERT INTO core_listing_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END
+    """,
+]
+
+POSTGRES_SEARCH_SQL = [
+    """
+    ALTER TABLE core_listing ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(author, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS listing_search_vector_idx ON core_listing USING gin (search_vector)",
+]
+
+
+def install_search_index(schema_editor):
+    """Creates the vendor-specific text index. Safe to run more than once."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for sql in SQLITE_FTS_SQL:
+            schema_editor.execute(sql)
+        schema_editor.execute("INSERT INTO core_listing_fts(core_listing_fts) VALUES ('rebuild')")
+    elif vendor == 'postgresql':
+        for sql in POSTGRES_SEARCH_SQL:
+            schema_editor.execute(sql)
+
+
+def uninstall_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for name in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS core_listing_fts_{name}')
+        schema_editor.execute('DROP TABLE IF EXISTS core_listing_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS listing_search_vector_idx')
+        schema_editor.execute('ALTER TABLE core_listing DROP COLUMN IF EXISTS search_vector')
+
+
+def repair_sqlite_triggers(sender, using='default', **kwargs):
+    """
+    post_migrate hook. SQLite migrations that rebuild core_listing drop its
+    triggers along with the old table, so put them back afterwards.
+    """
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'core_listing_fts'"
+        )
+        if cursor.fetchone() is None:
+            return  # Search migration hasn't run yet
+        for sql in SQLITE_FTS_SQL[1:]:
+            cursor.execute(sql)
+
+
+def search_terms(query):
+    """Splits a query into lowercase alphanumeric terms (no operators)."""
+    return re.findall(r'[^\W_]+', query.lower())[:MAX_TERMS]
+
+
+def exact_keys(query):
+    """Values compared as-is against isbn and course_code."""
+    raw = query.strip()
+    compact = re.sub(r'[\s-]', '', raw)
+    return raw, compact
+
+
+class SearchBackend(ABC):
+    """Returns ranked listing ids for a query. Subclasses hold the SQL."""
+
+    def __init__(self, query):
+        self.query = query
+        self.using = router.db_for_read(Listing)
+        self.terms = search_terms(query)
+        self.raw, self.compact = exact_keys(query)
+
+    @abstractmethod
+    def count(self):
+        """Number of active hits."""
+
+    @abstractmethod
+    def ids(self, offset, limit):
+        """Ids of the active hits, best first."""
+
+    @abstractmethod
+    def matches(self):
+        """Q object selecting every hit, for combining with ORM filters (unranked)."""
+
+    def _exact(self):
+        return Q(isbn__in=[self.raw, self.compact]) | Q(Exact(Upper('course_code'), self.raw.upper()))
+
+    def _fetch(self, sql, params):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class SqliteSearchBackend(SearchBackend):
+    def _match_expression(self):
+        return ' '.join(f'"{term}"*' for term in self.terms)
+
+    def matches(self):
+        if not self.terms:
+            return self._exact()
+        fts = RawSQL('SELECT rowid FROM core_listing_fts WHERE core_listing_fts MATCH %s', [self._match_expression()])
+        return Q(id__in=fts) | self._exact()
+
+    def _hits(self):
+        # Exact matches get a score far below any bm25 score (lower is better)
+        parts = ["""
+            SELECT id, -1000000.0 AS score FROM core_listing
+            WHERE isbn IN (%s, %s) OR UPPER(course_code) = UPPER(%s)
+        """]
+        params = [self.raw, self.compact, self.raw]
+        if self.terms:
+            parts.append("""
+                SELECT rowid AS id, bm25(core_listing_fts, 10.0, 4.0) AS score
+                FROM core_listing_fts WHERE core_listing_fts MATCH %s
+            """)
+            params.append(self._match_expression())
+        sql = f"""
+            SELECT hits.id, MIN(hits.score) AS score
+            FROM ({' UNION ALL '.join(parts)}) AS hits
+            JOIN core_listing ON core_listing.id = hits.id
+            WHERE core_listing.is_active
+            GROUP BY hits.id
+        """
+        return sql, params
+
+    def count(self):
+        sql, params = self._hits()
+        return self._fetch(f'SELECT COUNT(*) FROM ({sql})', params)[0][0]
+
+    def ids(self, offset, limit):
+        sql, params = self._hits()
+        sql += ' ORDER BY score, hits.id DESC LIMIT %s OFFSET %s'
+        return [row[0] for row in self._fetch(sql, params + [limit, offset])]
+
+
+class PostgresSearchBackend(SearchBackend):
+    def _where(self):
+        exact = 'isbn IN (%s, %s) OR UPPER(course_code) = UPPER(%s)'
+        params = [self.raw, self.compact, self.raw]
+        if self.terms:
+            sql = f"is_active AND (search_vector @@ to_tsquery('english', %s) OR {exact})"
+            params = [self._tsquery()] + params
+        else:
+            sql = f'is_active AND ({exact})'
+        return sql, params
+
+    def _tsquery(self):
+        return ' & '.join(f'{term}:*' for term in self.terms)
+
+    def matches(self):
+        if not self.terms:
+            return self._exact()
+        text = RawSQL("SELECT id FROM core_listing WHERE search_vector @@ to_tsquery('english', %s)", [self._tsquery()])
+        return Q(id__in=text) | self._exact()
+
+    def count(self):
+        where, params = self._where()
+        return self._fetch(f'SELECT COUNT(*) FROM core_listing WHERE {where}', params)[0][0]
+
+    def ids(self, offset, limit):
+        where, params = self._where()
+        order = ['COALESCE(isbn IN (%s, %s) OR UPPER(course_code) = UPPER(%s), false) DESC']
+        order_params = [self.raw, self.compact, self.raw]
+        if self.terms:
+            order.append("ts_rank(search_vector, to_tsquery('english', %s)) DESC")
+            order_params.append(self._tsquery())
+        sql = (
+            f'SELECT id FROM core_listing WHERE {where} '
+            f'ORDER BY {", ".join(order)}, id DESC LIMIT %s OFFSET %s'
+        )
+        return [row[0] for row in self._fetch(sql, params + order_params + [limit, offset])]
+
+
+class FallbackSearchBackend(SearchBackend):
+    """Unindexed substring search for databases without a text index."""
+
+    def matches(self):
+        text = Q()
+        for term in self.terms:
+            text &= Q(title__icontains=term) | Q(author__icontains=term)
+        return self._exact() | text if self.terms else self._exact()
+
+    def _queryset(self):
+        return Listing.objects.filter(self.matches(), is_active=True).order_by('-created_at', '-id')
+
+    def count(self):
+        return self._queryset().count()
+
+    def ids(self, offset, limit):
+        return list(self._queryset().values_list('id', flat=True)[offset:offset + limit])
+
+
+def get_search_backend(query):
+    vendor = connections[router.db_for_read(Listing)].vendor
+    if vendor == 'postgresql':
+        return PostgresSearchBackend(query)
+    if vendor == 'sqlite':
+        return SqliteSearchBackend(query)
+    return FallbackSearchBackend(query)
+
+
+class RankedSearchResults:
+    """
+    Lazy, sliceable result set so DRF's page-number pagination can drive the
+    search: only the requested slice of ids is ranked and loaded.
+    """
+
+    def __init__(self, query, queryset=None):
+        self.backend = get_search_backend(query)
+        self.queryset = queryset if queryset is not None else Listing.objects.all()
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start = key.start or 0
+        stop = key.stop if key.stop is not None else self.count()
+        ids = self.backend.ids(start, max(stop - start, 0))
+        listings = self.queryset.in_bulk(ids)
+        return [listings[pk] for pk in ids if pk in listings]
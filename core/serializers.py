@@ -1,8 +1,10 @@
 # core/serializers.py
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
-from .models import Listing
+from .isbn import to_isbn13
+from .models import Conversation, IsbnPriceStats, Listing, Message, SavedSearch, SavedSearchMatch
 
 User = get_user_model()
 
@@ -29,4 +31,96 @@ class ListingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Listing
         fields = ['id', 'title', 'author', 'isbn', 'condition', 'price', 'category', 'cover_image_url', 'seller', 'seller_email', 'created_at']
-        read_only_fields = ['id', 'seller', 'seller_email', 'created_at']
\ No newline at end of file
+        read_only_fields = ['id', 'seller', 'seller_email', 'created_at']
+
+
+class ListingImportSerializer(ListingSerializer):
+    """Row validation for bulk imports; also accepts a course code."""
+
+    class Meta(ListingSerializer.Meta):
+        fields = ListingSerializer.Meta.fields + ['course_code']
+
+
+class IsbnPriceStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = IsbnPriceStats
+        fields = ['isbn13', 'count', 'min_price', 'median_price', 'max_price']
+
+
+class BookLookupItemSerializer(serializers.Serializer):
+    isbn = serializers.CharField(required=False, allow_blank=True)
+    q = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, attrs):
+        attrs = {key: value for key, value in attrs.items() if value}
+        if not attrs:
+            raise serializers.ValidationError('Give an ISBN or a search query (q).')
+        return attrs
+
+
+class BookBatchLookupSerializer(serializers.Serializer):
+    """Either `items` or `isbns`; validated_data['items'] is the batch as lookup items."""
+    items = serializers.ListField(child=BookLookupItemSerializer(), required=False, allow_empty=False)
+    isbns = serializers.ListField(child=serializers.CharField(), required=False, allow_empty=False)
+
+    def validate(self, attrs):
+        if ('items' in attrs) == ('isbns' in attrs):
+            raise serializers.ValidationError('Provide a non-empty list of items or isbns.')
+        items = attrs.get('items') or [{'isbn': isbn} for isbn in attrs['isbns']]
+        if len(items) > settings.BOOK_LOOKUP_BATCH_MAX:
+            raise serializers.ValidationError(f'At most {settings.BOOK_LOOKUP_BATCH_MAX} items per batch.')
+        return {'items': items}
+
+
+class ConversationSerializer(serializers.ModelSerializer):
+    """Inbox entry. listing_title, last_message_* and unread_count come from queryset annotations."""
+    listing_title = serializers.ReadOnlyField()
+    buyer = serializers.ReadOnlyField(source='buyer.username')
+    seller = serializers.ReadOnlyField(source='seller.username')
+    last_message = serializers.ReadOnlyField()
+    last_message_at = serializers.DateTimeField(read_only=True)
+    last_message_sender = serializers.ReadOnlyField()
+    unread_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Conversation
+        fields = ['id', 'listing', 'archived_listing', 'listing_title', 'buyer', 'seller', 'last_message', 'last_message_at', 'last_message_sender', 'unread_count']
+        read_only_fields = ['id', 'listing', 'archived_listing']
+
+
+class MessageSerializer(serializers.ModelSerializer):
+    sender = serializers.ReadOnlyField(source='sender.username')
+
+    class Meta:
+        model = Message
+        fields = ['id', 'conversation', 'sender', 'content', 'timestamp', 'is_read']
+        read_only_fields = ['id', 'conversation', 'sender', 'timestamp', 'is_read']
+
+
+class SavedSearchSerializer(serializers.ModelSerializer):
+    """Takes any ISBN form in `isbn` and stores it as ISBN-13."""
+    isbn = serializers.CharField(write_only=True, required=False, allow_blank=True)
+
+    class Meta:
+        model = SavedSearch
+        fields = ['id', 'query', 'isbn', 'isbn13', 'course_code', 'category', 'max_price', 'created_at']
+        read_only_fields = ['id', 'isbn13', 'created_at']
+
+    def validate(self, attrs):
+        isbn = attrs.pop('isbn', '').strip()
+        if isbn:
+            attrs['isbn13'] = to_isbn13(isbn)
+            if attrs['isbn13'] is None:
+                raise serializers.ValidationError({'isbn': 'Not a valid ISBN-10 or ISBN-13.'})
+        if not SavedSearch(**attrs).keys():
+            raise serializers.ValidationError('Give a query, ISBN, course code or category.')
+        return attrs
+
+
+class SavedSearchMatchSerializer(serializers.ModelSerializer):
+    listing = ListingSerializer(read_only=True)
+
+    class Meta:
+        model = SavedSearchMatch
+        fields = ['id', 'search', 'listing', 'created_at', 'is_read']
+        read_only_fields = fields
@@ -0,0 +1,127 @@
+# core/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token, invalidate_user_tokens
+from .broker import conversation_channel, get_broker
+from .cache import bump_catalog_version
+from .covers import cover_cache
+from .facets import (
+    FACET_FIELDS, adjust_counts, diff_keys, listing_facet_keys,
+    loaded_facet_keys, remember_loaded_values,
+)
+from .models import Listing, Message, User
+from .offers import OFFER_FIELDS, listing_offer_key, loaded_offer_key, refresh_isbn_stats, remember_offer
+from .saved_searches import match_on_commit
+from .serializers import MessageSerializer
+
+# User fields that show up in listing responses
+SELLER_FIELDS = {'username', 'email'}
+
+
+def _bump_on_commit():
+    # Bump after commit so no reader can cache pre-write rows under the new version
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def listing_changed(sender, **kwargs):
+    _bump_on_commit()
+
+
+@receiver(pre_save, sender=Listing)
+def listing_facets_before_save(sender, instance, **kwargs):
+    # Instances that weren't loaded with every facet and offer field: read the old values
+    loaded = getattr(instance, '_loaded_values', {})
+    if instance._state.adding or all(name in loaded for name in FACET_FIELDS + OFFER_FIELDS):
+        return
+    row = Listing.objects.filter(pk=instance.pk).values(*dict.fromkeys(FACET_FIELDS + OFFER_FIELDS)).first()
+    if row is not None:
+        instance._loaded_values = {**getattr(instance, '_loaded_values', {}), **row}
+
+
+@receiver(pre_save, sender=Listing)
+def listing_offers_before_save(sender, instance, **kwargs):
+    # Taken now: the facet receiver overwrites the loaded price and is_active after saving
+    instance._offer_before_save = None if instance._state.adding else loaded_offer_key(instance)
+
+
+@receiver(post_save, sender=Listing)
+def listing_facets_saved(sender, instance, created, **kwargs):
+    old = set() if created else (loaded_facet_keys(instance) or set())
+    adjust_counts(diff_keys(old, listing_facet_keys(instance)))
+    remember_loaded_values(instance)
+
+
+@receiver(post_save, sender=Listing)
+def listing_offers_saved(sender, instance, created, **kwargs):
+    # Refresh the price stats of the ISBN(s) this save moved an offer in or out of
+    old = getattr(instance, '_offer_before_save', None)
+    new = listing_offer_key(instance)
+    if old != new:
+        refresh_isbn_stats(key[0] for key in (old, new) if key)
+    remember_offer(instance)
+
+
+@receiver(post_save, sender=Listing)
+def listing_cover_saved(sender, instance, created, **kwargs):
+    # New or changed remote cover: cache it once the listing is committed
+    loaded = getattr(instance, '_loaded_values', {})
+    if created or loaded.get('cover_image_url') != instance.cover_image_url:
+        cover_cache.warm_on_commit([instance.cover_image_url])
+
+
+@receiver(post_save, sender=Listing)
+def listing_created_match_searches(sender, instance, created, **kwargs):
+    # Tell the owners of saved searches it matches, after commit and off the request
+    if created and instance.is_active:
+        match_on_commit([instance.pk])
+
+
+@receiver(post_delete, sender=Listing)
+def listing_facets_deleted(sender, instance, **kwargs):
+    old = loaded_facet_keys(instance)
+    adjust_counts(diff_keys(listing_facet_keys(instance) if old is None else old, set()))
+    key = loaded_offer_key(instance) or listing_offer_key(instance)
+    if key:
+        refresh_isbn_stats([key[0]])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, created, update_fields=None, **kwargs):
+    # Logins save last_login only; that must not flush the catalog
+    if created or (update_fields and not SELLER_FIELDS & set(update_fields)):
+        return
+    _bump_on_commit()
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, **kwargs):
+    _bump_on_commit()
+
+
+@receiver(post_save, sender=User)
+def user_saved_auth(sender, instance, created, update_fields=None, **kwargs):
+    # Deactivation, password or profile changes: re-resolve this user's tokens
+    if created or (update_fields and set(update_fields) == {'last_login'}):
+        return
+    invalidate_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    # dj-rest-auth's logout deletes the token
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=Message)
+def message_created(sender, instance, created, **kwargs):
+    if not created:
+        return
+    channel = conversation_channel(instance.conversation_id)
+    payload = dict(MessageSerializer(instance).data)
+    transaction.on_commit(lambda: get_broker().publish(channel, payload))
@@ -0,0 +1,54 @@
+# core/terms.py
+"""
+Match keys shared by listings and saved searches (core/saved_searches.py).
+
+A listing is described by a set of keys: its canonical ISBN-13, course
+code, category and every word of its title and author. A saved search
+matches a listing when all of the search's keys are among the listing's,
+so any one of them is enough to find the search again: its anchor, the key
+fewest listings are expected to share.
+"""
+
+import re
+
+WORD_RE = re.compile(r'[^\W_]+')
+# Longer "words" are noise (URLs, ISBNs typed into titles) and would not fit the anchor column
+MAX_WORD_LENGTH = 40
+MAX_QUERY_WORDS = 8
+
+
+def words(text):
+    return [word for word in WORD_RE.findall((text or '').lower()) if len(word) <= MAX_WORD_LENGTH]
+
+
+def normalize_course(code):
+    """'math 101' and 'MATH101' are the same course."""
+    return re.sub(r'\s+', '', code or '').upper()
+
+
+def listing_keys(isbn13, course_code, category, title, author):
+    keys = {f'word:{word}' for word in words(f'{title} {author}')}
+    course = normalize_course(course_code)
+    if isbn13:
+        keys.add(f'isbn:{isbn13}')
+    if course:
+        keys.add(f'course:{course}')
+    if category:
+        keys.add(f'category:{category}')
+    return keys
+
+
+def search_keys(isbn13, course_code, category, query):
+    """The keys a listing needs to match, most selective first."""
+    keys = []
+    course = normalize_course(course_code)
+    if isbn13:
+        keys.append(f'isbn:{isbn13}')
+    if course:
+        keys.append(f'course:{course}')
+    # Longer words tend to be rarer, so the longest is the best anchor among them
+    query_words = sorted(set(words(query)[:MAX_QUERY_WORDS]), key=lambda word: (-len(word), word))
+    keys += [f'word:{word}' for word in query_words]
+    if category:
+        keys.append(f'category:{category}')
+    return keys
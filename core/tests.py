@@ -1,3 +1,1794 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import importlib.util
+import io
+import json
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import unittest
+import zlib
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.http import QueryDict
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .archive import archivable, archive_batch
+from .authentication import token_cache
+from .books import book_lookup
+from .broker import BrokerBackend, InProcessBackend, Subscription
+from .cache import catalog_version
+from .covers import cover_cache, is_local
+from .facets import compute_facet_counts
+from .fastpath import listing_fast_path
+from .filters import filter_listings, parse_listing_filters
+from .importer import import_listings
+from .isbn import to_isbn13
+from .jobs import Worker, claim, enqueue, queue_stats, requeue_stale
+from .models import (
+    Conversation, CoverImage, IsbnMetadata, IsbnPriceStats, Job, Listing, ListingArchive, Message, RelatedListing,
+    SavedSearch, SavedSearchMatch, User,
+)
+from .pagination import EstimatedCountPaginator
+from .saved_searches import match_listings
+from .serializers import ListingSerializer
+from .terms import listing_keys
+from .throttling import take_token
+
+# Maximum number of SQL queries each endpoint may run, independent of how
+# many rows are in the catalog. Raise a budget only with a good reason.
+QUERY_BUDGETS = {
+    'listings': 1,          # one page, seller joined in
+    'listing-detail': 1,
+    'search': 3,            # count, ranked ids, listings by id
+    'facets': 1,            # counter table, or one aggregate when filtered
+    'create': 5,            # token lookup, insert, facet counters, the ISBN's prices, its stats row
+    'delete': 4,            # token lookup, select, soft-delete update, facet counters
+    'book-offers': 2,       # stats row, offers
+    'book-prices': 1,
+    'listing-related': 2,   # the listing is active, neighbours joined to their listings
+    'conversations': 2,     # token lookup, annotated inbox
+    'messages': 4,          # token lookup, conversation, page, mark read
+    'saved-search-matches': 3,  # token lookup, page with listings and sellers joined, mark read
+}
+
+TITLES = [
+    ('Calculus: Early Transcendentals', 'James Stewart', 'STEM', 'MATH 101'),
+    ('Introduction to Algorithms', 'Thomas H. Cormen', 'STEM', 'CS 201'),
+    ('Principles of Economics', 'N. Gregory Mankiw', 'Business & Econs', 'ECON 100'),
+    ('The Norton Anthology of English Literature', 'Stephen Greenblatt', 'Humanities', 'ENG 210'),
+    ('Art Through the Ages', 'Helen Gardner', 'Art', 'ART 120'),
+]
+
+
+def seed_catalog(listings_per_seller=10, sellers=3, prefix='seller'):
+    """Creates a few sellers with a realistic spread of listings."""
+    users = [
+        User.objects.create_user(f'{prefix}{i}', f'{prefix}{i}@example.com', 'password123')
+        for i in range(sellers)
+    ]
+    conditions = [code for code, _ in Listing.CONDITION_CHOICES]
+    for i in range(listings_per_seller * sellers):
+        title, author, category, course = TITLES[i % len(TITLES)]
+        Listing.objects.create(
+            seller=users[i % sellers],
+            title=f'{title} ({i + 1}e)',
+            author=author,
+            isbn=f'978{i:010d}',
+            price=Decimal('10.00') + i,
+            condition=conditions[i % len(conditions)],
+            category=category,
+            course_code=course,
+        )
+    return users
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, COVER_WARMING='off', SAVED_SEARCH_MATCHING='off')
+class BookSwapTestCase(TestCase):
+    """Keeps tests off the shared file cache, remote covers and background matching, and starts each one cold."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        token_cache.clear()
+
+
+class QueryBudgetMixin:
+    @contextmanager
+    def assertMaxQueries(self, budget):
+        with CaptureQueriesContext(connection) as ctx:
+            yield ctx
+        executed = len(ctx.captured_queries)
+        if executed > budget:
+            sql = '\n'.join(q['sql'] for q in ctx.captured_queries)
+            self.fail(f'{executed} queries executed, budget is {budget}:\n{sql}')
+
+
+class ListingQueryBudgetTests(QueryBudgetMixin, BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_catalog()
+        cls.token = Token.objects.create(user=cls.users[0])
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def auth(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_feed(self):
+        with self.assertMaxQueries(QUERY_BUDGETS['listings']):
+            response = self.client.get('/api/listings/?page_size=30')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 30)
+
+    def test_feed_budget_does_not_grow_with_catalog(self):
+        seed_catalog(listings_per_seller=10, sellers=5, prefix='more')
+        with self.assertMaxQueries(QUERY_BUDGETS['listings']):
+            response = self.client.get('/api/listings/?page_size=100')
+        self.assertEqual(len(response.json()['results']), 80)
+
+    def test_detail(self):
+        listing = Listing.objects.first()
+        with self.assertMaxQueries(QUERY_BUDGETS['listing-detail']):
+            response = self.client.get(f'/api/listings/{listing.pk}/')
+        self.assertEqual(response.json()['seller'], listing.seller.username)
+
+    def test_search(self):
+        with self.assertMaxQueries(QUERY_BUDGETS['search']):
+            response = self.client.get('/api/listings/search/?q=calculus')
+        self.assertEqual(response.json()['count'], 6)
+
+    def test_facets(self):
+        for url in ('/api/listings/facets/', '/api/listings/facets/?q=calculus&condition=GOOD,FAIR'):
+            with self.assertMaxQueries(QUERY_BUDGETS['facets']):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_create(self):
+        self.auth()
+        payload = {
+            'title': 'Linear Algebra Done Right', 'author': 'Sheldon Axler',
+            'isbn': '9783319110790', 'price': '35.00', 'condition': 'GOOD', 'category': 'STEM',
+        }
+        with self.assertMaxQueries(QUERY_BUDGETS['create']):
+            response = self.client.post('/api/listings/create/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['seller_email'], 'seller0@example.com')
+        # Not a usable ISBN (non-ASCII digits): stored as typed, without a canonical form
+        response = self.client.post('/api/listings/create/', {**payload, 'isbn': '²' * 10}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(Listing.objects.get(pk=response.data['id']).isbn13)
+
+    def test_delete(self):
+        self.auth()
+        listing = Listing.objects.filter(seller=self.users[0]).first()
+        with self.assertMaxQueries(QUERY_BUDGETS['delete']):
+            response = self.client.delete(f'/api/listings/delete/{listing.pk}/')
+        self.assertEqual(response.status_code, 204)
+
+
+class ListingPaginationTests(BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(listings_per_seller=5, sellers=1)
+
+    def test_walks_forward_and_back(self):
+        client = APIClient()
+        first = client.get('/api/listings/?page_size=2').json()
+        self.assertIsNone(first['previous'])
+        second = client.get(first['next']).json()
+        back = client.get(second['previous']).json()
+        self.assertEqual(
+            [row['id'] for row in back['results']],
+            [row['id'] for row in first['results']],
+        )
+
+    def test_pages_cover_catalog_once(self):
+        client = APIClient()
+        seen, url = [], '/api/listings/?page_size=2'
+        while url:
+            page = client.get(url).json()
+            seen += [row['id'] for row in page['results']]
+            url = page['next']
+        self.assertEqual(seen, list(Listing.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_invalid_cursor(self):
+        response = APIClient().get('/api/listings/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class ListingSearchTests(BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(listings_per_seller=5, sellers=1)
+
+    def search(self, query):
+        return APIClient().get('/api/listings/search/', {'q': query}).json()
+
+    def test_prefix_match(self):
+        titles = [row['title'] for row in self.search('algor')['results']]
+        self.assertTrue(titles)
+        self.assertTrue(all('Algorithms' in title for title in titles))
+
+    def test_exact_isbn_and_course_code(self):
+        listing = Listing.objects.get(isbn='9780000000003')
+        self.assertEqual([row['id'] for row in self.search('978-0000000003')['results']], [listing.pk])
+        self.assertEqual(self.search('econ 100')['count'], 1)
+
+    def test_index_follows_updates(self):
+        listing = Listing.objects.first()
+        listing.title = 'Quantum Field Theory'
+        listing.save()
+        self.assertEqual([row['id'] for row in self.search('quantum')['results']], [listing.pk])
+
+
+class ListingFilterTests(BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(listings_per_seller=10, sellers=2)
+        Listing.objects.filter(title__startswith='Art').update(is_active=False)
+
+    def feed(self, query=''):
+        response = APIClient().get(f'/api/listings/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_feed_hides_inactive_listings(self):
+        self.assertEqual(len(self.feed('?page_size=100')['results']), 16)
+        inactive = self.feed('?is_active=false&page_size=100')['results']
+        self.assertEqual({row['category'] for row in inactive}, {'Art'})
+        self.assertEqual(len(self.feed('?is_active=any&page_size=100')['results']), 20)
+
+    def test_filters_combine(self):
+        rows = self.feed('?category=STEM&condition=LIKE_NEW,GOOD&min_price=11&max_price=25')['results']
+        self.assertEqual([row['price'] for row in rows], ['15.00', '11.00'])
+        self.assertEqual(len(self.feed('?course_code=math 101')['results']), 4)
+        self.assertEqual(len(self.feed('?q=algorithms')['results']), 4)
+
+    def test_price_sort_pages_with_cursor(self):
+        prices = []
+        url = '/api/listings/?sort=price_desc&page_size=5'
+        while url:
+            page = APIClient().get(url).json()
+            prices += [Decimal(row['price']) for row in page['results']]
+            url = page['next']
+        self.assertEqual(len(prices), 16)
+        self.assertEqual(prices, sorted(prices, reverse=True))
+        cheapest = self.feed('?sort=price_asc&page_size=1')['results'][0]
+        self.assertEqual(cheapest['price'], '10.00')
+
+    def test_bad_parameters(self):
+        for query in ('?sort=random', '?category=Poetry', '?min_price=30&max_price=20', '?is_active=maybe'):
+            self.assertEqual(APIClient().get(f'/api/listings/{query}').status_code, 400, query)
+
+    def test_viewset_detail_still_reaches_inactive_listings(self):
+        inactive = Listing.objects.filter(is_active=False).first()
+        self.assertEqual(APIClient().get(f'/api/listings/{inactive.pk}/').status_code, 200)
+
+
+class ListingQueryPlanTests(BookSwapTestCase):
+    """The feed's common filter/sort combinations must be served by an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(listings_per_seller=20, sellers=2)
+
+    def feed_queries(self):
+        base = Listing.objects.select_related('seller')
+        return [
+            ('listing_active_created_idx', base.filter(is_active=True).order_by('-created_at', '-id')),
+            ('listing_active_category_idx', base.filter(is_active=True, category='STEM').order_by('-created_at', '-id')),
+            ('listing_active_price_idx', base.filter(is_active=True, price__lte=30).order_by('price', 'id')),
+            ('listing_active_price_idx', base.filter(is_active=True).order_by('-price', '-id')),
+        ]
+
+    def test_sqlite_plans_use_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite plan shapes')
+        for index, queryset in self.feed_queries():
+            plan = queryset[:25].explain()
+            self.assertIn(f'USING INDEX {index}', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_course_code_filter_uses_expression_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite plan shapes')
+        for params in ({'course_code': 'math 101'}, {'q': 'math 101'}):
+            with self.subTest(params=params):
+                queryset = filter_listings(Listing.objects.all(), parse_listing_filters(QueryDict(urlencode(params))))
+                self.assertIn('USING INDEX listing_course_code_upper_idx', queryset.explain())
+                self.assertTrue(queryset.exists())
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'PostgreSQL plan shapes')
+    def test_postgres_plans_use_indexes(self):
+        with connection.cursor() as cursor:
+            # A tiny test table would otherwise always be scanned sequentially
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for index, queryset in self.feed_queries():
+            self.assertIn(index, queryset[:25].explain())
+
+
+class ListingSoftDeleteTests(BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller, = seed_catalog(listings_per_seller=6, sellers=1)
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'password123')
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_delete_and_sold_only_deactivate(self):
+        deleted, sold = Listing.objects.order_by('id')[:2]
+        Conversation.objects.create(listing=deleted, buyer=self.buyer, seller=self.seller)
+        client = self.client_for(self.seller)
+        self.assertEqual(client.delete(f'/api/listings/delete/{deleted.pk}/').status_code, 204)
+        self.assertEqual(client.post(f'/api/listings/sold/{sold.pk}/').status_code, 204)
+        self.assertEqual(client.post(f'/api/listings/sold/{sold.pk}/').status_code, 404)
+        self.assertEqual(self.client_for(self.buyer).post(f'/api/listings/sold/{Listing.objects.last().pk}/').status_code, 404)
+
+        rows = {row['id']: row for row in Listing.objects.values('id', 'is_active', 'deactivated_reason', 'deactivated_at')}
+        self.assertEqual(len(rows), 6)
+        self.assertEqual((rows[deleted.pk]['is_active'], rows[deleted.pk]['deactivated_reason']), (False, 'deleted'))
+        self.assertEqual(rows[sold.pk]['deactivated_reason'], 'sold')
+        self.assertIsNotNone(rows[sold.pk]['deactivated_at'])
+        self.assertEqual(Conversation.objects.get().listing_id, deleted.pk)
+
+        feed = APIClient().get('/api/listings/').json()['results']
+        self.assertEqual(len(feed), 4)
+        self.assertEqual(APIClient().get('/api/listings/facets/').json()['total'], 4)
+        response = self.client_for(self.buyer).post('/api/conversations/', {'listing': sold.pk}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_archive_moves_old_inactive_listings_and_keeps_threads(self):
+        old, recent = Listing.objects.order_by('id')[:2]
+        conversation = Conversation.objects.create(listing=old, buyer=self.buyer, seller=self.seller)
+        Message.objects.create(conversation=conversation, sender=self.buyer, content='Still available?')
+        for listing in (old, recent):
+            listing.deactivate(Listing.SOLD)
+        Listing.objects.filter(pk=old.pk).update(deactivated_at=timezone.now() - timedelta(days=100))
+
+        out = io.StringIO()
+        call_command('archive_listings', dry_run=True, stdout=out)
+        self.assertIn('1 listings would be archived', out.getvalue())
+        call_command('archive_listings', batch_size=1, stdout=out)
+
+        self.assertFalse(Listing.objects.filter(pk=old.pk).exists())
+        self.assertTrue(Listing.objects.filter(pk=recent.pk).exists())
+        archived = ListingArchive.objects.get()
+        self.assertEqual((archived.pk, archived.title, archived.seller_id), (old.pk, old.title, self.seller.pk))
+        self.assertEqual(archived.deactivated_reason, 'sold')
+
+        conversation.refresh_from_db()
+        self.assertEqual((conversation.listing_id, conversation.archived_listing_id), (None, old.pk))
+        self.assertEqual(conversation.messages.count(), 1)
+        inbox = self.client_for(self.seller).get('/api/conversations/').data
+        self.assertEqual(inbox[0]['listing_title'], old.title)
+        self.assertEqual(inbox[0]['archived_listing'], old.pk)
+
+    def test_archive_batch_queries_do_not_grow_with_the_batch(self):
+        listings = list(Listing.objects.order_by('id'))
+        Listing.objects.update(is_active=False, deactivated_at=timezone.now() - timedelta(days=100))
+        RelatedListing.objects.create(listing=listings[0], related=listings[5], rank=1, score=0.5)
+        search = SavedSearch.objects.create(user=self.buyer, query='calculus')
+        SavedSearchMatch.objects.create(search=search, user=self.buyer, listing=listings[1])
+        facets = APIClient().get('/api/listings/facets/').json()
+
+        # Inactive rows: the delete signals add no queries, so the cost is flat per batch
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(archive_batch(archivable(), 2), 2)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(archive_batch(archivable(), 4), 4)
+        self.assertEqual(len(small), len(large))
+        self.assertFalse(Listing.objects.exists())
+        self.assertEqual(ListingArchive.objects.count(), 6)
+        self.assertFalse(RelatedListing.objects.exists() or SavedSearchMatch.objects.exists())
+        self.assertEqual(APIClient().get('/api/listings/facets/').json(), facets)
+
+
+class ListingAdminTests(QueryBudgetMixin, BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(listings_per_seller=10, sellers=2)
+        cls.moderator = User.objects.create_superuser('moderator', 'moderator@example.com', 'password123')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.moderator)
+
+    def test_changelist_query_count_is_flat(self):
+        for query in ('', '?category__exact=STEM&is_active__exact=1', '?q=calculus', '?condition__exact=GOOD&p=1'):
+            # session, user, estimate (two on SQLite), count (exact for a small table), page
+            with self.assertMaxQueries(6) as ctx:
+                response = self.client.get(f'/admin/core/listing/{query}')
+            self.assertEqual(response.status_code, 200)
+            # No second count for "N total"
+            self.assertLessEqual(sum('COUNT(' in q['sql'] for q in ctx.captured_queries), 1)
+        self.assertContains(self.client.get('/admin/core/listing/?q=calculus'), '4 results')
+        self.assertContains(self.client.get('/admin/core/listing/?q=²²'), '0 results')
+
+    def test_estimated_count(self):
+        class Estimated(EstimatedCountPaginator):
+            exact_below = 1
+
+        last_id = Listing.objects.order_by('-id').values_list('id', flat=True).first()
+        Listing.objects.filter(pk=last_id - 1).delete()
+        self.assertEqual(Estimated(Listing.objects.order_by('-id'), 10).count, last_id)
+        # Filtered, or under the threshold: exact
+        stem = Listing.objects.filter(category='STEM').order_by('-id')
+        self.assertEqual(Estimated(stem, 10).count, len(stem))
+        self.assertEqual(EstimatedCountPaginator(Listing.objects.order_by('-id'), 10).count, 19)
+
+    def test_seller_autocomplete(self):
+        response = self.client.get('/admin/autocomplete/', {
+            'app_label': 'core', 'model_name': 'listing', 'field_name': 'seller', 'term': 'seller1',
+        })
+        self.assertEqual([row['text'] for row in response.json()['results']], ['seller1'])
+
+    def test_bulk_deactivate_and_reactivate(self):
+        priced = Listing.objects.filter(category='STEM').last()
+        priced.isbn = '0-13-110362-8'
+        priced.save()
+        isbn13 = priced.isbn13
+        stem = [priced.pk] + list(Listing.objects.filter(category='STEM').exclude(pk=priced.pk).values_list('id', flat=True))
+
+        def run(action, ids):
+            with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as ctx:
+                self.client.post('/admin/core/listing/', {'action': action, '_selected_action': ids})
+            return [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "core_listing"')]
+
+        self.assertEqual(len(run('deactivate_listings', stem)), 1)
+        rows = Listing.objects.filter(pk__in=stem)
+        self.assertFalse(rows.filter(Q(is_active=True) | Q(deactivated_at=None)).exists())
+        self.assertEqual(set(rows.values_list('deactivated_reason', flat=True)), {'deleted'})
+        self.assertFalse(IsbnPriceStats.objects.filter(isbn13=isbn13).exists())
+        self.assertEqual(APIClient().get('/api/listings/facets/').json(), compute_facet_counts(Listing.objects.filter(is_active=True)))
+        self.assertEqual(APIClient().get('/api/listings/facets/').json()['category']['STEM'], 0)
+
+        run('reactivate_listings', stem[:3])
+        self.assertEqual(Listing.objects.filter(pk__in=stem, is_active=True, deactivated_at=None).count(), 3)
+        self.assertEqual(IsbnPriceStats.objects.get(isbn13=isbn13).count, 1)
+        self.assertEqual(APIClient().get('/api/listings/facets/').json(), compute_facet_counts(Listing.objects.filter(is_active=True)))
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite' and 'replica' not in connections, 'copies the SQLite test database')
+@override_settings(CACHES=LOCMEM_CACHES, COVER_WARMING='off', SAVED_SEARCH_MATCHING='off')
+class ReplicaRoutingTests(TransactionTestCase):
+    """A second SQLite file, copied from the test database, stands in for a lagging replica."""
+
+    @classmethod
+    def setUpClass(cls):
+        # Added here rather than in settings, so the runner doesn't create a test database for it
+        cls.replica_path = tempfile.mkstemp(suffix='.sqlite3')[1]
+        connections.settings['replica'] = {**connections.settings['default'], 'NAME': cls.replica_path}
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        os.remove(cls.replica_path)
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.seller, = seed_catalog(listings_per_seller=3, sellers=1)
+        self.token = Token.objects.create(user=self.seller)
+        # "Replicate": copy the primary as it is now
+        connections['replica'].close()
+        connection.ensure_connection()
+        target = sqlite3.connect(self.replica_path)
+        connection.connection.backup(target)
+        target.close()
+
+    def titles(self, client):
+        return {row['title'] for row in client.get('/api/listings/?page_size=50').json()['results']}
+
+    def test_reads_follow_the_replica_until_the_client_writes(self):
+        writer, other = APIClient(), APIClient()
+        writer.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        other.force_authenticate(self.seller)  # not pinned: no credential of its own
+        # The replica hasn't seen a write made after it was copied
+        Listing.objects.filter(pk=Listing.objects.first().pk).update(title='Only on the primary')
+        self.assertNotIn('Only on the primary', self.titles(other))
+        self.assertNotIn('Only on the primary', self.titles(APIClient()))
+
+        payload = {'title': 'Fresh listing', 'author': 'Someone', 'price': '12.00', 'condition': 'GOOD', 'category': 'STEM'}
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            self.assertEqual(writer.post('/api/listings/create/', payload, format='json').status_code, 201)
+        self.assertEqual(len(replica_queries), 0)
+        self.assertIn('Fresh listing', self.titles(writer))
+        self.assertNotIn('Fresh listing', self.titles(other))
+
+        cache.clear()  # the pin expires
+        self.assertNotIn('Fresh listing', self.titles(writer))
+        # Conversations aren't a replica route
+        self.assertEqual(writer.get('/api/conversations/').status_code, 200)
+
+
+class ListingFacetTests(BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_catalog(listings_per_seller=10, sellers=2)
+
+    def facets(self, query=''):
+        response = APIClient().get(f'/api/listings/facets/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def assertCountersExact(self):
+        self.assertEqual(self.facets(), compute_facet_counts(Listing.objects.filter(is_active=True)))
+
+    def test_counters_follow_saves_and_deletes(self):
+        self.assertEqual(self.facets()['total'], 20)
+        self.assertEqual(self.facets()['category']['STEM'], 8)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = Listing.objects.filter(category='STEM', price__lt=25).first()
+            listing.category, listing.price = 'Art', Decimal('120.00')
+            listing.save()
+            Listing.objects.filter(category='Humanities').first().delete()
+            hidden = Listing.objects.filter(category='Art').last()
+            hidden.is_active = False
+            hidden.save(update_fields=['is_active'])
+            # Loaded without the facet fields: the old values are read before saving
+            partial = Listing.objects.only('id').get(pk=Listing.objects.filter(is_active=True).first().pk)
+            partial.condition = 'POOR'
+            partial.save()
+
+        counts = self.facets()
+        self.assertEqual(counts['total'], 18)
+        self.assertEqual(counts['category']['STEM'], 7)
+        self.assertEqual(counts['price']['100+'], 1)
+        self.assertCountersExact()
+
+    def test_import_and_rebuild(self):
+        seller = self.users[0]
+        import_listings(io.BytesIO(IMPORT_CSV.encode()), 'csv', seller)
+        self.assertCountersExact()
+        Listing.objects.update(is_active=False)  # skips signals
+        call_command('rebuild_facets', stdout=io.StringIO())
+        self.assertEqual(self.facets()['total'], 0)
+
+    def test_filtered_counts(self):
+        counts = self.facets('?category=STEM&max_price=20')
+        self.assertEqual(counts['total'], 5)
+        self.assertEqual(counts['category'], {'STEM': 5, 'Business & Econs': 0, 'Humanities': 0, 'Art': 0, 'General': 0})
+        self.assertEqual(counts['price'], {'0-10': 0, '10-25': 5, '25-50': 0, '50-100': 0, '100+': 0})
+        self.assertEqual(self.facets('?q=calculus')['total'], 4)
+        self.assertEqual(self.facets('?is_active=any'), self.facets())
+
+    def test_bad_filters(self):
+        self.assertEqual(APIClient().get('/api/listings/facets/?condition=MINT').status_code, 400)
+        self.assertEqual(APIClient().get('/api/listings/facets/?min_price=abc').status_code, 400)
+
+
+class IsbnOfferTests(QueryBudgetMixin, BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password123')
+        # One edition under four spellings, plus a different book
+        for isbn, price in [('0-262-03384-4', '60.00'), ('9780262033848', '45.00'),
+                            ('978 0 262 03384 8', '52.50'), ('0262033844', '80.00'), ('9781285741550', '30.00')]:
+            Listing.objects.create(seller=cls.seller, title='Introduction to Algorithms', author='Cormen',
+                                   isbn=isbn, price=Decimal(price), condition='GOOD', category='STEM')
+
+    def stats(self, isbn='9780262033848'):
+        client = APIClient()
+        # Authenticated, so the catalog cache can't answer between writes
+        client.force_authenticate(self.seller)
+        return client.get(f'/api/books/{isbn}/prices/').json()
+
+    def assertStatsExact(self):
+        incremental = list(IsbnPriceStats.objects.order_by('isbn13').values_list('isbn13', 'count', 'min_price', 'median_price', 'max_price'))
+        call_command('rebuild_isbn_stats', stdout=io.StringIO())
+        self.assertEqual(list(IsbnPriceStats.objects.order_by('isbn13').values_list('isbn13', 'count', 'min_price', 'median_price', 'max_price')), incremental)
+
+    def test_canonical_isbn(self):
+        self.assertEqual(to_isbn13('0-262-03384-4'), '9780262033848')
+        self.assertEqual(to_isbn13('080442957x'), '9780804429573')
+        self.assertEqual(to_isbn13('979-10-90636-07-1'), '9791090636071')
+        for bad in ('0262033845', '9780262033849', '9770262033848', 'abc', '', None, '²' * 10, '978' + '²' * 10):
+            self.assertIsNone(to_isbn13(bad), bad)
+        self.assertEqual(set(Listing.objects.values_list('isbn13', flat=True)), {'9780262033848', '9781285741550'})
+
+    def test_offers_cheapest_first_with_stats(self):
+        with self.assertMaxQueries(QUERY_BUDGETS['book-offers']):
+            response = APIClient().get('/api/books/0262033844/offers/')
+        body = response.json()
+        self.assertEqual([row['price'] for row in body['results']], ['45.00', '52.50', '60.00', '80.00'])
+        self.assertEqual(body['stats'], {'isbn13': '9780262033848', 'count': 4, 'min_price': '45.00',
+                                         'median_price': '56.25', 'max_price': '80.00'})
+        with self.assertMaxQueries(QUERY_BUDGETS['book-prices']):
+            self.assertEqual(self.stats('978-0-262-03384-8'), body['stats'])
+        self.assertEqual(self.stats('9780000000002')['count'], 0)
+        self.assertEqual(APIClient().get('/api/books/12345/offers/').status_code, 400)
+        for path in ('offers', 'prices'):
+            self.assertEqual(APIClient().get(f'/api/books/{"²" * 10}/{path}/').status_code, 400)
+
+    def test_stats_follow_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cheapest = Listing.objects.get(price=Decimal('45.00'))
+            cheapest.price = Decimal('90.00')
+            cheapest.save()
+            self.assertEqual(self.stats()['min_price'], '52.50')
+            Listing.objects.get(price=Decimal('80.00')).deactivate(Listing.SOLD)
+            self.assertEqual(self.stats()['median_price'], '60.00')
+            # Re-typed as another book: the offer moves between ISBNs
+            moved = Listing.objects.only('id', 'isbn').get(price=Decimal('60.00'))
+            moved.isbn = '978-1-285-74155-0'
+            moved.save()
+            self.assertEqual(self.stats('9781285741550')['count'], 2)
+            Listing.objects.get(isbn='9781285741550').delete()
+        self.assertEqual(self.stats()['count'], 2)
+        self.assertEqual(self.stats('9781285741550')['max_price'], '60.00')
+        self.assertStatsExact()
+
+        import_listings(io.BytesIO(IMPORT_CSV.encode()), 'csv', self.seller)
+        self.assertEqual(self.stats('9781285741550')['count'], 2)
+        self.assertStatsExact()
+
+
+@unittest.skipUnless(importlib.util.find_spec('numpy'), 'build_related needs NumPy')
+class RelatedListingTests(QueryBudgetMixin, BookSwapTestCase):
+    BOOKS = [
+        ('Linear Algebra Done Right', 'Sheldon Axler', 'MATH 201', 'STEM', '9783319110790'),
+        ('Linear Algebra and Its Applications', 'David Lay', 'math201', 'STEM', None),
+        ('Linear Algebra Done Right', 'Sheldon Axler', 'MATH 201', 'STEM', '3319110799'),  # same edition
+        ('Calculus: Early Transcendentals', 'James Stewart', 'MATH 101', 'STEM', None),
+        ('Single Variable Calculus', 'James Stewart', 'MATH 101', 'STEM', None),
+        ('Principles of Economics', 'N. Gregory Mankiw', 'ECON 100', 'Business & Econs', None),
+        ('Macroeconomics', 'N. Gregory Mankiw', 'ECON 102', 'Business & Econs', None),
+        ('Art Through the Ages', 'Helen Gardner', 'ART 120', 'Art', None),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password123')
+        cls.listings = [
+            Listing.objects.create(seller=cls.seller, title=title, author=author, course_code=course,
+                                   category=category, isbn=isbn, price=Decimal('20.00'), condition='GOOD')
+            for title, author, course, category, isbn in cls.BOOKS
+        ]
+
+    def related(self, listing):
+        return [row['title'] for row in APIClient().get(f'/api/listings/{listing.pk}/related/').json()['results']]
+
+    def test_full_build(self):
+        axler, lay, axler_copy, stewart, stewart2, mankiw, mankiw2, gardner = self.listings
+        self.assertEqual(self.related(axler), [])
+        call_command('build_related', full=True, stdout=io.StringIO())
+        # The other copy of the same edition belongs to the offers endpoint
+        self.assertEqual(self.related(axler), ['Linear Algebra and Its Applications'])
+        self.assertEqual(self.related(stewart), ['Single Variable Calculus'])
+        self.assertEqual(self.related(mankiw2), ['Principles of Economics'])
+        self.assertEqual(self.related(gardner), [])
+        with self.assertMaxQueries(QUERY_BUDGETS['listing-related']):
+            self.assertEqual(APIClient().get(f'/api/listings/{lay.pk}/related/').status_code, 200)
+        self.assertEqual(APIClient().get('/api/listings/abc/related/').status_code, 404)
+        self.assertEqual(APIClient().get(f'/api/listings/{self.listings[-1].pk + 100}/related/').status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            gardner.deactivate(Listing.SOLD)
+        self.assertEqual(APIClient().get(f'/api/listings/{gardner.pk}/related/').status_code, 404)
+
+    def test_incremental_update(self):
+        axler, lay = self.listings[:2]
+        call_command('build_related', stdout=io.StringIO())
+        newer = Listing.objects.create(seller=self.seller, title='Linear Algebra Done Wrong', author='Sergei Treil',
+                                       course_code='MATH 201', category='STEM', price=Decimal('5.00'), condition='FAIR')
+        lay.deactivate(Listing.SOLD)
+
+        out = io.StringIO()
+        call_command('build_related', stdout=out)
+        # The new listing, and both Axler copies whose lists lost Lay
+        self.assertIn('Rebuilt 3 lists', out.getvalue())
+        self.assertEqual(self.related(axler), ['Linear Algebra Done Wrong'])
+        self.assertEqual(self.related(newer), ['Linear Algebra Done Right', 'Linear Algebra Done Right'])
+        self.assertFalse(RelatedListing.objects.filter(Q(listing=lay) | Q(related=lay)).exists())
+        call_command('build_related', stdout=out)
+        self.assertIn('Rebuilt 0 lists', out.getvalue())
+
+
+class ListingFastPathTests(BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_catalog(listings_per_seller=4, sellers=2)
+        cls.token = Token.objects.create(user=cls.users[0])
+        # Edge cases: missing optional fields, odd prices, non-ASCII text
+        Listing.objects.create(
+            seller=cls.users[1], title='Ünïcödé “Quotes” \\ 📚', author='Zoë', price=Decimal('7'),
+            condition='FAIR', category='Art', isbn=None, cover_image_url=None,
+        )
+        Listing.objects.create(
+            seller=cls.users[1], title='Expensive', author='A', price=Decimal('12345678.90'),
+            condition='GOOD', category='General', isbn='',
+        )
+
+    def render_both(self, queryset):
+        renderer = JSONRenderer()
+        slow = renderer.render(ListingSerializer(queryset, many=True).data)
+        fast = renderer.render(listing_fast_path.serialize(listing_fast_path.values(queryset)))
+        return slow, fast
+
+    def test_output_is_byte_identical(self):
+        queryset = Listing.objects.select_related('seller').order_by('id')
+        slow, fast = self.render_both(queryset)
+        self.assertEqual(fast, slow)
+        with timezone.override('Asia/Kolkata'):
+            slow, fast = self.render_both(queryset)
+            self.assertIn(b'+05:30', fast)
+            self.assertEqual(fast, slow)
+
+    def test_endpoints_match_serializer_path(self):
+        client = APIClient()
+        # Authenticated, so the catalog cache stays out of the comparison
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        listing = Listing.objects.order_by('id').last()
+        for url in ('/api/listings/?page_size=100', '/api/listings/?sort=price_desc&page_size=3',
+                    f'/api/listings/{listing.pk}/'):
+            fast = client.get(url)
+            with override_settings(LISTING_FAST_PATH=False):
+                slow = client.get(url)
+            self.assertEqual(fast.status_code, 200)
+            self.assertEqual(fast.content, slow.content, url)
+        self.assertEqual(client.get('/api/listings/999999/').status_code, 404)
+
+    def test_microbenchmark_checks_output(self):
+        out = io.StringIO()
+        call_command('bench_serializers', sizes=[5, 40], repeat=1, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 4)
+
+
+class ListingExportTests(QueryBudgetMixin, BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(listings_per_seller=5, sellers=2)
+        Listing.objects.filter(pk=Listing.objects.order_by('id')[0].pk).update(is_active=False)
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password123', is_staff=True)
+        cls.staff_token = Token.objects.create(user=cls.staff).key
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/listings/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_jsonl_streams_active_catalog_in_one_query(self):
+        with self.assertMaxQueries(1):
+            response, body = self.export('?file_format=jsonl')
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(len(rows), 9)
+        self.assertEqual([row['id'] for row in rows], sorted(row['id'] for row in rows))
+        self.assertEqual(rows[0]['price'], '11.00')
+        self.assertEqual(rows[0]['seller'], 'seller1')
+        self.assertIn('X-Export-Watermark', response)
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_gzipped_csv(self):
+        response, body = self.export('?file_format=csv&gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        rows = list(csv.DictReader(io.StringIO(gzip.decompress(body).decode())))
+        self.assertEqual(len(rows), 9)
+        self.assertEqual(rows[0]['course_code'], 'CS 201')
+
+    def test_updated_since_includes_deactivated_rows(self):
+        watermark = self.export()[0]['X-Export-Watermark']
+        changed = Listing.objects.filter(is_active=True).last()
+        changed.is_active = False
+        changed.save()
+        response, body = self.export(f'?updated_since={watermark.replace("+", "%2B")}')
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([(row['id'], row['is_active']) for row in rows], [(changed.pk, False)])
+        self.assertEqual(self.client.get('/api/listings/export/?updated_since=yesterday').status_code, 400)
+
+    async def test_asgi_streams_without_buffering(self):
+        response = await self.async_client.get('/api/listings/export/', headers={'Authorization': f'Token {self.staff_token}'})
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(body.splitlines()), 9)
+
+    def test_staff_and_partners_only_and_throttled(self):
+        self.assertIn(APIClient().get('/api/listings/export/').status_code, (401, 403))
+        student, partner = (User.objects.create_user(name, f'{name}@example.com', 'password123') for name in ('student', 'partner'))
+        partner.user_permissions.add(Permission.objects.get(codename='export_listing'))
+        client = APIClient()
+        client.force_authenticate(student)
+        self.assertEqual(client.get('/api/listings/export/').status_code, 403)
+        client.force_authenticate(User.objects.get(pk=partner.pk))
+        with override_settings(THROTTLE_RATES={'export': '2/hour'}):
+            self.assertEqual([client.get('/api/listings/export/').status_code for _ in range(3)], [200, 200, 429])
+
+    def test_management_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'listings.jsonl.gz')
+            call_command('export_listings', output=path, gzip=True, include_inactive=True)
+            with gzip.open(path, 'rt') as f:
+                self.assertEqual(len(f.readlines()), 10)
+
+
+class ListingCacheTests(QueryBudgetMixin, BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_catalog(listings_per_seller=4, sellers=1)
+
+    def test_repeat_feed_hits_cache(self):
+        client = APIClient()
+        first = client.get('/api/listings/')
+        with self.assertMaxQueries(0):
+            second = client.get('/api/listings/')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_if_none_match_returns_304(self):
+        client = APIClient()
+        listing = Listing.objects.first()
+        etag = client.get(f'/api/listings/{listing.pk}/')['ETag']
+        response = client.get(f'/api/listings/{listing.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_listing_write_bumps_version(self):
+        client = APIClient()
+        listing = Listing.objects.first()
+        before = client.get(f'/api/listings/{listing.pk}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.price = Decimal('1.00')
+            listing.save()
+        after = client.get(f'/api/listings/{listing.pk}/')
+        self.assertNotEqual(before['ETag'], after['ETag'])
+        self.assertEqual(after.json()['price'], '1.00')
+
+    def test_login_does_not_bump_version(self):
+        version = catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users[0].save(update_fields=['last_login'])
+        self.assertEqual(catalog_version(), version)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users[0].email = 'renamed@example.com'
+            self.users[0].save()
+        self.assertNotEqual(catalog_version(), version)
+
+
+class StubGoogleBooks:
+    """
+    Local stand-in for the Google Books volumes API. `books` maps ISBNs to
+    volumeInfo dicts; anything else is answered with no items. Responses are
+    delayed by `delay` seconds, only for the queries in `slow` if given.
+    """
+
+    def __init__(self, books=None, delay=0, slow=None):
+        self.books = books or {}
+        self.delay = delay
+        self.slow = slow
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)['q'][0]
+                stub.requests.append(query)
+                if stub.slow is None or query in stub.slow:
+                    time.sleep(stub.delay)
+                info = stub.books.get(query.removeprefix('isbn:'))
+                body = {'totalItems': 1, 'items': [{'volumeInfo': info}]} if info else {'totalItems': 0}
+                payload = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/books/v1/volumes'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.settings = override_settings(GOOGLE_BOOKS_API_URL=self.url, GOOGLE_BOOKS_API_KEY=None)
+        self.settings.enable()
+        book_lookup.cache.clear()
+        return self
+
+    def __exit__(self, *exc):
+        self.settings.disable()
+        self.server.shutdown()
+        self.server.server_close()
+        book_lookup.cache.clear()
+
+
+SICP = {
+    'title': 'Structure and Interpretation of Computer Programs',
+    'authors': ['Harold Abelson', 'Gerald Jay Sussman'],
+    'industryIdentifiers': [{'type': 'ISBN_13', 'identifier': '9780262510875'}],
+    'imageLinks': {'thumbnail': 'http://books.example/sicp.jpg'},
+}
+
+
+class BookLookupCacheTests(QueryBudgetMixin, BookSwapTestCase):
+    def lookup(self, **params):
+        return APIClient().get('/api/books/lookup/', params)
+
+    def test_hit_is_cached_in_memory_and_table(self):
+        with StubGoogleBooks({'9780262510875': SICP}) as stub:
+            first = self.lookup(isbn='978-0262510875')
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(first.data['author'], 'Harold Abelson, Gerald Jay Sussman')
+            with self.assertMaxQueries(0):
+                self.lookup(isbn='9780262510875')
+
+            book_lookup.cache.clear()  # e.g. another worker
+            with self.assertMaxQueries(1):
+                again = self.lookup(isbn='9780262510875')
+            self.assertEqual(again.data, first.data)
+            self.assertEqual(len(stub.requests), 1)
+        self.assertTrue(IsbnMetadata.objects.get(isbn='9780262510875').found)
+
+    def test_miss_is_cached_for_less_time(self):
+        with StubGoogleBooks() as stub:
+            self.assertEqual(self.lookup(isbn='9780000000000').status_code, 404)
+            self.assertEqual(self.lookup(isbn='9780000000000').status_code, 404)
+            self.assertEqual(len(stub.requests), 1)
+        row = IsbnMetadata.objects.get(isbn='9780000000000')
+        self.assertFalse(row.found)
+        self.assertLess(row.expires_at - row.fetched_at, timedelta(seconds=3601))
+
+    def test_upstream_down(self):
+        with StubGoogleBooks() as stub:
+            url = stub.url
+        with override_settings(GOOGLE_BOOKS_API_URL=url, GOOGLE_BOOKS_TIMEOUT=(0.5, 0.5)):
+            self.assertEqual(self.lookup(q='nothing listens here').status_code, 503)
+
+
+class ThrottlingTests(BookSwapTestCase):
+    def test_token_bucket_refills(self):
+        self.assertEqual([take_token('bucket', 2, 1.0, now=0) for _ in range(3)], [0, 0, 1.0])
+        self.assertEqual(take_token('bucket', 2, 1.0, now=0.5), 0.5)
+        self.assertEqual(take_token('bucket', 2, 1.0, now=1.5), 0)
+
+    @override_settings(THROTTLE_RATES={'login': '3/min'})
+    def test_scope_is_throttled_per_client(self):
+        client = APIClient(REMOTE_ADDR='10.0.0.1')
+        statuses = [client.post('/api/login/', {'username': 'nobody', 'password': 'x'}).status_code for _ in range(4)]
+        self.assertEqual(statuses, [400, 400, 400, 429])
+        response = client.post('/api/login/', {'username': 'nobody', 'password': 'x'})
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        # Another client, and an unthrottled scope, are unaffected
+        other = APIClient(REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(other.post('/api/login/', {'username': 'nobody', 'password': 'x'}).status_code, 400)
+        self.assertEqual(client.get('/api/listings/').status_code, 200)
+
+        admin = User.objects.create_user('admin', 'admin@example.com', 'password123', is_staff=True)
+        client.force_authenticate(admin)
+        stats = client.get('/api/throttles/').json()
+        self.assertGreaterEqual(stats['throttles']['login']['throttled'], 2)
+        self.assertEqual(stats['throttles']['login']['rate'], '3/min')
+
+    @override_settings(BOOK_LOOKUP_MAX_IN_FLIGHT=1)
+    def test_lookups_are_shed_when_upstream_is_busy(self):
+        with StubGoogleBooks({'sicp': SICP}, delay=0.5, slow={'slow query'}):
+            slow = threading.Thread(target=lambda: book_lookup.lookup(query='slow query'))
+            slow.start()
+            while not book_lookup.upstream.in_flight:
+                time.sleep(0.01)
+            response = APIClient().get('/api/books/lookup/', {'q': 'sicp'})
+            slow.join()
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '2')
+            self.assertEqual(APIClient().get('/api/books/lookup/', {'q': 'sicp'}).status_code, 200)
+
+
+class MetricsTests(BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(listings_per_seller=3, sellers=1)
+        cls.admin = User.objects.create_user('admin', 'admin@example.com', 'password123', is_staff=True)
+
+    def scrape(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return {
+            line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in response.content.decode().splitlines() if not line.startswith('#')
+        }
+
+    def test_routes_are_timed_with_queries_and_upstream_calls(self):
+        before = self.scrape()
+        client = APIClient()
+        client.get('/api/listings/')
+        client.get(f'/api/listings/{Listing.objects.first().pk}/')
+        client.get('/no/such/page/')
+        with StubGoogleBooks({'9780262510875': SICP}):
+            client.get('/api/books/lookup/', {'isbn': '9780262510875'})
+        after = self.scrape()
+
+        def delta(series):
+            return after.get(series, 0) - before.get(series, 0)
+
+        for route in ('listings', 'listing-detail', 'unmatched', 'lookup'):
+            self.assertEqual(delta(f'bookswap_request_duration_seconds_count{{route="{route}",method="GET"}}'), 1)
+        self.assertEqual(delta('bookswap_request_db_queries_sum{route="listings",method="GET"}'), QUERY_BUDGETS['listings'])
+        self.assertGreater(delta('bookswap_request_db_seconds_sum{route="listings",method="GET"}'), 0)
+        self.assertGreater(delta('bookswap_request_upstream_seconds_sum{route="lookup",method="GET"}'), 0)
+        self.assertEqual(delta('bookswap_upstream_call_duration_seconds_count{service="google_books"}'), 1)
+        self.assertIn('bookswap_token_cache_hits_total', after)
+        self.assertIn('bookswap_throttle_requests_total{scope="lookup",outcome="allowed"}', after)
+
+    def test_metrics_are_staff_only(self):
+        self.assertIn(APIClient().get('/metrics').status_code, (401, 403))
+
+    @override_settings(SLOW_REQUEST_THRESHOLD=0.000001)
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with self.assertLogs('core.metrics', 'WARNING') as logs:
+            APIClient().get('/api/listings/')
+        self.assertIn('(listings)', logs.output[0])
+        self.assertIn('FROM "core_listing"', logs.output[0])
+
+
+class BookLookupCoalescingTests(TransactionTestCase):
+    def test_concurrent_lookups_share_one_upstream_call(self):
+        with StubGoogleBooks({'sicp': SICP}, delay=0.3) as stub:
+            results = []
+            threads = [
+                threading.Thread(target=lambda: results.append(book_lookup.lookup(query='sicp')))
+                for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(stub.requests), 1)
+        self.assertEqual([r['isbn'] for r in results], ['9780262510875'] * 8)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, COVER_WARMING='off', SAVED_SEARCH_MATCHING='off')
+class BookBatchLookupTests(TransactionTestCase):
+    def batch(self, payload):
+        return APIClient().post('/api/books/lookup/batch/', payload, format='json')
+
+    def test_items_resolve_concurrently(self):
+        books = {'9780262510875': SICP, 'algorithms': SICP}
+        # The in-memory test database locks whole tables, so concurrent metadata writes can
+        # fail at random; fail them all, which the lookups must survive
+        locked = mock.patch.object(IsbnMetadata.objects, 'update_or_create',
+                                   side_effect=OperationalError('database table is locked'))
+        with StubGoogleBooks(books, delay=0.3), locked, self.assertLogs('core.books', 'WARNING') as logs:
+            started = time.monotonic()
+            response = self.batch({'items': [
+                {'isbn': '9780262510875'}, {'q': 'algorithms'}, {'isbn': '9780000000000'},
+            ]})
+            elapsed = time.monotonic() - started
+        self.assertEqual(len(logs.records), 2)
+        self.assertTrue(response.data['complete'], response.data)
+        self.assertEqual([r['status'] for r in response.data['results']], ['found', 'found', 'not_found'])
+        self.assertEqual(response.data['results'][0]['book']['title'], SICP['title'])
+        self.assertLess(elapsed, 0.8)
+
+    def test_deadline_returns_partial_results(self):
+        with StubGoogleBooks({'9780262510875': SICP}, delay=1.0, slow={'slow query'}):
+            with override_settings(BOOK_LOOKUP_BATCH_DEADLINE=0.3):
+                response = self.batch({'items': [{'q': 'slow query'}, {'isbn': '9780262510875'}]})
+        self.assertFalse(response.data['complete'])
+        self.assertEqual([r['status'] for r in response.data['results']], ['timeout', 'found'])
+
+    def test_batch_size_is_capped(self):
+        with override_settings(BOOK_LOOKUP_BATCH_MAX=2):
+            response = self.batch({'isbns': ['1', '2', '3']})
+        self.assertEqual(response.status_code, 400)
+
+    def test_malformed_batches_are_rejected(self):
+        with StubGoogleBooks({}) as stub:
+            for payload in (['9780131103627'], {'isbns': '9780131103627'}, {'items': [{'isbn': ' '}]},
+                            {'items': ['9780131103627']}, {'isbns': []}, {}):
+                with self.subTest(payload=payload):
+                    self.assertEqual(self.batch(payload).status_code, 400)
+        self.assertEqual(stub.requests, [])
+
+
+IMPORT_CSV = """title,author,isbn,condition,price,category,course_code
+Calculus,James Stewart,9781285741550,GOOD,45.00,STEM,MATH 101
+Broken Row,Nobody,,MINT,abc,STEM,
+Microeconomics,Pindyck,,FAIR,20,Business & Econs,ECON 201
+"""
+
+
+def png_bytes(width, height, rgb=(200, 60, 40)):
+    """A solid-colour PNG, built by hand so the tests don't need Pillow."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    rows = b''.join(b'\x00' + bytes(rgb) * width for _ in range(height))
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b'')
+
+
+class StubImageServer:
+    """
+    Local stand-in for a cover host. `images` maps paths to PNG bytes, or to
+    a URL to redirect to; anything else is a 404.
+    """
+
+    def __init__(self, images=None):
+        self.images = images or {}
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = urlparse(self.path).path
+                stub.requests.append(path)
+                body = stub.images.get(path)
+                if isinstance(body, str):
+                    self.send_response(302)
+                    self.send_header('Location', body)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200 if body else 404)
+                self.send_header('Content-Type', 'image/png' if body else 'text/plain')
+                self.send_header('Content-Length', str(len(body or b'')))
+                self.end_headers()
+                self.wfile.write(body or b'')
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class CoverCacheMixin:
+    def setUp(self):
+        super().setUp()
+        self.root = self.enterContext(tempfile.TemporaryDirectory())
+        # The stub is on loopback, which real cover hosts never are
+        self.enterContext(override_settings(COVER_CACHE_ROOT=self.root, COVER_ALLOWED_HOSTS=['127.0.0.1'],
+                                            COVER_ALLOW_PRIVATE_ADDRESSES=True))
+        self.stub = self.enterContext(StubImageServer({'/sicp.png': png_bytes(300, 450)}))
+        self.cover = self.stub.url + '/sicp.png'
+
+
+@override_settings(COVER_WARMING='sync')
+class CoverCacheTests(CoverCacheMixin, BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('coverseller', 'coverseller@example.com', 'password123')
+
+    def create(self, cover_image_url, title='SICP'):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        payload = {'title': title, 'author': 'Abelson', 'price': '30.00', 'condition': 'GOOD',
+                   'category': 'STEM', 'cover_image_url': cover_image_url}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/listings/create/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Listing.objects.get(pk=response.data['id'])
+
+    def test_cover_is_fetched_once_and_listings_repointed(self):
+        first, second = self.create(self.cover), self.create(self.cover, title='SICP (2e)')
+        self.assertEqual(self.stub.requests, ['/sicp.png'])
+        cover = CoverImage.objects.get(source_url=self.cover)
+        self.assertEqual(cover.status, CoverImage.READY)
+        for listing in (first, second):
+            self.assertEqual(listing.cover_image_url, f'http://127.0.0.1:8000/api/covers/{cover.name}')
+            self.assertEqual(listing.cover_source_url, self.cover)
+
+        feed = APIClient().get('/api/listings/').json()['results']
+        self.assertEqual({row['cover_image_url'] for row in feed}, {f'http://127.0.0.1:8000/api/covers/{cover.name}'})
+
+    def test_repointed_listing_round_trips(self):
+        listing = self.create(self.cover)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        body = client.get(f'/api/listings/{listing.pk}/').json()
+        self.assertTrue(is_local(body['cover_image_url']))
+        response = client.put(f'/api/listings/{listing.pk}/', body, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        listing.refresh_from_db()
+        self.assertEqual((listing.cover_image_url, listing.cover_source_url), (body['cover_image_url'], self.cover))
+
+    def test_served_with_long_lived_cache_headers(self):
+        url = self.create(self.cover).cover_image_url
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        body = b''.join(response.streaming_content)
+
+        revalidated = self.client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(self.client.get('/api/covers/' + 'f' * 64 + '.png').status_code, 404)
+        self.assertEqual(self.client.get('/api/covers/..%2Fsecret.png').status_code, 404)
+
+        try:
+            from PIL import Image
+        except ImportError:
+            return
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(Image.open(io.BytesIO(body)).size, (240, 360))
+
+    def test_missing_cover_keeps_remote_url_and_is_not_refetched(self):
+        gone = self.stub.url + '/gone.png'
+        listing = self.create(gone)
+        self.create(gone, title='again')
+        self.assertEqual(self.stub.requests, ['/gone.png'])
+        self.assertEqual(CoverImage.objects.get(source_url=gone).status, CoverImage.MISSING)
+        listing.refresh_from_db()
+        self.assertEqual(listing.cover_image_url, gone)
+
+    def test_only_public_addresses_on_allowed_hosts_are_fetched(self):
+        self.stub.images['/hop.png'] = self.stub.url + '/sicp.png'
+        self.stub.images['/metadata.png'] = 'http://169.254.169.254/latest/meta-data/'
+        with override_settings(COVER_ALLOWED_HOSTS=['covers.openlibrary.org']):
+            listing = self.create(self.cover)
+        self.assertEqual(listing.cover_image_url, self.cover)
+        self.assertFalse(self.stub.requests)
+        self.assertFalse(CoverImage.objects.exists())
+
+        with override_settings(COVER_ALLOW_PRIVATE_ADDRESSES=False), self.assertLogs('core.covers', 'WARNING'):
+            self.create(self.stub.url + '/sicp.png', title='loopback')
+        self.assertFalse(self.stub.requests)
+        self.assertEqual(CoverImage.objects.get().status, CoverImage.FAILED)
+
+        # Each redirect hop is checked too
+        self.assertTrue(is_local(self.create(self.stub.url + '/hop.png', title='hop').cover_image_url))
+        with override_settings(COVER_ALLOWED_HOSTS=['127.0.0.1', '169.254.169.254']), self.assertLogs('core.covers', 'WARNING'):
+            self.create(self.stub.url + '/metadata.png', title='metadata')
+        self.assertEqual(CoverImage.objects.get(source_url=self.stub.url + '/metadata.png').status, CoverImage.FAILED)
+        self.assertEqual(self.stub.requests, ['/hop.png', '/sicp.png', '/metadata.png'])
+
+    def test_warm_covers_command(self):
+        with override_settings(COVER_WARMING='off'):
+            listing = self.create(self.cover)
+        self.assertFalse(self.stub.requests)
+        out = io.StringIO()
+        call_command('warm_covers', workers=1, stdout=out)
+        self.assertIn('1 ready', out.getvalue())
+        listing.refresh_from_db()
+        self.assertTrue(is_local(listing.cover_image_url))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, COVER_WARMING='async', SAVED_SEARCH_MATCHING='off')
+class CoverWarmingTests(CoverCacheMixin, TransactionTestCase):
+    def test_warming_runs_in_the_background_once_per_url(self):
+        seller = User.objects.create_user('coverseller', 'coverseller@example.com', 'password123')
+        Listing.objects.create(seller=seller, title='SICP', author='Abelson', price=Decimal('30.00'),
+                               condition='GOOD', category='STEM', cover_image_url=self.cover)
+        futures = [cover_cache.warm(self.cover) for _ in range(3)]
+        covers = {future.result(timeout=5) for future in futures}
+        self.assertEqual(len(self.stub.requests), 1)
+        self.assertEqual(len(covers), 1)
+        self.assertTrue(is_local(Listing.objects.get().cover_image_url))
+
+
+class ListingImportTests(BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('society', 'society@example.com', 'password123')
+        cls.token = Token.objects.create(user=cls.seller)
+
+    def upload(self, name, content):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        upload = SimpleUploadedFile(name, content.encode())
+        return client.post('/api/listings/import/', {'file': upload}, format='multipart')
+
+    def test_csv_upload_reports_bad_rows(self):
+        response = self.upload('drive.csv', IMPORT_CSV)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 1))
+        self.assertEqual(response.data['errors'][0]['line'], 3)
+        self.assertEqual(set(response.data['errors'][0]['errors']), {'condition', 'price'})
+
+        calculus = Listing.objects.get(title='Calculus')
+        self.assertEqual(calculus.seller, self.seller)
+        self.assertEqual(calculus.course_code, 'MATH 101')
+        # save() is bypassed by bulk_create; the derived cover must still be set
+        self.assertEqual(calculus.cover_image_url, 'https://covers.openlibrary.org/b/isbn/9781285741550-M.jpg')
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=0)
+    def test_jsonl_upload_spooled_to_disk(self):
+        lines = [
+            json.dumps({'title': f'Book {i}', 'author': 'A', 'condition': 'GOOD', 'price': '5.00', 'category': 'General'})
+            for i in range(5)
+        ] + ['not json']
+        response = self.upload('drive.jsonl', '\n'.join(lines))
+        self.assertEqual((response.data['created'], response.data['failed']), (5, 1))
+
+    def test_imported_rows_are_searchable_and_visible(self):
+        APIClient().get('/api/listings/')  # warm the feed cache
+        self.upload('drive.csv', IMPORT_CSV)
+        titles = [row['title'] for row in APIClient().get('/api/listings/').json()['results']]
+        self.assertIn('Microeconomics', titles)
+        self.assertEqual(APIClient().get('/api/listings/search/?q=microecon').json()['count'], 1)
+
+    def test_management_command_batches_and_writes_report(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, 'drive.csv')
+            report = os.path.join(tmp, 'report.jsonl')
+            with open(source, 'w') as f:
+                f.write(IMPORT_CSV)
+            call_command('import_listings', source, seller='society', batch_size=1,
+                         report=report, stdout=io.StringIO())
+            with open(report) as f:
+                rejected = [json.loads(line) for line in f]
+        self.assertEqual(Listing.objects.filter(seller=self.seller).count(), 2)
+        self.assertEqual([row['line'] for row in rejected], [3])
+
+
+class MessagingTests(QueryBudgetMixin, BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller, = seed_catalog(listings_per_seller=12, sellers=1)
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'password123')
+        cls.tokens = {u.username: Token.objects.create(user=u).key for u in (cls.seller, cls.buyer)}
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.tokens[user.username]}')
+        return client
+
+    def open_conversations(self, count):
+        for listing in Listing.objects.all()[:count]:
+            self.client_for(self.buyer).post(
+                '/api/conversations/', {'listing': listing.pk, 'content': f'Is {listing.title} available?'}, format='json'
+            )
+
+    def test_inbox_is_one_query_regardless_of_size(self):
+        self.open_conversations(2)
+        with self.assertMaxQueries(QUERY_BUDGETS['conversations']):
+            small = self.client_for(self.seller).get('/api/conversations/')
+        self.open_conversations(12)
+        with self.assertMaxQueries(QUERY_BUDGETS['conversations']):
+            large = self.client_for(self.seller).get('/api/conversations/')
+        self.assertEqual((len(small.data), len(large.data)), (2, 12))
+        entry = large.data[0]
+        self.assertEqual(entry['unread_count'], 1)
+        self.assertEqual(entry['last_message_sender'], 'buyer')
+        self.assertTrue(entry['listing_title'])
+
+    def test_thread_paging_and_read_marking(self):
+        self.open_conversations(1)
+        conversation = Conversation.objects.get()
+        url = f'/api/conversations/{conversation.pk}/messages/'
+        for i in range(4):
+            self.client_for(self.buyer).post(url, {'content': f'follow-up {i}'}, format='json')
+
+        seller = self.client_for(self.seller)
+        with self.assertMaxQueries(QUERY_BUDGETS['messages']):
+            first = seller.get(url + '?page_size=3').data
+        self.assertEqual([m['content'] for m in first['results']], ['follow-up 3', 'follow-up 2', 'follow-up 1'])
+        # Only what the seller has seen is read
+        self.assertEqual(Message.objects.filter(is_read=False).count(), 2)
+        self.assertEqual(seller.get('/api/conversations/').data[0]['unread_count'], 2)
+        second = seller.get(first['next']).data
+        self.assertEqual(len(second['results']), 2)
+        self.assertIsNone(second['next'])
+
+        inbox = seller.get('/api/conversations/').data
+        self.assertEqual(inbox[0]['unread_count'], 0)
+        self.assertFalse(Message.objects.filter(is_read=False).exists())
+
+    def test_outsiders_cannot_read_threads(self):
+        self.open_conversations(1)
+        outsider = User.objects.create_user('outsider', 'outsider@example.com', 'password123')
+        client = APIClient()
+        client.force_authenticate(outsider)
+        conversation = Conversation.objects.get()
+        self.assertEqual(client.get(f'/api/conversations/{conversation.pk}/messages/').status_code, 404)
+
+    def test_listing_must_be_an_id(self):
+        for listing in ('abc', {'id': 1}):
+            with self.subTest(listing=listing):
+                response = self.client_for(self.buyer).post('/api/conversations/', {'listing': listing}, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('listing', response.data)
+
+    def test_sellers_cannot_message_themselves(self):
+        listing = Listing.objects.first()
+        response = self.client_for(self.seller).post('/api/conversations/', {'listing': listing.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(SAVED_SEARCH_MATCHING='sync')
+class SavedSearchTests(QueryBudgetMixin, BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = User.objects.create_user('student', 'student@example.com', 'password123')
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password123')
+        cls.token = Token.objects.create(user=cls.student).key
+
+    def client_for_student(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        return client
+
+    def save_search(self, **criteria):
+        response = self.client_for_student().post('/api/saved-searches/', criteria, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return SavedSearch.objects.get(pk=response.data['id'])
+
+    def list_book(self, seller=None, **fields):
+        values = {'title': 'Calculus: Early Transcendentals', 'author': 'James Stewart', 'isbn': '9781285741550',
+                  'price': Decimal('40.00'), 'condition': 'GOOD', 'category': 'STEM', 'course_code': 'MATH 101'}
+        values.update(fields)
+        with self.captureOnCommitCallbacks(execute=True):
+            return Listing.objects.create(seller=seller or self.seller, **values)
+
+    def matched(self):
+        return set(SavedSearchMatch.objects.values_list('search_id', 'listing_id'))
+
+    def test_create_validates_and_normalizes(self):
+        search = self.save_search(isbn='1-285-74155-2', course_code='math  101')
+        self.assertEqual((search.isbn13, search.course_code, search.anchor), ('9781285741550', 'MATH101', 'isbn:9781285741550'))
+        self.assertEqual(self.save_search(query='Stewart calculus').anchor, 'word:calculus')
+        client = self.client_for_student()
+        self.assertEqual(client.post('/api/saved-searches/', {'isbn': '12345'}, format='json').status_code, 400)
+        self.assertEqual(client.post('/api/saved-searches/', {'isbn': '²' * 10}, format='json').status_code, 400)
+        self.assertEqual(client.post('/api/saved-searches/', {'max_price': '10.00'}, format='json').status_code, 400)
+        self.assertEqual(len(client.get('/api/saved-searches/').data), 2)
+        with override_settings(SAVED_SEARCHES_PER_USER=2):
+            self.assertEqual(client.post('/api/saved-searches/', {'query': 'physics'}, format='json').status_code, 400)
+
+    def test_new_listings_match_every_criterion(self):
+        by_isbn = self.save_search(isbn='9781285741550')
+        by_course = self.save_search(course_code='MATH101', max_price='30.00')
+        by_words = self.save_search(query='stewart calculus', category='STEM')
+        unrelated = self.save_search(query='stewart calculus', category='Art')
+
+        listing = self.list_book()
+        self.assertEqual(self.matched(), {(by_isbn.pk, listing.pk), (by_words.pk, listing.pk)})
+        cheap = self.list_book(isbn='', price=Decimal('25.00'))
+        self.assertEqual(self.matched() - {(by_isbn.pk, listing.pk), (by_words.pk, listing.pk)},
+                         {(by_course.pk, cheap.pk), (by_words.pk, cheap.pk)})
+        # The student's own listing notifies nobody; matching again records nothing new
+        self.list_book(seller=self.student)
+        match_listings([listing.pk, cheap.pk])
+        self.assertEqual(SavedSearchMatch.objects.count(), 4)
+        self.assertFalse(SavedSearchMatch.objects.filter(search=unrelated).exists())
+
+    def test_index_agrees_with_checking_every_search(self):
+        for criteria in [{'query': 'calculus'}, {'query': 'early stewart'}, {'course_code': 'CS 201'},
+                         {'category': 'STEM', 'max_price': '15.00'}, {'query': 'algorithms', 'isbn': '0262033844'}]:
+            self.save_search(**criteria)
+        with self.captureOnCommitCallbacks(execute=True):
+            seed_catalog(listings_per_seller=5, sellers=2)
+        listings = Listing.objects.exclude(seller=self.student)
+        expected = {
+            (search.pk, listing.pk)
+            for search in SavedSearch.objects.all() for listing in listings
+            if search.accepts(listing_keys(listing.isbn13, listing.course_code, listing.category, listing.title, listing.author), listing.price)
+        }
+        self.assertTrue(expected)
+        self.assertEqual(self.matched(), expected)
+
+    def test_imported_listings_match(self):
+        search = self.save_search(query='microeconomics')
+        with self.captureOnCommitCallbacks(execute=True):
+            import_listings(io.BytesIO(IMPORT_CSV.encode()), 'csv', self.seller)
+        self.assertEqual(self.matched(), {(search.pk, Listing.objects.get(title='Microeconomics').pk)})
+
+    def test_matches_inbox_pages_and_marks_read(self):
+        self.save_search(query='calculus')
+        for edition in range(5):
+            self.list_book(title=f'Calculus ({edition + 1}e)')
+        client = self.client_for_student()
+        with self.assertMaxQueries(QUERY_BUDGETS['saved-search-matches']):
+            first = client.get('/api/saved-searches/matches/?page_size=3').data
+        self.assertEqual([match['listing']['title'] for match in first['results']],
+                         ['Calculus (5e)', 'Calculus (4e)', 'Calculus (3e)'])
+        self.assertEqual(SavedSearchMatch.objects.filter(is_read=False).count(), 2)
+        second = client.get(first['next']).data
+        self.assertEqual(len(second['results']), 2)
+        self.assertFalse(SavedSearchMatch.objects.filter(is_read=False).exists())
+        # Deleting a search deletes its matches
+        search_id = first['results'][0]['search']
+        self.assertEqual(client.delete(f'/api/saved-searches/{search_id}/').status_code, 204)
+        self.assertFalse(SavedSearchMatch.objects.exists())
+
+
+class JobQueueTests(BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', 'seller@example.com', 'password123')
+
+    def list_book(self, **fields):
+        values = {'title': 'Microeconomics', 'author': 'Pindyck', 'price': Decimal('20.00'),
+                  'condition': 'GOOD', 'category': 'Business & Econs'}
+        values.update(fields)
+        return Listing.objects.create(seller=self.seller, **values)
+
+    def work(self):
+        worker = Worker('test-worker', threading.Event(), burst=True, poll_interval=0)
+        worker.run()
+        return worker.processed
+
+    def test_dedupe_and_delay(self):
+        url = 'https://covers.example/a.jpg'
+        for _ in range(2):
+            enqueue('covers.warm', {'url': url}, dedupe_key='cover:a')
+        enqueue('saved_searches.match', {'ids': []}, delay=60)
+        self.assertEqual(Job.objects.filter(name='covers.warm').count(), 1)
+        jobs = claim('worker-1', limit=5)
+        self.assertEqual([job.name for job in jobs], ['covers.warm'])  # the delayed one isn't due
+        self.assertEqual(claim('worker-2', limit=5), [])
+        # Held while running too; free again once the job is finished
+        enqueue('covers.warm', {'url': url}, dedupe_key='cover:a')
+        self.assertEqual(Job.objects.filter(name='covers.warm').count(), 1)
+        Job.objects.filter(pk=jobs[0].pk).update(status=Job.DONE)
+        enqueue('covers.warm', {'url': url}, dedupe_key='cover:a')
+        self.assertEqual(Job.objects.filter(name='covers.warm', status=Job.QUEUED).count(), 1)
+        with self.assertRaises(ValueError):
+            enqueue('no.such.job')
+
+    def test_failures_back_off_then_give_up(self):
+        enqueue('saved_searches.match', {'ids': ['not an id']}, max_attempts=2)
+        with self.assertLogs('core.jobs', 'WARNING'):
+            self.assertEqual(self.work(), 1)
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('ValueError', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=5))
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.work()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_jobs_of_dead_workers_are_requeued(self):
+        enqueue('saved_searches.match', {'ids': []})
+        claim('dead-worker')
+        self.assertEqual(requeue_stale(), 0)
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(self.work(), 1)
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    @override_settings(SAVED_SEARCH_MATCHING='queue', COVER_WARMING='queue')
+    def test_listing_work_is_queued_with_the_listing(self):
+        search = SavedSearch.objects.create(user=User.objects.create_user('student', 'student@example.com', 'x'),
+                                            query='microeconomics')
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.list_book(isbn='9781285741550')
+            self.list_book(isbn='9781285741550')
+        self.assertEqual(Job.objects.filter(name='covers.warm').count(), 1)  # one cover URL
+        self.assertEqual(Job.objects.filter(name='saved_searches.match').count(), 2)
+        self.assertEqual(queue_stats()[('saved_searches.match', Job.QUEUED)][0], 2)
+
+        Job.objects.filter(name='covers.warm').delete()  # no network in tests
+        self.assertEqual(self.work(), 2)
+        self.assertTrue(SavedSearchMatch.objects.filter(search=search, listing=first).exists())
+        self.assertEqual(queue_stats(), {})
+
+    def test_queue_depth_is_exported(self):
+        enqueue('saved_searches.match', {'ids': []})
+        admin = User.objects.create_user('admin', 'admin@example.com', 'password123', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+        body = client.get('/metrics').content.decode()
+        self.assertIn('bookswap_jobs{job="saved_searches.match",status="queued"} 1', body)
+        self.assertIn('bookswap_job_oldest_due_seconds{job="saved_searches.match"}', body)
+
+
+class BrokerTests(BookSwapTestCase):
+    async def test_bounded_queue_drops_oldest(self):
+        broker = InProcessBackend()
+        with broker.subscribe('room', maxsize=2) as subscription:
+            for i in range(3):
+                broker.publish('room', {'id': i})
+            await asyncio.sleep(0)
+            self.assertEqual([await subscription.get(0.1) for _ in range(2)], [{'id': 1}, {'id': 2}])
+            self.assertEqual(subscription.dropped, 1)
+        self.assertEqual(broker.stats()['subscribers'], 0)
+
+    async def test_backends_implement_the_whole_contract(self):
+        class OneSubscriber(BrokerBackend):
+            def publish(self, channel, message):
+                self.subscription.deliver(message)
+
+            def subscribe(self, channel, maxsize):
+                self.subscription = Subscription(self, channel, maxsize)
+                return self.subscription
+
+            def unsubscribe(self, subscription):
+                self.subscription = None
+
+        class NoUnsubscribe(BrokerBackend):
+            publish = OneSubscriber.publish
+            subscribe = OneSubscriber.subscribe
+
+        with self.assertRaises(TypeError):
+            NoUnsubscribe()
+        broker = OneSubscriber()
+        with broker.subscribe('room', maxsize=1):
+            broker.publish('room', {'id': 1})
+            broker.publish('room', {'id': 2})
+        self.assertIsNone(broker.subscription)
+        self.assertEqual(broker.stats(), {'dropped': 1})
+
+
+@override_settings(MESSAGE_STREAM_HEARTBEAT=0.2)
+class RealtimeMessageTests(BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seller, = seed_catalog(listings_per_seller=1, sellers=1)
+        cls.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'password123')
+        cls.conversation = Conversation.objects.create(
+            listing=Listing.objects.get(), buyer=cls.buyer, seller=seller
+        )
+        cls.first = Message.objects.create(conversation=cls.conversation, sender=cls.buyer, content='Hi!')
+        cls.headers = {'Authorization': f'Token {Token.objects.create(user=seller).key}'}
+
+    def send(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Message.objects.create(conversation=self.conversation, sender=self.buyer, content=content)
+
+    def url(self, kind, since):
+        return f'/api/conversations/{self.conversation.pk}/{kind}/?since={since}'
+
+    async def test_poll_returns_backlog_immediately(self):
+        response = await self.async_client.get(self.url('poll', 0), headers=self.headers)
+        self.assertEqual([m['content'] for m in response.json()['results']], ['Hi!'])
+
+    async def test_poll_wakes_on_new_message(self):
+        poll = asyncio.ensure_future(
+            self.async_client.get(self.url('poll', self.first.pk) + '&timeout=5', headers=self.headers)
+        )
+        await asyncio.sleep(0.1)
+        await sync_to_async(self.send)('Still available?')
+        response = await asyncio.wait_for(poll, 3)
+        self.assertEqual([m['content'] for m in response.json()['results']], ['Still available?'])
+
+    async def test_stream_sends_backlog_then_live_messages(self):
+        response = await self.async_client.get(self.url('stream', 0), headers=self.headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = response.streaming_content
+        self.assertTrue((await anext(events)).startswith(b'retry:'))
+        self.assertIn(b'"content": "Hi!"', await anext(events))
+        await sync_to_async(self.send)('Live one')
+        live = await asyncio.wait_for(anext(events), 3)
+        self.assertIn(b'"content": "Live one"', live)
+        await events.aclose()
+
+    async def test_requires_participant(self):
+        response = await self.async_client.get(self.url('poll', 0))
+        self.assertEqual(response.status_code, 401)
+        outsider = await sync_to_async(User.objects.create_user)('outsider', 'o@example.com', 'password123')
+        key = (await sync_to_async(Token.objects.create)(user=outsider)).key
+        response = await self.async_client.get(self.url('poll', 0) + f'&token={key}')
+        self.assertEqual(response.status_code, 404)
+
+
+class CachedTokenAuthenticationTests(QueryBudgetMixin, BookSwapTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+        cls.key = Token.objects.create(user=cls.user).key
+
+    def get(self, client=None):
+        client = client or APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.key}')
+        return client.get('/api/conversations/')
+
+    def test_repeat_requests_skip_token_query(self):
+        self.get()
+        with self.assertMaxQueries(1):  # just the inbox query
+            self.assertEqual(self.get().status_code, 200)
+        self.assertEqual((token_cache.hits, token_cache.misses), (1, 1))
+
+    def test_logout_invalidates(self):
+        client = APIClient()
+        self.get(client)
+        client.post('/api/dj-rest-auth/logout/')
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_deactivation_invalidates(self):
+        self.get()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get().status_code, 401)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, COVER_WARMING='off', SAVED_SEARCH_MATCHING='off')
+class BenchmarkCommandTests(TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(COVER_CACHE_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+
+    def seed(self, **options):
+        call_command('seed_bookswap', users=6, listings=40, conversations=8, messages=30, seed=7,
+                     stdout=io.StringIO(), **options)
+        return list(Listing.objects.order_by('id').values_list('title', 'isbn', 'price', 'seller__username'))
+
+    def test_seed_is_deterministic(self):
+        bystander = User.objects.create_user('seedorf', 'seedorf@example.com', 'password123')
+        first = self.seed()
+        self.assertEqual(len(first), 40)
+        self.assertEqual(self.seed(clear=True), first)
+        # Only the seeded users are cleared
+        self.assertTrue(User.objects.filter(pk=bystander.pk).exists())
+        self.assertEqual(Conversation.objects.count(), 8)
+        self.assertEqual(Message.objects.count(), 30)
+        self.assertEqual(
+            APIClient().get('/api/listings/facets/').json()['total'],
+            Listing.objects.filter(is_active=True).count(),
+        )
+
+    def test_run_workers_drains_the_queue(self):
+        self.seed()
+        ids = list(Listing.objects.values_list('id', flat=True))
+        for start in range(0, len(ids), 5):
+            enqueue('saved_searches.match', {'ids': ids[start:start + 5]})
+        out = io.StringIO()
+        # One thread: the in-memory test database locks whole tables between connections
+        call_command('run_workers', burst=True, threads=1, poll_interval=0, stdout=out)
+        self.assertEqual(out.getvalue().strip(), f'Ran {len(ids) // 5} jobs.')
+        self.assertEqual(set(Job.objects.values_list('status', flat=True)), {Job.DONE})
+
+    def test_bench_reports_every_endpoint(self):
+        self.seed()
+        bystander = User.objects.create_user('bench-alice', 'alice@example.com', 'password123')
+        out = io.StringIO()
+        call_command('bench_bookswap', requests=4, threads=2, stdout=out, stderr=io.StringIO(),
+                     endpoint=['listings', 'search', 'listing-detail', 'message-stream'])
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report['endpoints']), {'listings', 'search', 'listing-detail'})
+        self.assertIn('message-stream', report['skipped'])
+        for result in report['endpoints'].values():
+            self.assertEqual(result['status'], {'200': 4})
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        # The users the bench created and their data are gone; other accounts under the prefix are not
+        self.assertEqual(list(User.objects.filter(username__startswith='bench-')), [bystander])
+
+    def test_bench_refuses_to_adopt_existing_users(self):
+        self.seed()
+        User.objects.create_user('bench-client', 'client@example.com', 'password123')
+        with self.assertRaisesMessage(CommandError, 'bench-client already exist'):
+            call_command('bench_bookswap', requests=1, endpoint=['listings'], stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertTrue(User.objects.filter(username='bench-client').exists())
 
-# Create your tests here.
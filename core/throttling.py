@@ -0,0 +1,93 @@
+# core/throttling.py
+"""
+Per-client token-bucket throttling for expensive endpoints.
+
+Views opt in with a `throttle_scope`; THROTTLE_RATES gives each scope a rate
+like "60/min", meaning a burst of up to 60 requests refilled at 60 per
+minute. Buckets are keyed by scope and by user (or client IP when
+anonymous) and live in the default cache, so every worker sharing that
+cache shares the limits. Scopes without a rate are not throttled.
+
+The cache has no compare-and-swap, so a bucket's read-modify-write is only
+serialized within a process. Workers racing on one bucket can let a few
+extra requests through; that is fine for abuse control.
+"""
+
+import threading
+import time
+import zlib
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+# Allowed / throttled requests per scope in this process
+stats = Counter()
+_stats_lock = threading.Lock()
+_locks = [threading.Lock() for _ in range(64)]
+
+
+@lru_cache(maxsize=64)
+def parse_rate(rate):
+    """'60/min' -> (capacity 60, refill 1.0 token per second)."""
+    count, _, period = rate.partition('/')
+    count, seconds = int(count), PERIODS[period.strip().lower()]
+    if count <= 0:
+        raise ValueError(f'Throttle rate must allow at least one request: {rate!r}')
+    return count, count / seconds
+
+
+def take_token(key, capacity, refill, now=None):
+    """
+    Takes one token from the bucket at `key`. Returns 0 if one was available,
+    otherwise the seconds until one will be.
+    """
+    now = time.time() if now is None else now
+    with _locks[zlib.crc32(key.encode()) % len(_locks)]:
+        tokens, stamp = cache.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + max(0.0, now - stamp) * refill)
+        wait = 0 if tokens >= 1 else (1 - tokens) / refill
+        if not wait:
+            tokens -= 1
+        # Once full again the bucket is the same as a missing one
+        cache.set(key, (tokens, now), timeout=int((capacity - tokens) / refill) + 1)
+    return wait
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttles views that set `throttle_scope`, per user or per client IP."""
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        rate = settings.THROTTLE_RATES.get(scope) if scope else None
+        if not rate:
+            return True
+        capacity, refill = parse_rate(rate)
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        self.wait_seconds = take_token(f'throttle:{scope}:{ident}', capacity, refill)
+        with _stats_lock:
+            stats[scope, 'throttled' if self.wait_seconds else 'allowed'] += 1
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+def throttle_stats():
+    """Counters for tuning THROTTLE_RATES: per scope, its rate and this process's decisions."""
+    scopes = {scope for scope, _ in stats} | set(settings.THROTTLE_RATES)
+    return {
+        scope: {
+            'rate': settings.THROTTLE_RATES.get(scope),
+            'allowed': stats[scope, 'allowed'],
+            'throttled': stats[scope, 'throttled'],
+        }
+        for scope in sorted(scopes)
+    }
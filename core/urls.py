@@ -1,33 +1,69 @@
 # core/urls.py
 from django.urls import path, include
-from rest_framework.authtoken.views import obtain_auth_token 
 from rest_framework.routers import DefaultRouter
 from .views import (
     HomeView,          
     BookLookupView, 
+    BookBatchLookupView,
+    BookOffersView,
+    BookPriceStatsView,
+    LoginView,
+    ThrottleStatsView,
+    MetricsView,
     ListingCreateView, 
+    ListingImportView,
     ListingListView, 
+    ListingSearchView,
+    ListingFacetsView,
     ListingDeleteView, 
+    ListingMarkSoldView,
     RegisterView,
-    ListingViewSet
+    ListingViewSet,
+    SavedSearchViewSet,
+    SavedSearchMatchListView,
+    ConversationListView,
+    MessageListView,
+    conversation_stream,
+    ListingExportView,
+    cover_image,
+    conversation_poll,
 )
 
 router = DefaultRouter()
 router.register(r'listings', ListingViewSet, basename='listing')
+router.register(r'saved-searches', SavedSearchViewSet, basename='saved-search')
 
 urlpatterns = [
     # 1. The Homepage (Loads your index.html)
     path('', HomeView.as_view(), name='home'),
 
     # 2. Login Endpoint (Handles the JS login request)
-    path('api/login/', obtain_auth_token, name='login'),
+    path('api/login/', LoginView.as_view(), name='login'),
 
     # 3. API Endpoints
     path('api/register/', RegisterView.as_view(), name='register'),
     path('api/books/lookup/', BookLookupView.as_view(), name='lookup'),
+    path('api/books/lookup/batch/', BookBatchLookupView.as_view(), name='lookup-batch'),
+    path('api/books/<str:isbn>/offers/', BookOffersView.as_view(), name='book-offers'),
+    path('api/books/<str:isbn>/prices/', BookPriceStatsView.as_view(), name='book-prices'),
+    path('api/throttles/', ThrottleStatsView.as_view(), name='throttle-stats'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('api/listings/', ListingListView.as_view(), name='listings'),
+    path('api/listings/search/', ListingSearchView.as_view(), name='search'),
+    path('api/listings/facets/', ListingFacetsView.as_view(), name='facets'),
     path('api/listings/create/', ListingCreateView.as_view(), name='create'),
+    path('api/listings/import/', ListingImportView.as_view(), name='import'),
+    path('api/listings/export/', ListingExportView.as_view(), name='export'),
     path('api/listings/delete/<int:pk>/', ListingDeleteView.as_view(), name='delete'),
+    path('api/listings/sold/<int:pk>/', ListingMarkSoldView.as_view(), name='mark-sold'),
+    path('api/covers/<str:name>', cover_image, name='cover'),
+
+    path('api/conversations/', ConversationListView.as_view(), name='conversations'),
+    path('api/conversations/<int:pk>/messages/', MessageListView.as_view(), name='messages'),
+    path('api/conversations/<int:pk>/stream/', conversation_stream, name='message-stream'),
+    path('api/conversations/<int:pk>/poll/', conversation_poll, name='message-poll'),
+
+    path('api/saved-searches/matches/', SavedSearchMatchListView.as_view(), name='saved-search-matches'),
 
     path('api/', include(router.urls)), 
     path('api-auth/', include('rest_framework.urls')), 
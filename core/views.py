@@ -1,21 +1,58 @@
 # core/views.py
 
+import asyncio
+import json
+from functools import partial
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse, JsonResponse
-from django.shortcuts import render
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition, require_GET, require_safe
 
-from rest_framework import generics, permissions, status, viewsets
+from rest_framework import generics, mixins, permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.generics import ListAPIView
-from decouple import config
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import MultiPartParser
 import requests
 
-from .models import Listing 
-from .serializers import UserSerializer, ListingSerializer 
+from .authentication import CachedTokenAuthentication
+from .books import book_lookup, lookup_many
+from .broker import conversation_channel, get_broker
+from .cache import CatalogCacheMixin
+from .covers import cover_cache, open_cover
+from .export import CONTENT_TYPES, FORMATS as EXPORT_FORMATS, aiterate, export_listings, parse_since
+from .fastpath import listing_fast_path
+from .facets import compute_facet_counts, read_facet_counts
+from .filters import filter_listings, is_default, parse_listing_filters, parse_sort
+from .importer import FORMATS, guess_format, import_listings
+from .isbn import to_isbn13
+from .metrics import render_metrics
+from .models import Conversation, IsbnPriceStats, Listing, Message, SavedSearchMatch
+from .offers import offers
+from .pagination import ListingCursorPagination, MessageCursorPagination, SavedSearchMatchCursorPagination
+from .search import RankedSearchResults
+from .serializers import (
+    BookBatchLookupSerializer, ConversationSerializer, IsbnPriceStatsSerializer, MessageSerializer, UserSerializer, ListingSerializer,
+    SavedSearchMatchSerializer, SavedSearchSerializer,
+)
+from .throttling import TokenBucketThrottle, throttle_stats
+from .utils import Overloaded
 
 User = get_user_model()
 
@@ -25,9 +62,15 @@ class HomeView(View):
     def get(self, request):
         return render(request, 'core/index.html')
 
+class LoginView(ObtainAuthToken):
+    """Token login, throttled per client against password guessing"""
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'login'
+
 class RegisterView(APIView):
     """Handles User Registration"""
     permission_classes = [permissions.AllowAny]
+    throttle_scope = 'register'
 
     def post(self, request):
         username = request.data.get('username')
@@ -49,8 +92,10 @@ class RegisterView(APIView):
 class BookLookupView(APIView):
     """
     Look up book details from Google Books API.
+    Results (including misses) are cached, see core/books.py.
     """
     permission_classes = [permissions.AllowAny]
+    throttle_scope = 'lookup'
 
     def get(self, request):
         isbn = request.query_params.get('isbn')
@@ -59,76 +104,542 @@ class BookLookupView(APIView):
         if not isbn and not query:
             return Response({'error': 'Provide an ISBN or a search query (q).'}, status=status.HTTP_400_BAD_REQUEST)
 
-        api_key = config('GOOGLE_BOOKS_API_KEY', default=None)
-        
-        # Determine search string
-        if isbn:
-            search_param = f"isbn:{isbn}"
-        else:
-            search_param = query
-
-        # Base URL
-        url = f'https://www.googleapis.com/books/v1/volumes?q={search_param}&maxResults=1'
-        
-        # Only append Key if it actually exists
-        if api_key:
-            url += f'&key={api_key}'
-
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-
-            if 'items' in data and data['items']:
-                book_info = data['items'][0]['volumeInfo']
-                ids = book_info.get('industryIdentifiers', [])
-                
-                # Get ISBN safely
-                found_isbn = next((identifier['identifier'] for identifier in ids 
-                                 if identifier['type'] == 'ISBN_13'), isbn or "0000000000000")
-
-                # Handle missing images safely
-                image_links = book_info.get('imageLinks') or {}
-                cover = image_links.get('thumbnail') or image_links.get('smallThumbnail', '')
-
-                prefill_data = {
-                    'title': book_info.get('title', 'Unknown Title'),
-                    'author': ', '.join(book_info.get('authors', ['Unknown Author'])),
-                    'cover_image_url': cover,
-                    'isbn': found_isbn
-                }
-                return Response(prefill_data)
-            else:
-                return Response({'error': 'No book found for that query.'}, status=status.HTTP_404_NOT_FOUND)
-
+            prefill_data = book_lookup.lookup(isbn=isbn, query=query)
         except requests.exceptions.RequestException as e:
             return Response({'error': f'Google API Error: {str(e)}'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except Overloaded:
+            return Response(
+                {'error': 'Too many lookups in progress; try again shortly.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(settings.BOOK_LOOKUP_RETRY_AFTER)},
+            )
+
+        if prefill_data is None:
+            return Response({'error': 'No book found for that query.'}, status=status.HTTP_404_NOT_FOUND)
+        # Likely to become a listing's cover; have it cached by then
+        cover_cache.warm(prefill_data.get('cover_image_url'))
+        return Response(prefill_data)
+
+
+class BookBatchLookupView(APIView):
+    """
+    Looks up several books at once, e.g. {"items": [{"isbn": "..."}, {"q": "..."}]}
+    or {"isbns": ["...", "..."]}. Upstream calls run concurrently under one
+    overall deadline; each item gets its own status.
+    """
+    permission_classes = [permissions.AllowAny]
+    throttle_scope = 'lookup-batch'
+
+    def post(self, request):
+        serializer = BookBatchLookupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = lookup_many(serializer.validated_data['items'])
+        for result in results:
+            if result['status'] == 'found':
+                cover_cache.warm(result['book'].get('cover_image_url'))
+        complete = all(result['status'] in ('found', 'not_found') for result in results)
+        busy = any(result['status'] == 'busy' for result in results)
+        headers = {'Retry-After': str(settings.BOOK_LOOKUP_RETRY_AFTER)} if busy else None
+        return Response({'complete': complete, 'results': results}, headers=headers)
+
+
+class BookPriceStatsView(CatalogCacheMixin, APIView):
+    """
+    Count, min, median and max price of the active offers for one book, e.g.
+    to suggest a price while listing it. Any ISBN-10 or ISBN-13 form works.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, isbn):
+        isbn13 = to_isbn13(isbn)
+        if isbn13 is None:
+            return Response({'error': 'Not a valid ISBN.'}, status=status.HTTP_400_BAD_REQUEST)
+        return self.cached_response(request, lambda: Response(self.stats(isbn13)))
+
+    def stats(self, isbn13):
+        row = IsbnPriceStats.objects.filter(isbn13=isbn13).first()
+        if row is None:
+            return {'isbn13': isbn13, 'count': 0, 'min_price': None, 'median_price': None, 'max_price': None}
+        return IsbnPriceStatsSerializer(row).data
+
+class BookOffersView(BookPriceStatsView):
+    """Every active offer for one book, cheapest first, with the price stats."""
+
+    def get(self, request, isbn):
+        isbn13 = to_isbn13(isbn)
+        if isbn13 is None:
+            return Response({'error': 'Not a valid ISBN.'}, status=status.HTTP_400_BAD_REQUEST)
+        return self.cached_response(request, partial(self.list_offers, isbn13))
+
+    def list_offers(self, isbn13):
+        rows = listing_fast_path.values(offers(isbn13)[:settings.LISTINGS_MAX_PAGE_SIZE])
+        return Response({'stats': self.stats(isbn13), 'results': listing_fast_path.serialize(rows)})
+
+class ThrottleStatsView(APIView):
+    """Throttle and upstream admission counters for this process, for tuning the limits."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'throttles': throttle_stats(),
+            'upstream_lookups': {'limit': settings.BOOK_LOOKUP_MAX_IN_FLIGHT, **book_lookup.upstream.stats()},
+        })
+
+class MetricsView(APIView):
+    """Prometheus scrape endpoint for this process (see core/metrics.py). Staff only."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 class ListingCreateView(generics.CreateAPIView):
     """Creates a new book listing and assigns the logged-in user as seller"""
-    queryset = Listing.objects.all()
+    queryset = Listing.objects.select_related('seller')
     serializer_class = ListingSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def perform_create(self, serializer):
         serializer.save(seller=self.request.user)
 
-class ListingListView(ListAPIView):
-    """Returns all listings, ordered by newest first"""
-    queryset = Listing.objects.all().order_by('-created_at') 
+class ListingImportView(APIView):
+    """
+    Bulk-creates listings from an uploaded CSV or JSONL file ("file" field).
+    Invalid rows are skipped and reported; valid rows are still imported.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'Upload a CSV or JSONL file in the "file" field.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        file_format = request.data.get('file_format') or guess_format(upload.name)
+        if file_format not in FORMATS:
+            return Response({'error': 'Use a .csv or .jsonl file, or set file_format.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = import_listings(upload, file_format, request.user)
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED if result.created else status.HTTP_200_OK)
+
+class ListingFilterMixin:
+    """
+    Server-side filters (see core/filters.py) and ?sort=newest|price_asc|price_desc
+    for listing lists. Only active listings are listed unless ?is_active= says otherwise.
+    """
+
+    @property
+    def cursor_ordering(self):
+        return parse_sort(self.request.query_params)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # Detail routes on the viewset still reach inactive listings
+        if getattr(self, 'action', 'list') != 'list':
+            return queryset
+        return filter_listings(queryset, parse_listing_filters(self.request.query_params))
+
+class ListingFastPathMixin:
+    """
+    Serves list and detail GETs from a values() projection through
+    core/fastpath.py instead of ListingSerializer. Same JSON, less Python.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.LISTING_FAST_PATH:
+            return super().list(request, *args, **kwargs)
+        queryset = listing_fast_path.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(listing_fast_path.serialize(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.LISTING_FAST_PATH:
+            return super().retrieve(request, *args, **kwargs)
+        queryset = listing_fast_path.values(self.filter_queryset(self.get_queryset()))
+        row = get_object_or_404(queryset, pk=self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        self.check_object_permissions(request, row)
+        return Response(listing_fast_path.to_representation(row))
+
+class ListingListView(ListingFilterMixin, CatalogCacheMixin, ListingFastPathMixin, ListAPIView):
+    """Returns filtered listings (newest first by default), one cursor page at a time"""
+    # select_related: the serializer reads seller.username / seller.email
+    queryset = Listing.objects.select_related('seller').order_by('-created_at', '-id')
+    serializer_class = ListingSerializer
+    permission_classes = [permissions.AllowAny]
+    pagination_class = ListingCursorPagination
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, partial(super().list, request, *args, **kwargs))
+
+class SearchPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+
+    def __init__(self):
+        self.page_size = settings.LISTINGS_PAGE_SIZE
+        self.max_page_size = settings.LISTINGS_MAX_PAGE_SIZE
+
+class ListingSearchView(ListAPIView):
+    """Ranked full-text search over title and author, plus exact ISBN / course code"""
     serializer_class = ListingSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = SearchPagination
+
+    def get_queryset(self):
+        query = self.request.query_params.get('q', '').strip()
+        if not query:
+            return Listing.objects.none()
+        return RankedSearchResults(query, Listing.objects.select_related('seller'))
+
+class ListingFacetsView(CatalogCacheMixin, APIView):
+    """
+    Listing counts per category, condition and price bucket. Takes the same
+    filters as the feed; the unfiltered answer comes from the counter table.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        filters = parse_listing_filters(request.query_params)
+        return self.cached_response(request, partial(self.counts, filters))
+
+    def counts(self, filters):
+        if is_default(filters):
+            return Response(read_facet_counts())
+        return Response(compute_facet_counts(filter_listings(Listing.objects.all(), filters)))
 
 class ListingDeleteView(generics.DestroyAPIView):
     """Deletes a listing. User must be the seller."""
-    queryset = Listing.objects.all()
+    queryset = Listing.objects.filter(is_active=True)
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         # Security: Filter queryset so user can only delete their own books
         return self.queryset.filter(seller=self.request.user)
-    
 
-class ListingViewSet(viewsets.ModelViewSet):
-    queryset = Listing.objects.all().order_by('-created_at')
-    serializer_class = ListingSerializer
\ No newline at end of file
+    def perform_destroy(self, instance):
+        # Soft delete: conversations about it keep their subject (see core/archive.py)
+        instance.deactivate(Listing.DELETED)
+
+class ListingMarkSoldView(generics.GenericAPIView):
+    """POST: marks a listing sold, taking it off the feed. User must be the seller."""
+    queryset = Listing.objects.filter(is_active=True)
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return self.queryset.filter(seller=self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        self.get_object().deactivate(Listing.SOLD)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ListingViewSet(ListingFilterMixin, CatalogCacheMixin, ListingFastPathMixin, viewsets.ModelViewSet):
+    queryset = Listing.objects.select_related('seller').order_by('-created_at', '-id')
+    lookup_value_regex = r'\d+'
+    serializer_class = ListingSerializer
+    pagination_class = ListingCursorPagination
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, partial(super().retrieve, request, *args, **kwargs))
+
+    def perform_destroy(self, instance):
+        instance.deactivate(Listing.DELETED)
+
+    @action(detail=True)
+    def related(self, request, pk=None):
+        """
+        Precomputed similar listings, best first (see core/related.py). Empty
+        until `manage.py build_related` has run for this listing; 404 for a
+        listing that doesn't exist or is inactive.
+        """
+        return self.cached_response(request, partial(self.related_listings, pk))
+
+    def related_listings(self, pk):
+        if not Listing.objects.filter(pk=pk, is_active=True).exists():
+            raise Http404
+        queryset = Listing.objects.filter(recommended_by__listing_id=pk, is_active=True).order_by('recommended_by__rank')
+        return Response({'results': listing_fast_path.serialize(listing_fast_path.values(queryset))})
+
+
+def conversations_for(user):
+    """Conversations where the user is buyer or seller."""
+    return Conversation.objects.filter(Q(buyer=user) | Q(seller=user))
+
+class ConversationListView(generics.ListCreateAPIView):
+    """
+    GET: the user's inbox, most recently active first, in one query.
+    POST {"listing": id, "content": "..."}: a buyer opens (or reuses) a conversation.
+    """
+    serializer_class = ConversationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        user = self.request.user
+        latest = Message.objects.filter(conversation=OuterRef('pk')).order_by('-timestamp', '-id')
+        unread = (
+            Message.objects.filter(conversation=OuterRef('pk'), is_read=False)
+            .exclude(sender=user)
+            .values('conversation')
+            .annotate(n=Count('id'))
+            .values('n')
+        )
+        return (
+            conversations_for(user)
+            .select_related('buyer', 'seller')
+            .annotate(
+                # Archived listings keep their title in the archive
+                listing_title=Coalesce('listing__title', 'archived_listing__title'),
+                last_message=Subquery(latest.values('content')[:1]),
+                last_message_at=Subquery(latest.values('timestamp')[:1]),
+                last_message_sender=Subquery(latest.values('sender__username')[:1]),
+                unread_count=Coalesce(Subquery(unread, output_field=IntegerField()), 0),
+            )
+            .order_by(F('last_message_at').desc(nulls_last=True), '-id')
+        )
+
+    def create(self, request, *args, **kwargs):
+        try:
+            listing = get_object_or_404(Listing, pk=request.data.get('listing'), is_active=True)
+        except (ValueError, TypeError):
+            raise ValidationError({'listing': 'Expected a listing id.'})
+        if listing.seller_id == request.user.id:
+            raise ValidationError({'listing': 'You cannot message yourself about your own listing.'})
+
+        conversation, created = Conversation.objects.get_or_create(
+            listing=listing, buyer=request.user, defaults={'seller_id': listing.seller_id}
+        )
+        content = (request.data.get('content') or '').strip()
+        if content:
+            Message.objects.create(conversation=conversation, sender=request.user, content=content)
+
+        conversation = self.get_queryset().get(pk=conversation.pk)
+        return Response(
+            self.get_serializer(conversation).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+class MessageListView(generics.ListCreateAPIView):
+    """
+    GET: a thread's messages, newest first, cursor paged. Marks the page's incoming messages read.
+    POST {"content": "..."}: sends a message.
+    """
+    serializer_class = MessageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MessageCursorPagination
+
+    def get_conversation(self):
+        if not hasattr(self, '_conversation'):
+            self._conversation = get_object_or_404(conversations_for(self.request.user), pk=self.kwargs['pk'])
+        return self._conversation
+
+    def get_queryset(self):
+        return Message.objects.filter(conversation=self.get_conversation()).select_related('sender')
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        unread = [message['id'] for message in response.data['results'] if not message['is_read']]
+        if unread:
+            Message.objects.filter(pk__in=unread).exclude(sender=request.user).update(is_read=True)
+        return response
+
+    def perform_create(self, serializer):
+        serializer.save(conversation=self.get_conversation(), sender=self.request.user)
+
+
+class SavedSearchViewSet(mixins.ListModelMixin, mixins.CreateModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    The user's saved searches (see core/saved_searches.py).
+    POST {"query", "isbn", "course_code", "category", "max_price"}: any of them, at least one
+    criterion; a listing must meet all of them.
+    """
+    serializer_class = SavedSearchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_value_regex = r'\d+'
+
+    def get_queryset(self):
+        return self.request.user.saved_searches.order_by('-id')
+
+    def perform_create(self, serializer):
+        if self.get_queryset().count() >= settings.SAVED_SEARCHES_PER_USER:
+            raise ValidationError({'detail': f'You can save at most {settings.SAVED_SEARCHES_PER_USER} searches.'})
+        serializer.save(user=self.request.user)
+
+
+class SavedSearchMatchListView(generics.ListAPIView):
+    """New listings that matched the user's saved searches, newest first. Marks the page read."""
+    serializer_class = SavedSearchMatchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SavedSearchMatchCursorPagination
+
+    def get_queryset(self):
+        return SavedSearchMatch.objects.filter(user=self.request.user).select_related('listing__seller')
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        unread = [match['id'] for match in response.data['results'] if not match['is_read']]
+        if unread:
+            SavedSearchMatch.objects.filter(pk__in=unread).update(is_read=True)
+        return response
+
+
+class CanExportListings(permissions.BasePermission):
+    """Staff, or partner accounts granted core.export_listing."""
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(user and user.is_authenticated and (user.is_staff or user.has_perm('core.export_listing')))
+
+
+class ListingExportView(APIView):
+    """
+    Streams the active catalog as JSON lines or CSV (?file_format=jsonl|csv).
+    ?gzip=1 compresses it; ?updated_since=<ISO date/time> returns only rows
+    changed since then, inactive ones included. Pass the X-Export-Watermark
+    header of one pull as updated_since of the next. Each pull holds a worker
+    and a cursor over the table, so it is for staff and partners, throttled.
+    """
+    permission_classes = [CanExportListings]
+    throttle_scope = 'export'
+
+    def get(self, request):
+        file_format = request.query_params.get('file_format', 'jsonl')
+        if file_format not in EXPORT_FORMATS:
+            return Response({'error': f'file_format must be one of {", ".join(EXPORT_FORMATS)}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        updated_since = None
+        if request.query_params.get('updated_since'):
+            try:
+                updated_since = parse_since(request.query_params['updated_since'])
+            except ValueError:
+                return Response({'error': 'updated_since must be an ISO 8601 date or datetime.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+        compress = request.query_params.get('gzip') in ('1', 'true')
+
+        # Taken before the first row is read, so nothing changed mid-export is missed next time
+        watermark = timezone.now()
+        chunks = export_listings(file_format, gzip=compress, updated_since=updated_since,
+                                 chunk_size=settings.EXPORT_CHUNK_SIZE)
+        if isinstance(request._request, ASGIRequest):
+            chunks = aiterate(chunks)
+
+        filename = f'listings.{file_format}' + ('.gz' if compress else '')
+        response = StreamingHttpResponse(
+            chunks, content_type='application/gzip' if compress else CONTENT_TYPES[file_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['X-Export-Watermark'] = watermark.isoformat()
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
+def _cover_etag(request, name):
+    return name.rsplit('.', 1)[0]
+
+
+@require_safe
+@condition(etag_func=_cover_etag)
+def cover_image(request, name):
+    """
+    Serves a cached cover or thumbnail (see core/covers.py). File names are
+    content hashes, so a response never changes and may be cached for good.
+    """
+    opened = open_cover(name)
+    if opened is None:
+        raise Http404('Unknown cover.')
+    response = FileResponse(opened[0], content_type=opened[1])
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+# Real-time delivery (async views, served best by the ASGI app)
+
+async def _stream_user(request):
+    """Token from the Authorization header or ?token= (EventSource can't set headers)."""
+    header = request.headers.get('Authorization', '')
+    key = header[len('Token '):].strip() if header.startswith('Token ') else request.GET.get('token')
+    if key:
+        try:
+            user, _ = await sync_to_async(CachedTokenAuthentication().authenticate_credentials)(key)
+        except AuthenticationFailed:
+            return None
+        return user
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+async def _check_participant(request, pk):
+    """Returns an error response, or None if the user may read this conversation."""
+    user = await _stream_user(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    if not await conversations_for(user).filter(pk=pk).aexists():
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    return None
+
+def _since(request):
+    try:
+        return int(request.GET.get('since') or request.headers.get('Last-Event-ID') or 0)
+    except ValueError:
+        return 0
+
+async def _messages_since(pk, since, limit=100):
+    rows = Message.objects.filter(conversation_id=pk, id__gt=since).select_related('sender').order_by('id')[:limit]
+    return [dict(MessageSerializer(message).data) async for message in rows]
+
+async def _sse_events(pk, last_id):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.MESSAGE_STREAM_MAX_AGE
+    channel = conversation_channel(pk)
+    with get_broker().subscribe(channel, settings.MESSAGE_STREAM_QUEUE_SIZE) as subscription:
+        yield f'retry: {settings.MESSAGE_STREAM_RETRY_MS}\n\n'
+        # Subscribed before reading the backlog, so nothing falls in between
+        pending = await _messages_since(pk, last_id)
+        while True:
+            for message in pending:
+                if message['id'] > last_id:
+                    last_id = message['id']
+                    yield f'id: {last_id}\nevent: message\ndata: {json.dumps(message)}\n\n'
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return  # The client reconnects with Last-Event-ID
+            message = await subscription.get(min(settings.MESSAGE_STREAM_HEARTBEAT, remaining))
+            if message is None:
+                pending = []
+                yield ': keepalive\n\n'
+            elif subscription.dropped:
+                # Our queue overflowed; the database has everything we missed
+                subscription.dropped = 0
+                pending = await _messages_since(pk, last_id)
+            else:
+                pending = [message]
+
+@require_GET
+async def conversation_stream(request, pk):
+    """Server-Sent Events stream of new messages in a conversation."""
+    error = await _check_participant(request, pk)
+    if error:
+        return error
+    response = StreamingHttpResponse(_sse_events(pk, _since(request)), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@require_GET
+async def conversation_poll(request, pk):
+    """Long-poll fallback: waits until messages newer than ?since= exist, or times out."""
+    error = await _check_participant(request, pk)
+    if error:
+        return error
+    since = _since(request)
+    try:
+        timeout = min(float(request.GET.get('timeout', settings.MESSAGE_POLL_TIMEOUT)), settings.MESSAGE_POLL_TIMEOUT)
+    except ValueError:
+        timeout = settings.MESSAGE_POLL_TIMEOUT
+
+    with get_broker().subscribe(conversation_channel(pk), settings.MESSAGE_STREAM_QUEUE_SIZE) as subscription:
+        messages = await _messages_since(pk, since)
+        if not messages and timeout > 0:
+            await subscription.get(timeout)
+            messages = await _messages_since(pk, since)
+    return JsonResponse({'results': messages})
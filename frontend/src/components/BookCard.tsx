@@ -1,4 +1,4 @@
-import { Book, generateMailtoLink, conditionLabels, conditionColors, categoryLabels, categoryColors } from "@/lib/api";
+import { Book, apiAssetUrl, generateMailtoLink, conditionLabels, conditionColors, categoryLabels, categoryColors } from "@/lib/api";
 import { Button } from "@/components/ui/button";
 import { Mail } from "lucide-react";
 import { Link } from "react-router-dom";
@@ -15,7 +15,7 @@ function getImageUrl(url: string | undefined): string {
   if (url.startsWith("/media/")) {
     return `https://swaphub.me${url}`;
   }
-  return url;
+  return apiAssetUrl(url);
 }
 
 export function BookCard({ book }: BookCardProps) {
@@ -1,6 +1,11 @@
 
 const API_BASE_URL = "https://seashell-app-t7cwg.ondigitalocean.app";
 
+// Cached covers come back as absolute URLs; older rows may still hold a bare path (/api/covers/<hash>-M.jpg)
+export function apiAssetUrl(url: string): string {
+  return url.startsWith("/api/") ? `${API_BASE_URL}${url}` : url;
+}
+
 export interface Book {
   id: number;
   title: string;
@@ -16,6 +21,28 @@ export interface Book {
   created_at?: string;
 }
 
+export interface CursorPage<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
+export interface ListingFilters {
+  category?: string;
+  condition?: string;
+  min_price?: string;
+  max_price?: string;
+  course_code?: string;
+  sort?: "newest" | "price_asc" | "price_desc";
+}
+
+export interface SearchPage<T> {
+  count: number;
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
 export interface AuthResponse {
   key: string;
 }
@@ -49,6 +76,38 @@ export interface BookLookupResult {
   image_url: string;
 }
 
+// Active offers for one book (any ISBN form); prices are null when there are none
+export interface PriceStats {
+  isbn13: string;
+  count: number;
+  min_price: string | null;
+  median_price: string | null;
+  max_price: string | null;
+}
+
+// Criteria a new listing must all meet; at least one of query, isbn, course_code, category
+export interface SavedSearchData {
+  query?: string;
+  isbn?: string;
+  course_code?: string;
+  category?: string;
+  max_price?: string;
+}
+
+export interface SavedSearch extends Omit<SavedSearchData, "isbn"> {
+  id: number;
+  isbn13: string;
+  created_at: string;
+}
+
+export interface SavedSearchMatch {
+  id: number;
+  search: number;
+  listing: Book;
+  created_at: string;
+  is_read: boolean;
+}
+
 class ApiClient {
   private getAuthToken(): string | null {
     return localStorage.getItem("auth_token");
@@ -132,8 +191,23 @@ class ApiClient {
   }
 
   // Listing endpoints
-  async getListings(): Promise<Book[]> {
-    return this.request<Book[]>("/api/listings/");
+  // Pass the `next` URL of the previous page to keep scrolling the feed
+  // Filters and sort are applied by the API; `next` links already carry them
+  async getListings(pageUrl?: string | null, filters: ListingFilters = {}): Promise<CursorPage<Book>> {
+    if (pageUrl) {
+      return this.request<CursorPage<Book>>(pageUrl.replace(/^https?:\/\/[^/]+/, ""));
+    }
+    const params = new URLSearchParams();
+    Object.entries(filters).forEach(([key, value]) => {
+      if (value) params.set(key, value);
+    });
+    const query = params.toString();
+    return this.request<CursorPage<Book>>(`/api/listings/${query ? `?${query}` : ""}`);
+  }
+
+  // Ranked server-side search over title, author, ISBN and course code
+  async searchListings(query: string): Promise<SearchPage<Book>> {
+    return this.request<SearchPage<Book>>(`/api/listings/search/?q=${encodeURIComponent(query)}`);
   }
 
   // Gets a single listing by ID (alias for getBook to support both naming conventions)
@@ -146,6 +220,11 @@ class ApiClient {
     return this.request<Book>(`/api/listings/${id}/`);
   }
 
+  // Precomputed similar listings for a detail page (may be empty)
+  async getRelatedListings(id: number | string): Promise<{ results: Book[] }> {
+    return this.request<{ results: Book[] }>(`/api/listings/${id}/related/`);
+  }
+
   async createListing(data: CreateListingData): Promise<Book> {
     const token = this.getAuthToken();
     
@@ -180,6 +259,41 @@ class ApiClient {
   async lookupBook(isbn: string): Promise<BookLookupResult> {
     return this.request<BookLookupResult>(`/api/books/lookup/?isbn=${encodeURIComponent(isbn)}`);
   }
+
+  // What other sellers are asking for the same book
+  async getPriceStats(isbn: string): Promise<PriceStats> {
+    return this.request<PriceStats>(`/api/books/${encodeURIComponent(isbn)}/prices/`);
+  }
+
+  // Saved searches: new listings matching one show up in getSavedSearchMatches
+  async getSavedSearches(): Promise<SavedSearch[]> {
+    return this.request<SavedSearch[]>("/api/saved-searches/");
+  }
+
+  async createSavedSearch(data: SavedSearchData): Promise<SavedSearch> {
+    return this.request<SavedSearch>("/api/saved-searches/", {
+      method: "POST",
+      body: JSON.stringify(data),
+    });
+  }
+
+  async deleteSavedSearch(id: number): Promise<void> {
+    const token = this.getAuthToken();
+    const response = await fetch(`${API_BASE_URL}/api/saved-searches/${id}/`, {
+      method: "DELETE",
+      headers: token ? { Authorization: `Token ${token}` } : {},
+    });
+    if (!response.ok) {
+      throw new Error(`Failed to delete saved search: ${response.status}`);
+    }
+  }
+
+  // Newest first; fetching a page marks its matches read
+  async getSavedSearchMatches(pageUrl?: string | null): Promise<CursorPage<SavedSearchMatch>> {
+    return this.request<CursorPage<SavedSearchMatch>>(
+      pageUrl ? pageUrl.replace(/^https?:\/\/[^/]+/, "") : "/api/saved-searches/matches/"
+    );
+  }
 }
 
 export const api = new ApiClient();
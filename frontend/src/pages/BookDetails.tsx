@@ -1,7 +1,8 @@
 import { useParams, Link } from "react-router-dom";
 import { useQuery } from "@tanstack/react-query";
-import { api, generateMailtoLink, conditionLabels, conditionColors, categoryLabels, categoryColors } from "@/lib/api";
+import { api, apiAssetUrl, generateMailtoLink, conditionLabels, conditionColors, categoryLabels, categoryColors } from "@/lib/api";
 import { Navbar } from "@/components/Navbar";
+import { BookCard } from "@/components/BookCard";
 import { Button } from "@/components/ui/button";
 import { ArrowLeft, Mail, Loader2, AlertCircle } from "lucide-react";
 
@@ -20,6 +21,12 @@ const BookDetails = () => {
     enabled: !!id,
   });
 
+  const { data: related } = useQuery({
+    queryKey: ["related", id],
+    queryFn: () => api.getRelatedListings(id!),
+    enabled: !!id,
+  });
+
   if (isLoading) {
     return (
       <div className="min-h-screen flex items-center justify-center">
@@ -57,7 +64,7 @@ const BookDetails = () => {
           <div className="relative aspect-[3/4] rounded-lg overflow-hidden glass-card shadow-xl">
              {book.cover_image_url ? (
                 <img 
-                  src={book.cover_image_url} 
+                  src={apiAssetUrl(book.cover_image_url)} 
                   alt={book.title}
                   className="w-full h-full object-cover"
                 />
@@ -121,6 +128,17 @@ const BookDetails = () => {
             </div>
           </div>
         </div>
+
+        {related && related.results.length > 0 && (
+          <section className="mt-16">
+            <h2 className="text-2xl font-bold mb-6">Related Books</h2>
+            <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-6">
+              {related.results.map((item) => (
+                <BookCard key={item.id} book={item} />
+              ))}
+            </div>
+          </section>
+        )}
       </div>
     </div>
   );
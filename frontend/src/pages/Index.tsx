@@ -1,32 +1,50 @@
 import { useState, useMemo } from "react";
-import { useQuery } from "@tanstack/react-query";
+import { useInfiniteQuery, useQuery } from "@tanstack/react-query";
 import { api, Book } from "@/lib/api";
 import { Navbar } from "@/components/Navbar";
 import { Hero } from "@/components/Hero";
 import { SearchFilter } from "@/components/SearchFilter";
 import { BookCard } from "@/components/BookCard";
+import { Button } from "@/components/ui/button";
 import { Loader2 } from "lucide-react";
 
 const Index = () => {
   const [searchQuery, setSearchQuery] = useState("");
   const [selectedCategory, setSelectedCategory] = useState("");
 
-  const { data: books = [], isLoading, error } = useQuery({
-    queryKey: ["listings"],
-    queryFn: () => api.getListings(),
+  const {
+    data,
+    isLoading,
+    error,
+    fetchNextPage,
+    hasNextPage,
+    isFetchingNextPage,
+  } = useInfiniteQuery({
+    queryKey: ["listings", selectedCategory],
+    queryFn: ({ pageParam }) => api.getListings(pageParam, { category: selectedCategory }),
+    initialPageParam: null as string | null,
+    getNextPageParam: (lastPage) => lastPage.next,
   });
 
+  // Searching is done by the API; the feed is only used when the box is empty
+  const trimmedQuery = searchQuery.trim();
+  const search = useQuery({
+    queryKey: ["search", trimmedQuery],
+    queryFn: () => api.searchListings(trimmedQuery),
+    enabled: trimmedQuery.length > 0,
+  });
+
+  const books = useMemo(() => {
+    if (trimmedQuery) return search.data?.results ?? [];
+    return data?.pages.flatMap((page) => page.results) ?? [];
+  }, [data, search.data, trimmedQuery]);
+
+  // The feed is already filtered by the API; search results still need it
   const filteredBooks = useMemo(() => {
     return books.filter((book: Book) => {
-      const matchesSearch =
-        !searchQuery ||
-        book.title.toLowerCase().includes(searchQuery.toLowerCase()) ||
-        book.author.toLowerCase().includes(searchQuery.toLowerCase());
-      const matchesCategory =
-        !selectedCategory || book.category === selectedCategory;
-      return matchesSearch && matchesCategory;
+      return !selectedCategory || book.category === selectedCategory;
     });
-  }, [books, searchQuery, selectedCategory]);
+  }, [books, selectedCategory]);
 
   return (
     <div className="min-h-screen">
@@ -45,17 +63,17 @@ const Index = () => {
             selectedCategory={selectedCategory}
             onCategoryChange={setSelectedCategory}
           />
-          {isLoading && (
+          {(isLoading || search.isLoading) && (
             <div className="flex justify-center py-20">
               <Loader2 className="w-8 h-8 animate-spin text-primary" />
             </div>
           )}
-          {error && (
+          {(error || search.error) && (
             <div className="glass-card p-8 text-center">
               <p className="text-destructive">Failed to load books. Please try again later.</p>
             </div>
           )}
-          {!isLoading && !error && (
+          {!isLoading && !search.isLoading && !error && !search.error && (
             filteredBooks.length > 0 ? (
               <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-6">
                 {filteredBooks.map((book: Book) => (
@@ -70,6 +88,17 @@ const Index = () => {
               </div>
             )
           )}
+          {!trimmedQuery && hasNextPage && (
+            <div className="flex justify-center">
+              <Button
+                variant="outline"
+                onClick={() => fetchNextPage()}
+                disabled={isFetchingNextPage}
+              >
+                {isFetchingNextPage ? <Loader2 className="w-4 h-4 animate-spin" /> : "Load more"}
+              </Button>
+            </div>
+          )}
         </div>
       </section>
     </div>
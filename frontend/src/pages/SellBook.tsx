@@ -3,7 +3,7 @@ import { useForm } from "react-hook-form";
 import { zodResolver } from "@hookform/resolvers/zod";
 import { z } from "zod";
 import { useNavigate, Navigate } from "react-router-dom";
-import { useMutation, useQueryClient } from "@tanstack/react-query";
+import { useMutation, useQuery, useQueryClient } from "@tanstack/react-query";
 import { api, CreateListingData, BookLookupResult } from "@/lib/api";
 import { useAuth } from "@/contexts/AuthContext";
 import { Navbar } from "@/components/Navbar";
@@ -88,6 +88,14 @@ const SellBook = () => {
   const [isSearching, setIsSearching] = useState(false);
   const [foundBook, setFoundBook] = useState<BookLookupResult | null>(null);
 
+  // Other sellers' prices for the same book, to suggest one
+  const { data: priceStats } = useQuery({
+    queryKey: ["price-stats", foundBook?.isbn],
+    queryFn: () => api.getPriceStats(foundBook!.isbn),
+    enabled: !!foundBook?.isbn,
+    retry: false,
+  });
+
   const form = useForm<ListingForm>({
     resolver: zodResolver(listingSchema),
     defaultValues: {
@@ -252,11 +260,16 @@ const SellBook = () => {
                           <FormLabel>Price ($)</FormLabel>
                           <FormControl>
                             <Input
-                              placeholder="45.00"
+                              placeholder={priceStats?.median_price ?? "45.00"}
                               className="glass-input"
                               {...field}
                             />
                           </FormControl>
+                          {priceStats && priceStats.count > 0 && (
+                            <p className="text-xs text-muted-foreground">
+                              {priceStats.count} listed, ${priceStats.min_price}–${priceStats.max_price} (median ${priceStats.median_price})
+                            </p>
+                          )}
                           <FormMessage />
                         </FormItem>
                       )}